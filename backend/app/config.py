@@ -11,6 +11,16 @@ class Settings(BaseSettings):
     embedding_model: str = Field("sentence-transformers/all-MiniLM-L6-v2", alias="EMBEDDING_MODEL")
     embedding_dim: int = Field(embedding_dim, alias="EMBEDDING_DIM")
     redis_url: str = Field("redis://rag_redis:6379/0", alias="REDIS_URL")
+    workspace_root: str = Field("/workspace", alias="WORKSPACE_ROOT")
+    # "local" loads the SentenceTransformer in-process; "server" sends texts to
+    # the host's shared embedding server (app.services.embedding_server) over
+    # EMBEDDING_SOCKET; "stub" returns deterministic hash-based vectors
+    # (offline benchmarks, no model cost).
+    embedding_backend: str = Field("local", alias="EMBEDDING_BACKEND")
+    embedding_socket: str = Field("/run/embedding/embedding.sock", alias="EMBEDDING_SOCKET")
+    # Longest wait for the embedding server to connect or answer one request.
+    embedding_timeout_seconds: float = Field(120.0, alias="EMBEDDING_TIMEOUT_SECONDS")
+    mock_llm_base_url: str = Field("http://localhost:8100/v1", alias="MOCK_LLM_BASE_URL")
 
     class Config:
         env_file = ".env"
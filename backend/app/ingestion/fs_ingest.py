@@ -1,6 +1,16 @@
 from ..services.ingestion_service import ingest_directory_from_workspace
 
 
-def ingest_directory(relative_path: str, repo_name: str | None = None, last_commit: str | None = None):
+def ingest_directory(
+    relative_path: str,
+    repo_name: str | None = None,
+    last_commit: str | None = None,
+    job_id: str | None = None,
+    between_batches=None,
+    reindex: bool = False,
+):
     """Wrapper around the ingestion service for use in background workers."""
-    return ingest_directory_from_workspace(relative_path, repo_name=repo_name, last_commit=last_commit)
+    return ingest_directory_from_workspace(
+        relative_path, repo_name=repo_name, last_commit=last_commit, job_id=job_id,
+        between_batches=between_batches, reindex=reindex,
+    )
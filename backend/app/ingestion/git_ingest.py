@@ -1,6 +1,53 @@
 import os
 import subprocess
-from typing import Optional
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Presets for `clone.strategy` in ingestion_config.yaml; explicit keys
+# (depth, filter, sparse, sparse_paths) override the preset.
+CLONE_STRATEGIES: Dict[str, Dict] = {
+    "full": {},
+    "shallow": {"depth": 1},
+    "partial": {"filter": "blob:none"},
+    "sparse": {"filter": "blob:none", "sparse": True},
+}
+
+
+@dataclass
+class CloneOptions:
+    depth: Optional[int] = None          # history depth (--depth); None = full history
+    filter: Optional[str] = None         # partial clone filter, e.g. blob:none
+    sparse: bool = False                 # check out only files matching the patterns
+    sparse_patterns: List[str] = field(default_factory=list)
+
+
+def sparse_patterns(extensions: Iterable[str], paths: Iterable[str] = ()) -> List[str]:
+    """
+    Non-cone sparse-checkout patterns for files with the given extensions,
+    optionally only under the given directory globs (e.g. "docs", "src/*").
+    """
+    exts = sorted({ext if ext.startswith(".") else f".{ext}" for ext in extensions})
+    dirs = [p.strip("/") for p in paths if p.strip("/")]
+    if not dirs:
+        return [f"*{ext}" for ext in exts]
+    return [f"/{d}/**/*{ext}" for d in dirs for ext in exts]
+
+
+def clone_options(repo_cfg: Dict, allowed_extensions: Iterable[str]) -> CloneOptions:
+    """Resolve a repo's `clone:` block (strategy preset + overrides)."""
+    cfg = dict(repo_cfg or {})
+    strategy = cfg.pop("strategy", "full")
+    if strategy not in CLONE_STRATEGIES:
+        raise ValueError(f"Unknown clone strategy: {strategy}")
+    merged = {**CLONE_STRATEGIES[strategy], **cfg}
+    sparse = bool(merged.get("sparse", False))
+    return CloneOptions(
+        depth=int(merged["depth"]) if merged.get("depth") else None,
+        filter=merged.get("filter") or None,
+        sparse=sparse,
+        sparse_patterns=sparse_patterns(allowed_extensions, merged.get("sparse_paths", [])) if sparse else [],
+    )
 
 
 def safe_repo_name_from_url(repo_url: str) -> str:
@@ -10,37 +57,126 @@ def safe_repo_name_from_url(repo_url: str) -> str:
     return base.replace(" ", "-").lower()
 
 
-def get_last_commit_hash(repo_path: str) -> Optional[str]:
+# Never prompt for credentials or host keys: there is no terminal, so git
+# would wait forever.
+_GIT_ENV = {
+    "GIT_TERMINAL_PROMPT": "0",
+    "GIT_SSH_COMMAND": os.environ.get("GIT_SSH_COMMAND", "ssh") + " -o BatchMode=yes",
+}
+
+
+def _git(*args: str, cwd: Optional[str] = None, stdin: Optional[str] = None, timeout: Optional[float] = None) -> str:
     try:
         result = subprocess.run(
-            ["git", "-C", repo_path, "rev-parse", "HEAD"],
+            ["git", *args],
+            cwd=cwd,
+            input=stdin,
             capture_output=True,
             text=True,
-            check=True,
+            env={**os.environ, **_GIT_ENV},
+            timeout=timeout,
         )
-        return result.stdout.strip()
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"git {' '.join(args)} timed out after {timeout:.0f}s")
+    if result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+def get_last_commit_hash(repo_path: str) -> Optional[str]:
+    try:
+        return _git("-C", repo_path, "rev-parse", "HEAD").strip()
     except Exception as e:
         print(f"[GIT] Could not get last commit for {repo_path}: {e}")
         return None
 
 
-def clone_or_update_repo(repo_url: str, repo_path: str, branch: str = "main") -> str:
-    """Clone the repo if missing, otherwise pull latest changes. Returns last commit hash."""
-    os.makedirs(os.path.dirname(repo_path), exist_ok=True)
+def remote_head(repo_url: str, branch: str = "main", timeout: Optional[float] = None) -> Optional[str]:
+    """Commit the remote branch points at, from a ref lookup only (no fetch)."""
+    out = _git("ls-remote", repo_url, f"refs/heads/{branch}", timeout=timeout)
+    line = out.strip().splitlines()
+    return line[0].split()[0] if line else None
+
+
+def repo_object_bytes(repo_path: str) -> int:
+    """On-disk size of the repo's object store (loose + packed)."""
+    try:
+        out = _git("-C", repo_path, "count-objects", "-v")
+    except Exception:
+        return 0
+    stats = dict(line.split(": ", 1) for line in out.splitlines() if ": " in line)
+    return (int(stats.get("size", 0)) + int(stats.get("size-pack", 0))) * 1024
+
+
+def _fetch_args(options: CloneOptions) -> List[str]:
+    args = []
+    if options.depth:
+        args.append(f"--depth={options.depth}")
+    if options.filter:
+        args.append(f"--filter={options.filter}")
+    return args
+
+
+def _apply_sparse(repo_path: str, options: CloneOptions) -> None:
+    if options.sparse:
+        _git("-C", repo_path, "sparse-checkout", "set", "--no-cone", "--stdin",
+             stdin="\n".join(options.sparse_patterns) + "\n")
+    elif os.path.exists(os.path.join(repo_path, ".git", "info", "sparse-checkout")):
+        _git("-C", repo_path, "sparse-checkout", "disable")
+
+
+def sync_repo(
+    repo_url: str,
+    repo_path: str,
+    branch: str = "main",
+    options: Optional[CloneOptions] = None,
+) -> Tuple[str, Dict]:
+    """
+    Clone the repo if missing, otherwise fetch the branch and hard-reset to it.
+
+    Partial clones and sparse checkouts only download the blobs of files that
+    are checked out. Local bare repositories work when given as file:// URLs
+    (plain paths use git's local-clone shortcut, which ignores depth and
+    filter) with `uploadpack.allowFilter` enabled for partial clones.
+
+    Returns (commit, report) where report has the action, seconds and the
+    growth of the object store in bytes.
+    """
+    options = options or CloneOptions()
+    before = repo_object_bytes(repo_path) if os.path.exists(repo_path) else 0
+    start = time.time()
 
     if not os.path.exists(repo_path):
-        print(f"[GIT] Cloning {repo_url} into {repo_path} ...")
-        subprocess.run(
-            ["git", "clone", "--branch", branch, "--single-branch", repo_url, repo_path],
-            check=False,
-        )
+        os.makedirs(os.path.dirname(repo_path) or ".", exist_ok=True)
+        print(f"[GIT] Cloning {repo_url} into {repo_path} ({options}) ...")
+        _git("clone", "--no-checkout", "--single-branch", "--branch", branch,
+             *_fetch_args(options), repo_url, repo_path)
+        _apply_sparse(repo_path, options)
+        _git("-C", repo_path, "checkout", branch)
+        action = "clone"
     else:
-        print(f"[GIT] Pulling latest changes in {repo_path} ...")
-        subprocess.run(
-            ["git", "-C", repo_path, "pull", "origin", branch],
-            check=False,
-        )
+        print(f"[GIT] Fetching {branch} in {repo_path} ...")
+        _apply_sparse(repo_path, options)
+        _git("-C", repo_path, "fetch", *_fetch_args(options), "origin", branch)
+        _git("-C", repo_path, "reset", "--hard", "FETCH_HEAD")
+        action = "fetch"
 
     commit = get_last_commit_hash(repo_path)
-    print(f"[GIT] Repo {repo_path} at commit {commit}")
-    return commit or ""
+    report = {
+        "action": action,
+        "seconds": round(time.time() - start, 2),
+        "bytes_fetched": max(repo_object_bytes(repo_path) - before, 0),
+    }
+    print(f"[GIT] Repo {repo_path} at commit {commit}: {report}")
+    return commit or "", report
+
+
+def clone_or_update_repo(
+    repo_url: str,
+    repo_path: str,
+    branch: str = "main",
+    options: Optional[CloneOptions] = None,
+) -> str:
+    """Clone the repo if missing, otherwise fetch latest changes. Returns last commit hash."""
+    commit, _ = sync_repo(repo_url, repo_path, branch=branch, options=options)
+    return commit
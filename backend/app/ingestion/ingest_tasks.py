@@ -1,47 +1,115 @@
 import dramatiq
 from dramatiq.brokers.redis import RedisBroker
-from .git_ingest import clone_or_update_repo, safe_repo_name_from_url
+from dramatiq.middleware import CurrentMessage
+from .git_ingest import clone_options, safe_repo_name_from_url, sync_repo
 from .fs_ingest import ingest_directory
+from .queues import BULK, INTERACTIVE, MAINTENANCE, QueueTracking, actor_options, queue_slot, yield_to_interactive
 from ..config import settings, load_ingestion_config
+from ..database import SessionLocal
+from ..services.metrics_service import INGEST_STAGE_SECONDS, mark_process_dead, record
+from ..services.repo_sync_service import check_repos, mark_sync_finished, mark_sync_started
+
+
+class ProcessMetrics(dramatiq.Middleware):
+    """Clean up each worker process's multiprocess metric files as it stops."""
+
+    def after_worker_shutdown(self, broker, worker):
+        mark_process_dead()
+
 
 # Configure Redis broker
 broker = RedisBroker(url=settings.redis_url)
+broker.add_middleware(CurrentMessage())
+broker.add_middleware(QueueTracking())
+broker.add_middleware(ProcessMetrics())
 dramatiq.set_broker(broker)
 
 
-@dramatiq.actor
-def run_fs_ingestion(path: str, repo_name: str | None = None, last_commit: str | None = None):
-    print(f"[TASK] FS ingestion queued for: {path}")
-    ingest_directory(path, repo_name=repo_name, last_commit=last_commit)
+def _current_job_id() -> str | None:
+    # Retries redeliver the same message, so its id doubles as the
+    # ingestion checkpoint key.
+    message = CurrentMessage.get_current_message()
+    return message.message_id if message is not None else None
+
+
+def _clone_options(repo_url: str):
+    # A repo's own `clone:` block wins over the ingestion-wide default.
+    ing = load_ingestion_config().get("ingestion", {})
+    repo_cfg = next((r for r in ing.get("repos", []) if r.get("url") == repo_url), {})
+    clone_cfg = repo_cfg.get("clone") or ing.get("clone") or {}
+    return clone_options(clone_cfg, ing.get("allowed_extensions", [".py", ".md", ".txt"]))
+
+
+@dramatiq.actor(**actor_options(INTERACTIVE))
+def run_fs_ingestion(
+    path: str, repo_name: str | None = None, last_commit: str | None = None, reindex: bool = False,
+):
+    """Uploads and small paths (see queues.is_small_path)."""
+    with queue_slot(INTERACTIVE):
+        print(f"[TASK] FS ingestion queued for: {path}")
+        ingest_directory(
+            path, repo_name=repo_name, last_commit=last_commit, job_id=_current_job_id(), reindex=reindex,
+        )
 
 
-@dramatiq.actor
-def run_git_ingestion(repo_url: str, relative_path: str | None = None, branch: str = "main"):
+@dramatiq.actor(**actor_options(BULK))
+def run_bulk_fs_ingestion(
+    path: str, repo_name: str | None = None, last_commit: str | None = None, reindex: bool = False,
+):
+    with queue_slot(BULK):
+        print(f"[TASK] Bulk FS ingestion queued for: {path}")
+        ingest_directory(
+            path, repo_name=repo_name, last_commit=last_commit, job_id=_current_job_id(),
+            between_batches=yield_to_interactive, reindex=reindex,
+        )
+
+
+@dramatiq.actor(**actor_options(BULK))
+def run_git_ingestion(
+    repo_url: str, relative_path: str | None = None, branch: str = "main", reindex: bool = False,
+):
+    with queue_slot(BULK):
+        _git_ingestion(repo_url, relative_path, branch, reindex)
+
+
+def _git_ingestion(repo_url: str, relative_path: str | None, branch: str, reindex: bool) -> None:
     repo_name = safe_repo_name_from_url(repo_url)
     rel_path = relative_path or f"repos/{repo_name}"
-    repo_fs_path = f"/workspace/{rel_path}"
+    repo_fs_path = f"{settings.workspace_root}/{rel_path}"
 
     print(f"[TASK] Git ingestion: url={repo_url}, path={repo_fs_path}, branch={branch}")
-    last_commit = clone_or_update_repo(repo_url, repo_fs_path, branch=branch)
+    with SessionLocal() as db:
+        mark_sync_started(db, repo_url, branch)
+    try:
+        last_commit, report = sync_repo(repo_url, repo_fs_path, branch=branch, options=_clone_options(repo_url))
+        record(INGEST_STAGE_SECONDS, report["seconds"], "git_" + report["action"])
 
-    # Strip leading slash for ingestion service (expects relative to /workspace)
-    ingest_directory(rel_path, repo_name=repo_name, last_commit=last_commit)
+        # Strip leading slash for ingestion service (expects relative to /workspace)
+        ingest_directory(
+            rel_path, repo_name=repo_name, last_commit=last_commit, job_id=_current_job_id(),
+            between_batches=yield_to_interactive, reindex=reindex,
+        )
+    except Exception as e:
+        with SessionLocal() as db:
+            mark_sync_finished(db, repo_url, branch, None, error=str(e))
+        raise
+    with SessionLocal() as db:
+        mark_sync_finished(db, repo_url, branch, last_commit)
 
 
-@dramatiq.actor
+@dramatiq.actor(**actor_options(INTERACTIVE))
 def auto_ingest_all_repos():
-    cfg = load_ingestion_config()
-    repos = cfg.get("ingestion", {}).get("repos", [])
-    for repo in repos:
-        if not repo.get("auto_update", False):
-            continue
-        url = repo["url"]
-        path = repo.get("path", "")
-        branch = repo.get("branch", "main")
-        # path is absolute (/workspace/...), we want relative
-        if path.startswith("/workspace/"):
-            rel = path[len("/workspace/"):]
-        else:
-            rel = path
-        print(f"[TASK] Auto-ingest repo {url} -> {rel}")
-        run_git_ingestion.send(url, rel, branch)
+    """Check every auto_update repo now, ignoring intervals; unchanged repos are skipped."""
+    with SessionLocal() as db:
+        counts = check_repos(db, run_git_ingestion.send, force=True)
+    print(f"[TASK] Auto-ingest check: {counts}")
+
+
+@dramatiq.actor(**actor_options(MAINTENANCE, max_retries=3, time_limit=7 * 24 * 3600 * 1000))
+def run_reembedding_job(target_model: str):
+    # Imported here so workers that never re-embed do not load the migration code.
+    from ..services.reembedding_service import run_reembedding
+
+    with queue_slot(MAINTENANCE):
+        print(f"[TASK] Re-embedding with {target_model}")
+        run_reembedding(target_model)
@@ -0,0 +1,196 @@
+"""
+Ingestion queues, most urgent first:
+
+    interactive  uploads, small /ingest/fs paths, sync checks
+    bulk         git ingests (including scheduled syncs), large paths
+    maintenance  re-embedding
+
+Each queue is consumed separately, and `priority` orders the messages a
+worker has prefetched. `concurrency` caps the jobs a queue runs at once
+across all workers. It is enforced by a Redis-backed ConcurrentRateLimiter,
+and a job that finds its queue full is retried after a short backoff.
+`QueueTracking` keeps each queue's queued and running messages in Redis,
+and `queue_slot` observes the wait from enqueue to start (slot waits
+included). Bulk jobs call
+`yield_to_interactive` between commit batches, so a waiting upload gets the
+embedding model and database first.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, List
+
+import dramatiq
+import redis
+from dramatiq.common import q_name
+from dramatiq.middleware import CurrentMessage
+from dramatiq.rate_limits import ConcurrentRateLimiter, RateLimitExceeded
+from dramatiq.rate_limits.backends import RedisBackend
+
+from ..config import load_ingestion_config, settings
+from ..services.ingestion_service import collect_files
+from ..services.metrics_service import INGEST_QUEUE_WAIT_SECONDS, INGEST_STAGE_SECONDS, record
+
+INTERACTIVE, BULK, MAINTENANCE = "interactive", "bulk", "maintenance"
+
+_DEFAULTS = {
+    INTERACTIVE: {"priority": 0, "concurrency": 4, "slot_ttl_seconds": 3600, "max_backoff_seconds": 5},
+    BULK: {"priority": 10, "concurrency": 1, "slot_ttl_seconds": 7200, "max_backoff_seconds": 60},
+    MAINTENANCE: {"priority": 20, "concurrency": 1, "slot_ttl_seconds": 7 * 24 * 3600, "max_backoff_seconds": 300},
+}
+
+_cfg = (load_ingestion_config().get("ingestion", {}) or {}).get("queues", {}) or {}
+QUEUES: Dict[str, Dict] = {name: {**defaults, **(_cfg.get(name) or {})} for name, defaults in _DEFAULTS.items()}
+# /ingest/fs paths with at most this many ingestible files go to "interactive".
+SMALL_PATH_MAX_FILES = int(_cfg.get("small_path_max_files", 200))
+# A bulk job waits at most this long per batch for interactive work to clear.
+MAX_YIELD_SECONDS = float(_cfg.get("max_yield_seconds", 300))
+YIELD_POLL_SECONDS = float(_cfg.get("yield_poll_seconds", 1.0))
+# Ordinary failures keep Dramatiq's default retry budget; waits for a
+# concurrency slot do not use it up.
+MAX_RETRIES = 20
+
+_KEY_PREFIX = "ingest:queue:"
+# The message whose failure Retries is about to judge. Dramatiq runs
+# after_process_message hooks in reverse order, so QueueTracking (added
+# after the default middleware) sets this before Retries calls retry_when.
+_failed_message: ContextVar = ContextVar("ingest_failed_message", default=None)
+
+
+@lru_cache(maxsize=1)
+def _client() -> redis.Redis:
+    return redis.Redis.from_url(settings.redis_url, socket_timeout=5, socket_connect_timeout=1)
+
+
+def _key(queue: str) -> str:
+    return f"{_KEY_PREFIX}{queue}"
+
+
+def actor_options(queue: str, max_retries: int = MAX_RETRIES, **options) -> Dict:
+    """Options for an actor on `queue` (pass to @dramatiq.actor)."""
+    cfg = QUEUES[queue]
+
+    def retry_when(retries: int, exception: Exception) -> bool:
+        if isinstance(exception, RateLimitExceeded):
+            return True
+        # `retries` counts every re-enqueue, slot waits included.
+        message = _failed_message.get()
+        slot_waits = message.options.get("slot_waits", 0) if message is not None else 0
+        return retries - slot_waits < max_retries
+
+    return {
+        **options,
+        "queue_name": queue,
+        "priority": int(cfg["priority"]),
+        "retry_when": retry_when,
+        "min_backoff": 1000,
+        "max_backoff": int(float(cfg["max_backoff_seconds"]) * 1000),
+    }
+
+
+@lru_cache(maxsize=None)
+def _limiter(queue: str) -> ConcurrentRateLimiter:
+    cfg = QUEUES[queue]
+    return ConcurrentRateLimiter(
+        RedisBackend(url=settings.redis_url),
+        f"ingest-queue-{queue}",
+        limit=int(cfg["concurrency"]),
+        # A slot is released when the job ends, or after this long if its worker died
+        # (tracked messages older than this are dropped for the same reason).
+        ttl=int(float(cfg["slot_ttl_seconds"]) * 1000),
+    )
+
+
+@contextmanager
+def queue_slot(queue: str):
+    """Hold one of the queue's concurrency slots; raises RateLimitExceeded (retried) if none is free."""
+    with _limiter(queue).acquire():
+        message = CurrentMessage.get_current_message()
+        if message is not None and "enqueued_at" in message.options:
+            # Popped so that a retry after a real failure starts a new wait.
+            enqueued_at = message.options.pop("enqueued_at")
+            INGEST_QUEUE_WAIT_SECONDS.labels(queue=queue).observe(max(time.time() - enqueued_at, 0.0))
+        yield
+
+
+class QueueTracking(dramatiq.Middleware):
+    """Tracks queued and running messages per queue and counts their waits for a slot."""
+
+    def before_enqueue(self, broker, message, delay):
+        # A delayed message starts waiting once its delay is over; re-enqueues
+        # while waiting for a slot keep the first time.
+        message.options.setdefault("enqueued_at", time.time() + (delay or 0) / 1000.0)
+
+    def after_enqueue(self, broker, message, delay):
+        self._update(lambda r: r.zadd(
+            _key(q_name(message.queue_name)), {message.message_id: message.options["enqueued_at"]}
+        ))
+
+    def after_process_message(self, broker, message, *, result=None, exception=None):
+        _failed_message.set(message if exception is not None else None)
+        if isinstance(exception, RateLimitExceeded):
+            message.options["slot_waits"] = message.options.get("slot_waits", 0) + 1
+        # A failed message is re-enqueued (and tracked again) by Retries afterwards.
+        self._update(lambda r: r.zrem(_key(q_name(message.queue_name)), message.message_id))
+
+    def after_skip_message(self, broker, message):
+        self._update(lambda r: r.zrem(_key(q_name(message.queue_name)), message.message_id))
+
+    @staticmethod
+    def _update(fn) -> None:
+        # Tracking only steers yields and monitoring; it must never fail a job.
+        try:
+            fn(_client())
+        except redis.RedisError as e:
+            print(f"[QUEUE] Redis error: {e}")
+
+
+def in_flight(queue: str) -> int:
+    """Messages queued or running on `queue`."""
+    key = _key(queue)
+    pipe = _client().pipeline()
+    pipe.zremrangebyscore(key, "-inf", time.time() - float(QUEUES[queue]["slot_ttl_seconds"]))
+    pipe.zcard(key)
+    return int(pipe.execute()[1])
+
+
+def yield_to_interactive() -> None:
+    """Pause (between commit batches of a bulk job) while interactive work is queued or running."""
+    start = time.monotonic()
+    try:
+        while in_flight(INTERACTIVE) and time.monotonic() - start < MAX_YIELD_SECONDS:
+            time.sleep(YIELD_POLL_SECONDS)
+    except redis.RedisError as e:
+        print(f"[QUEUE] Redis error, not yielding: {e}")
+    paused = time.monotonic() - start
+    if paused >= YIELD_POLL_SECONDS:
+        record(INGEST_STAGE_SECONDS, paused, "yield")
+        print(f"[QUEUE] Bulk job yielded {paused:.1f}s to interactive work")
+
+
+def is_small_path(relative_path: str) -> bool:
+    """Whether a workspace directory has at most SMALL_PATH_MAX_FILES ingestible files."""
+    abs_root = os.path.join(settings.workspace_root, relative_path.lstrip("/"))
+    if not os.path.isdir(abs_root):
+        return True  # fails fast in the worker
+    return sum(1 for _ in islice(collect_files(abs_root), SMALL_PATH_MAX_FILES + 1)) <= SMALL_PATH_MAX_FILES
+
+
+def queue_status() -> List[Dict]:
+    """Per queue: settings, messages queued or running, and the oldest one's wait."""
+    now = time.time()
+    status = []
+    for queue, cfg in QUEUES.items():
+        count = in_flight(queue)
+        oldest = _client().zrange(_key(queue), 0, 0, withscores=True)
+        status.append({
+            "queue": queue,
+            "priority": cfg["priority"],
+            "concurrency": cfg["concurrency"],
+            "in_flight": count,
+            "oldest_seconds": round(max(now - oldest[0][1], 0.0), 1) if oldest else None,
+        })
+    return status
@@ -0,0 +1,33 @@
+"""
+Repo sync scheduler: `python -m app.ingestion.scheduler`.
+
+Every poll it checks the due auto_update repos with a ref lookup and queues
+git ingestion only for those whose remote head moved. Running more than one
+scheduler is harmless; ticks are serialized by a Postgres advisory lock.
+"""
+import time
+
+from ..database import SessionLocal
+from ..services.metrics_service import mark_process_dead
+from ..services.repo_sync_service import POLL_SECONDS, check_repos
+from .ingest_tasks import run_git_ingestion
+
+
+def run_scheduler(poll_seconds: int = POLL_SECONDS) -> None:
+    print(f"[SYNC] Scheduler started (poll every {poll_seconds}s)")
+    try:
+        while True:
+            try:
+                with SessionLocal() as db:
+                    counts = check_repos(db, run_git_ingestion.send)
+                if counts["synced"] or counts["failed"]:
+                    print(f"[SYNC] Tick: {counts}")
+            except Exception as e:
+                print(f"[SYNC] Tick failed: {e}")
+            time.sleep(poll_seconds)
+    finally:
+        mark_process_dead()
+
+
+if __name__ == "__main__":
+    run_scheduler()
@@ -1,21 +1,39 @@
 import time
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File as FastAPIFile
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File as FastAPIFile, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 import shutil
 from pathlib import Path
 
-from .database import Base, engine, get_db
+from .config import settings
+from .database import engine, get_db
+from .migrations import run_migrations
 from .schemas import (
-    IngestFSRequest, IngestGitRequest, SearchRequest,
+    IngestFSRequest, IngestGitRequest, ReembedRequest, SearchRequest,
     SearchResponse, RagSearchResponse,
+    BatchSearchRequest, BatchSearchResponse, BatchSearchItem,
     RawSearchRequest, RawSearchResponse,
+    SymbolLookupResponse, SymbolResult,
     FilesResponse, FileInfo
 )
-from .services.search_service import semantic_search, rag_search
+from .services.search_service import semantic_search, batch_semantic_search, rag_search
 from .services.llm_service import generate_raw_answer
-from .ingestion.ingest_tasks import run_fs_ingestion, run_git_ingestion, auto_ingest_all_repos
+from .services import metrics_service
+from .services.partition_service import drop_repo, list_repo_partitions
+from .services.ingestion_service import get_ingest_job
+from .services.chunk_text_service import chunk_context, chunk_text_storage
+from .services.reembedding_service import reembedding_progress
+from .services.coalescing_service import coalesce, coalesce_key
+from .services.duplicate_service import duplicate_stats
+from .services.repo_sync_service import forget_repo_sync, repo_sync_status
+from .services.symbol_service import LOOKUP_MODES, lookup_paths, lookup_symbols
+from .services.vector_store import get_vector_store
+from .ingestion.ingest_tasks import (
+    run_fs_ingestion, run_bulk_fs_ingestion, run_git_ingestion, auto_ingest_all_repos, run_reembedding_job
+)
+from .ingestion.queues import is_small_path, queue_status
+from .utils.deadline import start_deadline
 
 app = FastAPI(
     title="Engineering Docs RAG Backend",
@@ -29,34 +47,70 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+
+@app.middleware("http")
+async def stage_metrics(request: Request, call_next):
+    """
+    Label stage metrics with the endpoint and, when the client sends
+    `X-Profile: 1`, return the request's stage breakdown as Server-Timing.
+    """
+    endpoint_token = metrics_service.set_endpoint(request.url.path)
+    profile_token = None
+    samples = None
+    if request.headers.get(metrics_service.PROFILE_HEADER) == "1":
+        profile_token, samples = metrics_service.start_profile()
+    try:
+        start = time.perf_counter()
+        response = await call_next(request)
+        if samples is not None:
+            samples.append(("total", (time.perf_counter() - start) * 1000.0))
+            response.headers["Server-Timing"] = metrics_service.format_server_timing(samples)
+        return response
+    finally:
+        if profile_token is not None:
+            metrics_service.stop_profile(profile_token)
+        metrics_service.reset_endpoint(endpoint_token)
+
 # Upload directory
-UPLOAD_DIR = Path("/workspace/uploads")
+UPLOAD_DIR = Path(settings.workspace_root) / "uploads"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 
 @app.on_event("startup")
 def on_startup() -> None:
-    Base.metadata.create_all(bind=engine)
-    auto_ingest_all_repos.send()
+    run_migrations(engine)
+    # auto_update repos are kept in sync by the scheduler (app.ingestion.scheduler).
+
+
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    metrics_service.mark_process_dead()
 
 
 # ===== Ingestion Endpoints =====
 
 @app.post("/ingest/fs")
 def ingest_fs(req: IngestFSRequest):
-    """Queue filesystem ingestion."""
+    """Queue filesystem ingestion (small paths on the interactive queue, large ones on bulk)."""
     rel_path = req.path.lstrip("/")
-    run_fs_ingestion.send(rel_path)
-    return {"queued": True, "path": rel_path}
+    actor = run_fs_ingestion if is_small_path(rel_path) else run_bulk_fs_ingestion
+    message = actor.send(rel_path, reindex=req.reindex)
+    return {"queued": True, "path": rel_path, "queue": message.queue_name, "job_id": message.message_id}
 
 
 @app.post("/ingest/git")
 def ingest_git(req: IngestGitRequest):
     """Queue Git repository ingestion."""
-    run_git_ingestion.send(req.repo_url, None, req.branch or "main")
-    return {"queued": True, "repo_url": req.repo_url, "branch": req.branch or "main"}
+    message = run_git_ingestion.send(req.repo_url, None, req.branch or "main", reindex=req.reindex)
+    return {
+        "queued": True,
+        "repo_url": req.repo_url,
+        "branch": req.branch or "main",
+        "job_id": message.message_id,
+    }
 
 
 @app.post("/ingest/upload")
@@ -75,8 +129,91 @@ async def ingest_upload(file: UploadFile = FastAPIFile(...)):
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
-    run_fs_ingestion.send("uploads")
-    return {"uploaded": True, "filename": file.filename}
+    message = run_fs_ingestion.send("uploads")
+    return {"uploaded": True, "filename": file.filename, "job_id": message.message_id}
+
+
+@app.get("/ingest/jobs/{job_id}")
+def ingest_job_status(job_id: str, db: Session = Depends(get_db)):
+    """Progress of a queued ingestion (totals so far are already searchable)."""
+    job = get_ingest_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingestion job (not started yet?)")
+    return job
+
+
+@app.get("/ingest/queues")
+def ingest_queues():
+    """Per-queue priority, concurrency and messages queued or running (waits: ingest_queue_wait_seconds)."""
+    return {"queues": queue_status()}
+
+
+@app.delete("/repos/{repo_name}")
+def delete_repo(repo_name: str, db: Session = Depends(get_db)):
+    """Remove a repository from the index (a partition drop when partitioned)."""
+    forget_repo_sync(db, repo_name)
+    dropped = drop_repo(db, repo_name)
+    # External vectors go only after the Postgres drop has committed.
+    get_vector_store().delete_by_repo(db, repo_name)
+    return {"repo_name": repo_name, **dropped}
+
+
+@app.get("/repos/partitions")
+def get_repo_partitions(db: Session = Depends(get_db)):
+    """Per-repo partitions with row estimates and sizes."""
+    return {"partitions": list_repo_partitions(db)}
+
+
+@app.get("/repos/sync")
+def get_repo_sync(db: Session = Depends(get_db)):
+    """Scheduled sync state per repo, with checked / skipped (unchanged) / synced counts."""
+    repos = repo_sync_status(db)
+    totals = {key: sum(r[key] for r in repos) for key in ("checks", "skipped", "syncs")}
+    return {"repos": repos, "totals": totals}
+
+
+@app.post("/repos/sync")
+def trigger_repo_sync():
+    """Check all auto_update repos now; only changed ones are re-ingested."""
+    message = auto_ingest_all_repos.send()
+    return {"queued": True, "message_id": message.message_id}
+
+
+@app.get("/chunks/{chunk_id}/context")
+def get_chunk_context(chunk_id: int, before: int = 0, after: int = 0, db: Session = Depends(get_db)):
+    """A chunk widened by surrounding file text (offset-stored chunks only)."""
+    context = chunk_context(db, chunk_id, before=before, after=after)
+    if context is None:
+        raise HTTPException(status_code=404, detail="Chunk not found")
+    return context
+
+
+@app.get("/storage/chunk-text")
+def get_chunk_text_storage(db: Session = Depends(get_db)):
+    """Bytes used by inline chunk text vs. per-file text (offsets mode)."""
+    return chunk_text_storage(db)
+
+
+@app.post("/embeddings/reembed")
+def start_reembedding(req: ReembedRequest, db: Session = Depends(get_db)):
+    """Queue an online switch of the embedding model (search stays on the old one until cutover)."""
+    progress = reembedding_progress(db)
+    if progress["target_model"] and progress["target_model"] != req.model:
+        raise HTTPException(status_code=409, detail=f"Re-embedding to {progress['target_model']} in progress")
+    message = run_reembedding_job.send(req.model)
+    return {"queued": True, "model": req.model, "job_id": message.message_id}
+
+
+@app.get("/embeddings/reembed")
+def get_reembedding_progress(db: Session = Depends(get_db)):
+    """Active model, re-embedding target and backfill progress."""
+    return reembedding_progress(db)
+
+
+@app.get("/vector-store/stats")
+def vector_store_stats(db: Session = Depends(get_db)):
+    """Backend, row counts and index details of the configured vector store."""
+    return get_vector_store().stats(db)
 
 
 # ===== Search Endpoints =====
@@ -87,13 +224,50 @@ def search(req: SearchRequest, db: Session = Depends(get_db)):
     if not req.query.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
     
-    results, metrics = semantic_search(
+    deadline = start_deadline(req.deadline_ms)
+
+    def compute() -> SearchResponse:
+        results, metrics = semantic_search(
+            db,
+            query=req.query,
+            top_k=req.top_k,
+            min_similarity=req.min_similarity,
+            repo_name=req.repo_name,
+            top_files=req.top_files,
+            deadline=deadline,
+        )
+        return SearchResponse(
+            results=results,
+            retrieval_metrics=metrics,
+            degradations=deadline.degradations if deadline is not None else [],
+        )
+
+    key = coalesce_key("search", **req.model_dump(exclude={"provider"}))
+    wait = deadline.remaining_seconds() if deadline is not None else None
+    return coalesce("/search", key, compute, SearchResponse, wait_seconds=wait)
+
+
+@app.post("/search/batch", response_model=BatchSearchResponse)
+def search_batch(req: BatchSearchRequest, db: Session = Depends(get_db)):
+    """Semantic search for many queries in one embedding pass and one SQL query."""
+    if any(not q.strip() for q in req.queries):
+        raise HTTPException(status_code=400, detail="Queries cannot be empty")
+    
+    result_sets, batch_metrics = batch_semantic_search(
         db,
-        query=req.query,
+        queries=req.queries,
         top_k=req.top_k,
-        min_similarity=req.min_similarity
+        min_similarity=req.min_similarity,
+        repo_name=req.repo_name,
+        top_files=req.top_files,
+    )
+    return BatchSearchResponse(
+        results=[
+            BatchSearchItem(query=query, results=results, retrieval_metrics=metrics)
+            for query, (results, metrics) in zip(req.queries, result_sets)
+        ],
+        batch_metrics=batch_metrics,
     )
-    return SearchResponse(results=results, retrieval_metrics=metrics)
 
 
 @app.post("/search/rag", response_model=RagSearchResponse)
@@ -102,13 +276,23 @@ def search_rag(req: SearchRequest, db: Session = Depends(get_db)):
     if not req.query.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
     
-    return rag_search(
-        db,
-        query=req.query,
-        top_k=req.top_k,
-        min_similarity=req.min_similarity,
-        provider=req.provider
-    )
+    deadline = start_deadline(req.deadline_ms)
+
+    def compute() -> RagSearchResponse:
+        return rag_search(
+            db,
+            query=req.query,
+            top_k=req.top_k,
+            min_similarity=req.min_similarity,
+            provider=req.provider,
+            repo_name=req.repo_name,
+            top_files=req.top_files,
+            deadline=deadline,
+        )
+
+    key = coalesce_key("rag", **req.model_dump())
+    wait = deadline.remaining_seconds() if deadline is not None else None
+    return coalesce("/search/rag", key, compute, RagSearchResponse, wait_seconds=wait)
 
 
 @app.post("/search/raw", response_model=RawSearchResponse)
@@ -128,6 +312,30 @@ def search_raw(req: RawSearchRequest):
 
 # ===== Files Endpoint =====
 
+@app.get("/symbols", response_model=SymbolLookupResponse)
+def get_symbols(
+    q: str,
+    mode: str = "exact",
+    kind: str | None = None,
+    repo_name: str | None = None,
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    """Definitions named `q` (exact, prefix or fuzzy) and files whose path ends in `q`."""
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    if mode not in LOOKUP_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(LOOKUP_MODES)}")
+    symbols = lookup_symbols(db, q, mode=mode, kind=kind, repo_name=repo_name, limit=limit)
+    files = lookup_paths(db, q, repo_name=repo_name, limit=limit)
+    return SymbolLookupResponse(
+        query=q,
+        mode=mode,
+        symbols=[SymbolResult(**row) for row in symbols],
+        files=[row["path"] for row in files],
+    )
+
+
 @app.get("/files", response_model=FilesResponse)
 def get_files(db: Session = Depends(get_db)):
     """List all indexed files."""
@@ -153,6 +361,19 @@ def get_files(db: Session = Depends(get_db)):
     return FilesResponse(files=files, total=len(files))
 
 
+@app.get("/files/duplicates")
+def get_file_duplicates(db: Session = Depends(get_db)):
+    """Near-duplicate groups found at ingestion and the chunks they hold."""
+    return duplicate_stats(db)
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint."""
+    payload, content_type = metrics_service.render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+
 @app.get("/health")
 def health():
     return {"status": "healthy", "version": "0.3.0"}
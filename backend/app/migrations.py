@@ -0,0 +1,383 @@
+"""
+Schema management.
+
+`run_migrations` runs at API startup: it creates missing tables, adds
+columns introduced after a table was first created, and creates the vector
+index when that is cheap. Heavier one-off steps are commands:
+
+    python -m app.migrations upgrade        # what startup does
+    python -m app.migrations vector-index   # build the vector index on a populated chunks table
+    python -m app.migrations partition      # convert files/chunks to per-repo partitions
+                                            # (set storage.partition_by_repo: true first)
+    python -m app.migrations file-embeddings  # fill files.embedding from chunk embeddings
+    python -m app.migrations reembed <model> # re-embed into a shadow column, then cut over
+    python -m app.migrations reembed-cleanup  # drop the previous model's vectors after a cutover
+    python -m app.migrations chunk-offsets  # move inline chunk text to files.content + offsets
+                                            # (set storage.chunk_text: offsets first)
+    python -m app.migrations symbols        # extract symbols for files ingested before the symbol index
+    python -m app.migrations near-duplicates  # MinHash-sign and LSH-index files ingested before it
+    python -m app.migrations snapshot-export <dir> [--since <generation>]
+                                            # write files/chunks/symbols + embeddings to a snapshot
+    python -m app.migrations snapshot-import <dir>
+                                            # bulk-load a snapshot, then build the vector indexes
+"""
+import sys
+import time
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from .config import load_ingestion_config
+from .database import Base, engine as default_engine
+from .models import CHUNK_TEXT_OFFSETS, EMBED_DIM, PARTITION_BY_REPO, STORAGE_CFG
+from .services.chunk_text_service import convert_to_offsets
+from .services.partition_service import partition_ddl
+from .services.symbol_service import backfill_symbols
+
+VECTOR_INDEX_NAME = "chunks_embedding_idx"
+FILE_VECTOR_INDEX_NAME = "files_embedding_idx"
+
+# (table, column, type) added after the table's first release. Added without
+# defaults so the ALTER is a catalog-only change on large tables.
+ADDED_COLUMNS: List[Tuple[str, str, str]] = [
+    ("chunks", "repo_name", "VARCHAR"),
+    ("files", "content", "TEXT"),
+    ("files", "embedding", f"vector({EMBED_DIM})"),
+    ("chunks", "start_offset", "INTEGER"),
+    ("chunks", "end_offset", "INTEGER"),
+    ("files", "generation", "BIGINT"),
+    ("files", "minhash", "BYTEA"),
+    ("files", "duplicate_of", "INTEGER"),
+    ("chunks", "embedding_generation", "INTEGER"),
+]
+
+# (table, column, default) set after the column was added; SET DEFAULT only
+# applies to new rows, so it is catalog-only as well.
+COLUMN_DEFAULTS: List[Tuple[str, str, str]] = [
+    ("files", "generation", "nextval('files_generation_seq')"),
+]
+
+# (table, column) whose NOT NULL was relaxed after the first release.
+NULLABLE_COLUMNS: List[Tuple[str, str]] = [
+    ("chunks", "embedding"),
+    ("chunks", "content"),
+]
+
+# (table, column, method) for large TOASTed text; lz4 decompresses faster
+# than the default pglz and supports partial (substr) decompression.
+COLUMN_COMPRESSION: List[Tuple[str, str, str]] = [
+    ("files", "content", "lz4"),
+]
+
+ADDED_INDEXES: List[Tuple[str, str]] = [
+    ("ix_chunks_repo_name", "chunks (repo_name)"),
+    ("ix_chunks_file_id", "chunks (file_id)"),
+    ("ix_files_generation", "files (generation)"),
+    # Symbol/path lookups: btree for exact and prefix, trigrams for fuzzy and suffix.
+    ("ix_symbols_name_lower", "symbols (lower(name) text_pattern_ops)"),
+    ("ix_symbols_name_trgm", "symbols USING gin (lower(name) gin_trgm_ops)"),
+    ("ix_files_path_trgm", "files USING gin (path gin_trgm_ops)"),
+    ("ix_files_duplicate_of", "files (duplicate_of)"),
+]
+
+
+def _derived_repo_name(path: str) -> str:
+    """SQL for the repo name of a file ingested before files.repo_name was always set."""
+    return f"CASE WHEN {path} LIKE 'repos/%' THEN split_part({path}, '/', 2) ELSE split_part({path}, '/', 1) END"
+
+
+def _is_partitioned(conn: Connection, table: str) -> bool:
+    return bool(conn.execute(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": table},
+    ).scalar())
+
+
+def _columns(conn: Connection, table: str) -> List[str]:
+    return list(conn.execute(text("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = :table
+        ORDER BY ordinal_position
+    """), {"table": table}).scalars())
+
+
+def _vector_index_sql(
+    concurrently: bool,
+    table: str = "chunks",
+    name: str = VECTOR_INDEX_NAME,
+    column: str = "embedding",
+) -> str:
+    cfg = STORAGE_CFG.get("vector_index", {}) or {}
+    kind = cfg.get("type", "hnsw")
+    if table != "chunks":
+        # Other vector columns are small enough to always use HNSW, which
+        # needs no training data.
+        kind = "hnsw"
+    if kind == "hnsw":
+        params = f"m = {int(cfg.get('m', 16))}, ef_construction = {int(cfg.get('ef_construction', 64))}"
+    elif kind == "ivfflat":
+        params = f"lists = {int(cfg.get('lists', 100))}"
+    else:
+        raise ValueError(f"Unknown vector index type: {kind}")
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+        f"ON {table} USING {kind} ({column} vector_l2_ops) WITH ({params})"
+    )
+
+
+def ensure_vector_index(engine: Engine, build_if_populated: bool = False) -> None:
+    """
+    Create the ANN index on chunks.embedding (L2 ops, matching `<->`).
+
+    On a partitioned table the index is defined on the parent and Postgres
+    builds one per repo partition. Building on an already-populated table
+    can take a long time, so startup skips it unless `build_if_populated`.
+    """
+    kind = (STORAGE_CFG.get("vector_index", {}) or {}).get("type", "hnsw")
+    if kind == "none":
+        return
+
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": VECTOR_INDEX_NAME}).scalar():
+            return
+        populated = conn.execute(text("SELECT EXISTS (SELECT 1 FROM chunks)")).scalar()
+        partitioned = _is_partitioned(conn, "chunks")
+
+    # IVFFlat trains its lists on existing rows, so it is only built on data.
+    if (populated and not build_if_populated) or (kind == "ivfflat" and not populated):
+        print(
+            f"[MIGRATE] Vector index {VECTOR_INDEX_NAME} missing; "
+            f"run `python -m app.migrations vector-index` to build it"
+        )
+        return
+
+    print(f"[MIGRATE] Building vector index {VECTOR_INDEX_NAME} ({kind}) ...")
+    start = time.time()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SET maintenance_work_mem = '1GB'"))
+        # CONCURRENTLY is not supported on partitioned parents.
+        conn.execute(text(_vector_index_sql(concurrently=not partitioned)))
+    print(f"[MIGRATE] Vector index built in {time.time() - start:.1f}s")
+
+
+def ensure_file_vector_index(engine: Engine) -> None:
+    """HNSW index on files.embedding; one vector per file, so cheap to build at startup."""
+    if (STORAGE_CFG.get("vector_index", {}) or {}).get("type", "hnsw") == "none":
+        return
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": FILE_VECTOR_INDEX_NAME}).scalar():
+            return
+        partitioned = _is_partitioned(conn, "files")
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(_vector_index_sql(
+            concurrently=not partitioned, table="files", name=FILE_VECTOR_INDEX_NAME
+        )))
+
+
+def backfill_repo_names(conn: Connection) -> Tuple[int, int]:
+    """
+    Fill files.repo_name (derived from the path) and chunks.repo_name (from
+    their file) where NULL, so rows from before chunks.repo_name match
+    repo-filtered searches. Cheap when there is nothing to fill:
+    ix_chunks_repo_name covers `repo_name IS NULL`.
+    """
+    files = conn.execute(text(f"""
+        UPDATE files f
+        SET repo_name = {_derived_repo_name('f.path')}
+        WHERE f.repo_name IS NULL
+          -- A re-ingest since the upgrade may already have the named row.
+          AND NOT EXISTS (
+              SELECT 1 FROM files o
+              WHERE o.path = f.path AND o.repo_name = {_derived_repo_name('f.path')}
+          )
+    """)).rowcount
+    chunks = conn.execute(text("""
+        UPDATE chunks c
+        SET repo_name = f.repo_name
+        FROM files f
+        WHERE c.repo_name IS NULL AND f.id = c.file_id AND f.repo_name IS NOT NULL
+    """)).rowcount
+    return files, chunks
+
+
+def backfill_file_embeddings(conn: Connection) -> int:
+    """Set files.embedding to the normalized mean of its chunk embeddings where missing."""
+    return conn.execute(text("""
+        UPDATE files f
+        SET embedding = l2_normalize(s.mean)
+        FROM (
+            SELECT file_id, avg(embedding) AS mean
+            FROM chunks
+            WHERE embedding IS NOT NULL
+            GROUP BY file_id
+        ) s
+        WHERE f.id = s.file_id AND f.embedding IS NULL
+    """)).rowcount
+
+
+def run_migrations(engine: Engine = default_engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        files_exists = conn.execute(text("SELECT to_regclass('files') IS NOT NULL")).scalar()
+        if PARTITION_BY_REPO and files_exists and not _is_partitioned(conn, "files"):
+            raise RuntimeError(
+                "storage.partition_by_repo is enabled but files/chunks are not partitioned; "
+                "run `python -m app.migrations partition`"
+            )
+
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        for table, column, col_type in ADDED_COLUMNS:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {col_type}"))
+        for table, column, default in COLUMN_DEFAULTS:
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT {default}"))
+        for table, column in NULLABLE_COLUMNS:
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} DROP NOT NULL"))
+        for table, column, method in COLUMN_COMPRESSION:
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET COMPRESSION {method}"))
+        for name, target in ADDED_INDEXES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {target}"))
+        # Partition keys are never NULL.
+        if not _is_partitioned(conn, "files"):
+            files, chunks = backfill_repo_names(conn)
+            if files or chunks:
+                print(f"[MIGRATE] repo_name backfilled on {files} files, {chunks} chunks")
+
+    ensure_vector_index(engine)
+    ensure_file_vector_index(engine)
+
+
+def migrate_to_partitioned(engine: Engine = default_engine, keep_old: bool = False) -> None:
+    """
+    Convert existing unpartitioned files/chunks into per-repo partitions.
+
+    Old tables are renamed to *_unpartitioned, rows are copied repo by repo
+    into the new partitions (files without a repo_name get one derived from
+    their path), and the vector index is built once after the copy.
+    """
+    if not PARTITION_BY_REPO:
+        raise RuntimeError("Set storage.partition_by_repo: true in ingestion_config.yaml first")
+
+    run_start = time.time()
+    with engine.begin() as conn:
+        if _is_partitioned(conn, "files"):
+            print("[MIGRATE] files/chunks are already partitioned")
+            return
+
+        conn.execute(text("LOCK TABLE files, chunks IN ACCESS EXCLUSIVE MODE"))
+        for table in ("chunks", "files"):
+            indexes = conn.execute(
+                text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :t"),
+                {"t": table},
+            ).scalars().all()
+            conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned"))
+            for index in indexes:
+                conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index}_unpartitioned"'))
+            conn.execute(text(f"ALTER SEQUENCE IF EXISTS {table}_id_seq RENAME TO {table}_id_seq_unpartitioned"))
+
+        conn.execute(text(f"UPDATE files_unpartitioned SET repo_name = {_derived_repo_name('path')} WHERE repo_name IS NULL"))
+
+        Base.metadata.create_all(bind=conn)
+
+        repos = conn.execute(text("SELECT DISTINCT repo_name FROM files_unpartitioned")).scalars().all()
+        for repo in repos:
+            for statement in partition_ddl(repo):
+                conn.execute(text(statement))
+
+        old_file_cols = set(_columns(conn, "files_unpartitioned"))
+        file_cols = [c for c in _columns(conn, "files") if c in old_file_cols]
+        col_list = ", ".join(file_cols)
+        conn.execute(text(f"INSERT INTO files ({col_list}) SELECT {col_list} FROM files_unpartitioned"))
+
+        old_chunk_cols = set(_columns(conn, "chunks_unpartitioned"))
+        chunk_cols = [c for c in _columns(conn, "chunks") if c in old_chunk_cols or c == "repo_name"]
+        select_list = ", ".join("f.repo_name" if c == "repo_name" else f"c.{c}" for c in chunk_cols)
+        conn.execute(text(f"""
+            INSERT INTO chunks ({', '.join(chunk_cols)})
+            SELECT {select_list}
+            FROM chunks_unpartitioned c
+            JOIN files_unpartitioned f ON f.id = c.file_id
+        """))
+
+        for table in ("files", "chunks"):
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+            ))
+
+        if not keep_old:
+            conn.execute(text("DROP TABLE chunks_unpartitioned, files_unpartitioned CASCADE"))
+
+    print(f"[MIGRATE] Partitioned {len(repos)} repos in {time.time() - run_start:.1f}s")
+    ensure_vector_index(engine, build_if_populated=True)
+    ensure_file_vector_index(engine)
+
+
+def migrate_to_chunk_offsets(engine: Engine = default_engine) -> None:
+    """Convert inline chunk text to offsets and print the text bytes saved."""
+    if not CHUNK_TEXT_OFFSETS:
+        raise RuntimeError("Set storage.chunk_text: offsets in ingestion_config.yaml first")
+    overlap = int((load_ingestion_config().get("ingestion", {}).get("chunk", {}) or {}).get("overlap", 200))
+    with Session(engine) as db:
+        report = convert_to_offsets(db, overlap)
+    print(f"[MIGRATE] {report}")
+    print("[MIGRATE] Run VACUUM FULL chunks (or pg_repack) to return the freed space to the OS")
+
+
+def main(argv: List[str]) -> None:
+    command = argv[1] if len(argv) > 1 else "upgrade"
+    if command == "upgrade":
+        run_migrations()
+    elif command == "vector-index":
+        ensure_vector_index(default_engine, build_if_populated=True)
+    elif command == "partition":
+        migrate_to_partitioned(keep_old="--keep-old" in argv)
+    elif command == "file-embeddings":
+        start = time.time()
+        with default_engine.begin() as conn:
+            updated = backfill_file_embeddings(conn)
+        print(f"[MIGRATE] File embeddings set for {updated} files in {time.time() - start:.1f}s")
+        ensure_file_vector_index(default_engine)
+    elif command == "chunk-offsets":
+        migrate_to_chunk_offsets()
+    elif command == "symbols":
+        chunk_cfg = load_ingestion_config().get("ingestion", {}).get("chunk", {}) or {}
+        with Session(default_engine) as db:
+            report = backfill_symbols(
+                db, int(chunk_cfg.get("max_chars", 1200)), int(chunk_cfg.get("overlap", 200))
+            )
+        print(f"[MIGRATE] {report}")
+    elif command == "near-duplicates":
+        from .services.duplicate_service import backfill_signatures
+
+        with Session(default_engine) as db:
+            report = backfill_signatures(db)
+        print(f"[MIGRATE] {report}")
+    elif command == "snapshot-export" and len(argv) > 2:
+        from .services.snapshot_service import export_snapshot
+
+        since = int(argv[argv.index("--since") + 1]) if "--since" in argv else None
+        export_snapshot(argv[2], since=since)
+    elif command == "snapshot-import" and len(argv) > 2:
+        from .services.snapshot_service import import_snapshot
+
+        import_snapshot(argv[2])
+    elif command == "reembed" and len(argv) > 2:
+        from .services.reembedding_service import run_reembedding
+
+        run_reembedding(argv[2])
+    elif command == "reembed-cleanup":
+        from .services.reembedding_service import drop_previous_embeddings
+
+        drop_previous_embeddings()
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -1,34 +1,196 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, ForeignKey, ForeignKeyConstraint, UniqueConstraint, DateTime, Text, JSON,
+    Float, LargeBinary, Sequence, SmallInteger,
+)
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from pgvector.sqlalchemy import Vector
 from .database import Base
-from .config import settings
+from .config import settings, load_ingestion_config
 
 EMBED_DIM = settings.embedding_dim
 
+STORAGE_CFG = load_ingestion_config().get("storage", {}) or {}
+
+# When enabled, `files` and `chunks` are LIST-partitioned by repo_name (one
+# partition per repo, each with its own vector index). Postgres requires the
+# partition key in every primary/unique key, so repo_name joins the keys.
+PARTITION_BY_REPO = bool(STORAGE_CFG.get("partition_by_repo", False))
+
+# "offsets": each file's text is stored once (files.content, lz4-compressed by
+# TOAST) and chunks keep only (start_offset, end_offset) into it, instead of
+# repeating the overlapping text in every chunk row ("inline").
+CHUNK_TEXT_OFFSETS = STORAGE_CFG.get("chunk_text", "inline") == "offsets"
+
+
+class EmbeddingVector(Vector):
+    """
+    Vector(EMBED_DIM) in DDL, but values are not checked against EMBED_DIM:
+    an online model switch can change the live dimension (embedding_state.dim).
+    """
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        return Vector().bind_processor(dialect)
+
+
+# Index change counter: every file write takes the next value, so an
+# incremental snapshot is "files with generation > N".
+FILES_GENERATION_SEQ = Sequence("files_generation_seq", metadata=Base.metadata)
+
+
+def _partitioned(*constraints):
+    if not PARTITION_BY_REPO:
+        return ()
+    return (*constraints, {"postgresql_partition_by": "LIST (repo_name)"})
+
 
 class File(Base):
     __tablename__ = "files"
 
-    id = Column(Integer, primary_key=True, index=True)
-    path = Column(String, unique=True, index=True, nullable=False)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    path = Column(String, unique=not PARTITION_BY_REPO, index=True, nullable=False)
     hash = Column(String, nullable=False)
-    repo_name = Column(String, nullable=True)
+    repo_name = Column(String, primary_key=PARTITION_BY_REPO, nullable=not PARTITION_BY_REPO)
     last_commit = Column(String, nullable=True)
+    # Full decoded text in offsets mode; deferred so path lookups never detoast it.
+    content = deferred(Column(Text, nullable=True))
+    # Normalized mean of the file's chunk embeddings, for coarse-to-fine search.
+    embedding = deferred(Column(EmbeddingVector(EMBED_DIM), nullable=True))
+    generation = Column(BigInteger, server_default=FILES_GENERATION_SEQ.next_value(), nullable=True, index=True)
+    # MinHash signature (uint32s) of the file's shingles, for near-duplicate detection.
+    minhash = deferred(Column(LargeBinary, nullable=True))
+    # First-ingested file of this file's near-duplicate group; NULL for canonical files.
+    duplicate_of = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     chunks = relationship("Chunk", back_populates="file", cascade="all, delete-orphan")
 
+    __table_args__ = _partitioned(UniqueConstraint("path", "repo_name", name="uq_files_path_repo"))
+
 
 class Chunk(Base):
     __tablename__ = "chunks"
 
-    id = Column(Integer, primary_key=True, index=True)
-    file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    if PARTITION_BY_REPO:
+        file_id = Column(Integer, nullable=False)
+    else:
+        file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
+    # Denormalized from files so repo-scoped queries can filter (and prune
+    # partitions) without touching the files table.
+    repo_name = Column(String, primary_key=PARTITION_BY_REPO, nullable=not PARTITION_BY_REPO, index=True)
     chunk_index = Column(Integer, nullable=False)
-    content = Column(Text, nullable=False)
-    embedding = Column(Vector(EMBED_DIM), nullable=False)
+    # Either the chunk text (inline) or character offsets into files.content.
+    content = Column(Text, nullable=True)
+    start_offset = Column(Integer, nullable=True)
+    end_offset = Column(Integer, nullable=True)
+    # NULL when embeddings live in an external vector store (Milvus).
+    embedding = Column(EmbeddingVector(EMBED_DIM), nullable=True)
+    # embedding_state.generation of the model behind `embedding`; NULL for
+    # vectors written before generations were recorded.
+    embedding_generation = Column(Integer, nullable=True)
 
     file = relationship("File", back_populates="chunks")
+
+    __table_args__ = _partitioned(
+        ForeignKeyConstraint(
+            ["file_id", "repo_name"],
+            ["files.id", "files.repo_name"],
+            ondelete="CASCADE",
+            onupdate="CASCADE",
+        )
+    )
+
+
+class Symbol(Base):
+    """A definition (function, class, heading, ...) and the chunk it starts in."""
+    __tablename__ = "symbols"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(255), nullable=False)
+    kind = Column(String, nullable=False)
+    if PARTITION_BY_REPO:
+        # files is partitioned; symbols are removed with their repo in drop_repo.
+        file_id = Column(Integer, nullable=False, index=True)
+    else:
+        file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), nullable=False, index=True)
+    repo_name = Column(String, nullable=True, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    line = Column(Integer, nullable=False)
+
+
+class MinHashBand(Base):
+    """LSH index: one row per band of a file's MinHash signature."""
+    __tablename__ = "minhash_bands"
+
+    band = Column(SmallInteger, primary_key=True)
+    bucket = Column(BigInteger, primary_key=True)
+    if PARTITION_BY_REPO:
+        # Removed with their repo in drop_repo, like symbols.
+        file_id = Column(Integer, primary_key=True, index=True)
+    else:
+        file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), primary_key=True, index=True)
+    repo_name = Column(String, nullable=True, index=True)
+
+
+class IngestJob(Base):
+    """One ingestion run, keyed by the Dramatiq message id so retries resume it."""
+    __tablename__ = "ingest_jobs"
+
+    job_id = Column(String, primary_key=True)
+    relative_path = Column(String, nullable=False)
+    repo_name = Column(String, nullable=True)
+    status = Column(String, nullable=False, default="running")  # running | completed
+    stats = Column(JSON, nullable=False, default=dict)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class IngestCheckpoint(Base):
+    """A path finished by a job; committed in the same transaction as its chunks."""
+    __tablename__ = "ingest_checkpoints"
+
+    job_id = Column(String, ForeignKey("ingest_jobs.job_id", ondelete="CASCADE"), primary_key=True)
+    path = Column(String, primary_key=True)
+
+
+class RepoSync(Base):
+    """Scheduled sync state of a configured git repo (ingestion.repos)."""
+    __tablename__ = "repo_sync"
+
+    repo_name = Column(String, primary_key=True)
+    url = Column(String, nullable=False)
+    branch = Column(String, nullable=False, default="main")
+    last_commit = Column(String, nullable=True)  # commit of the last completed ingest
+    status = Column(String, nullable=False, default="idle")  # idle | syncing | failed
+    error = Column(Text, nullable=True)
+    checks = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)  # remote head == last_commit
+    syncs = Column(Integer, nullable=False, default=0)
+    next_check_at = Column(DateTime(timezone=True), nullable=True)
+    last_checked_at = Column(DateTime(timezone=True), nullable=True)
+    sync_started_at = Column(DateTime(timezone=True), nullable=True)
+    last_synced_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class EmbeddingState(Base):
+    """
+    Single row (id=1): the model chunks.embedding was produced with and any
+    re-embedding in progress, whose vectors go to the embedding_next shadow
+    columns until cutover.
+    """
+    __tablename__ = "embedding_state"
+
+    id = Column(Integer, primary_key=True, default=1)
+    model = Column(String, nullable=False)
+    dim = Column(Integer, nullable=False)
+    generation = Column(Integer, nullable=False, default=1)
+    target_model = Column(String, nullable=True)
+    target_dim = Column(Integer, nullable=True)
+    status = Column(String, nullable=False, default="idle")  # idle | backfilling | indexing | cutover
+    processed = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    chunks_per_sec = Column(Float, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
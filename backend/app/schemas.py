@@ -4,12 +4,18 @@ from typing import List, Optional, Literal
 
 class IngestFSRequest(BaseModel):
     path: str = Field(..., description="Directory path inside /workspace to ingest")
+    reindex: bool = Field(False, description="Drop the repo's index first and re-ingest every file")
 
 
 class IngestGitRequest(BaseModel):
     repo_url: str = Field(..., description="Git repository URL")
     name: Optional[str] = Field(None, description="Optional repo name")
     branch: Optional[str] = Field("main", description="Branch to track")
+    reindex: bool = Field(False, description="Drop the repo's index first and re-ingest every file")
+
+
+class ReembedRequest(BaseModel):
+    model: str = Field(..., description="Embedding model to switch to, e.g. sentence-transformers/all-MiniLM-L12-v2")
 
 
 # Search Request with parameters
@@ -17,7 +23,28 @@ class SearchRequest(BaseModel):
     query: str
     top_k: int = Field(5, ge=1, le=20, description="Number of chunks to retrieve")
     min_similarity: float = Field(0.0, ge=0.0, le=1.0, description="Minimum similarity threshold")
-    provider: Literal["openai", "groq", "deepseek"] = Field("openai", description="LLM provider")
+    provider: Literal["openai", "groq", "deepseek", "mock"] = Field("openai", description="LLM provider")
+    repo_name: Optional[str] = Field(None, description="Restrict the search to one repository")
+    top_files: Optional[int] = Field(
+        None, ge=1, le=1000,
+        description="Coarse-to-fine search: rank only chunks of the N nearest files",
+    )
+    deadline_ms: Optional[int] = Field(
+        None, ge=10, le=600_000,
+        description="Latency budget; stages degrade (see response `degradations`) to stay within it",
+    )
+
+
+# Batch search: many queries, one embedding pass and one SQL round trip
+class BatchSearchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=500, description="Queries to run")
+    top_k: int = Field(5, ge=1, le=20, description="Number of chunks to retrieve per query")
+    min_similarity: float = Field(0.0, ge=0.0, le=1.0, description="Minimum similarity threshold")
+    repo_name: Optional[str] = Field(None, description="Restrict the search to one repository")
+    top_files: Optional[int] = Field(
+        None, ge=1, le=1000,
+        description="Coarse-to-fine search: rank only chunks of the N nearest files",
+    )
 
 
 # Individual search result
@@ -26,6 +53,8 @@ class SearchResult(BaseModel):
     chunk_index: int
     content_snippet: str
     similarity: float  # Changed from 'score' - now 0-1 where higher is better
+    symbol: Optional[str] = None  # Set when the chunk came from an exact symbol-index hit
+    duplicate_paths: List[str] = []  # Other files holding this exact chunk (collapsed near-duplicates)
 
 
 # Retrieval metrics
@@ -37,6 +66,15 @@ class RetrievalMetrics(BaseModel):
     results_filtered: int  # How many were cut by min_similarity
 
 
+# Aggregate timing for a batch search
+class BatchMetrics(BaseModel):
+    queries: int
+    latency_ms: float
+    embed_ms: float
+    sql_ms: float
+    postprocess_ms: float
+
+
 # Generation metrics (for RAG with LLM)
 class GenerationMetrics(BaseModel):
     llm_latency_ms: float
@@ -48,6 +86,19 @@ class GenerationMetrics(BaseModel):
 class SearchResponse(BaseModel):
     results: List[SearchResult]
     retrieval_metrics: RetrievalMetrics
+    degradations: List[str] = []  # Shortcuts taken to meet deadline_ms
+
+
+# One query's slice of a batch search response
+class BatchSearchItem(BaseModel):
+    query: str
+    results: List[SearchResult]
+    retrieval_metrics: RetrievalMetrics
+
+
+class BatchSearchResponse(BaseModel):
+    results: List[BatchSearchItem]
+    batch_metrics: BatchMetrics
 
 
 # RAG search response (retrieval + generation)
@@ -57,12 +108,13 @@ class RagSearchResponse(BaseModel):
     results: List[SearchResult]
     retrieval_metrics: RetrievalMetrics
     generation_metrics: GenerationMetrics
+    degradations: List[str] = []  # Shortcuts taken to meet deadline_ms
 
 
 # Raw LLM search (no RAG)
 class RawSearchRequest(BaseModel):
     query: str
-    provider: Literal["openai", "groq", "deepseek"] = "openai"
+    provider: Literal["openai", "groq", "deepseek", "mock"] = "openai"
 
 
 class RawSearchResponse(BaseModel):
@@ -71,6 +123,23 @@ class RawSearchResponse(BaseModel):
     latency_ms: float
 
 
+# Symbol index lookup
+class SymbolResult(BaseModel):
+    name: str
+    kind: str
+    file_path: str
+    line: int
+    chunk_index: int
+    repo_name: Optional[str] = None
+
+
+class SymbolLookupResponse(BaseModel):
+    query: str
+    mode: str
+    symbols: List[SymbolResult]
+    files: List[str]  # paths equal to, or ending in, the query
+
+
 # Files list
 class FileInfo(BaseModel):
     id: int
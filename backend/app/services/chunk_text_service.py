@@ -0,0 +1,150 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+def chunk_offsets(chunks: List[str], max_chars: int, overlap: int) -> List[Tuple[int, int]]:
+    """(start, end) character offsets of `simple_chunk_text` chunks in their text."""
+    step = max_chars - overlap
+    return [(idx * step, idx * step + len(chunk)) for idx, chunk in enumerate(chunks)]
+
+
+def rebuild_text(chunks: List[str], overlap: int) -> Optional[str]:
+    """
+    Reassemble a file's text from its ordered inline chunks, or None if the
+    chunks do not overlap by exactly `overlap` characters (e.g. they were
+    written with different chunk settings).
+    """
+    if not chunks:
+        return None
+    parts = [chunks[0]]
+    for prev, chunk in zip(chunks, chunks[1:]):
+        if overlap and (len(prev) < overlap or chunk[:overlap] != prev[-overlap:]):
+            return None
+        parts.append(chunk[overlap:])
+    return "".join(parts)
+
+
+def chunk_context(db: Session, chunk_id: int, before: int = 0, after: int = 0) -> Optional[Dict]:
+    """
+    A chunk widened by up to `before`/`after` characters of its file.
+
+    Offset-stored chunks are a single substr of the file text; inline chunks
+    can only be returned as stored.
+    """
+    row = db.execute(
+        text("""
+            SELECT
+                c.id AS chunk_id,
+                f.path AS file_path,
+                c.chunk_index,
+                c.start_offset,
+                c.end_offset,
+                CASE WHEN c.content IS NULL THEN
+                    substr(
+                        f.content,
+                        GREATEST(c.start_offset - :before, 0) + 1,
+                        c.end_offset + :after - GREATEST(c.start_offset - :before, 0)
+                    )
+                ELSE c.content END AS content
+            FROM chunks c
+            JOIN files f ON c.file_id = f.id
+            WHERE c.id = :chunk_id
+        """),
+        {"chunk_id": chunk_id, "before": max(before, 0), "after": max(after, 0)},
+    ).first()
+    if row is None:
+        return None
+    return dict(row._mapping)
+
+
+def chunk_text_storage(db: Session) -> Dict:
+    """Bytes spent on chunk text, inline vs. as per-file text (after compression)."""
+    chunk_row = db.execute(text("""
+        SELECT
+            COUNT(*) FILTER (WHERE content IS NOT NULL) AS inline_chunks,
+            COUNT(*) FILTER (WHERE content IS NULL) AS offset_chunks,
+            COALESCE(SUM(pg_column_size(content)), 0) AS inline_bytes
+        FROM chunks
+    """)).first()
+    file_row = db.execute(text("""
+        SELECT
+            COUNT(content) AS files_with_text,
+            COALESCE(SUM(pg_column_size(content)), 0) AS file_text_bytes,
+            COALESCE(SUM(octet_length(content)), 0) AS file_text_raw_bytes
+        FROM files
+    """)).first()
+    return {**dict(chunk_row._mapping), **dict(file_row._mapping)}
+
+
+def convert_to_offsets(db: Session, overlap: int, batch_files: int = 200) -> Dict:
+    """
+    Move inline chunk text into files.content + chunk offsets, file by file.
+
+    Files whose chunks cannot be reassembled with `overlap` are left inline.
+    Commits every `batch_files` files; safe to re-run.
+    """
+    before = chunk_text_storage(db)
+    start = time.time()
+    converted = skipped = 0
+    last_id = 0
+    while True:
+        file_ids = db.execute(
+            text("""
+                SELECT DISTINCT c.file_id FROM chunks c
+                WHERE c.content IS NOT NULL AND c.file_id > :last_id
+                ORDER BY c.file_id
+                LIMIT :limit
+            """),
+            {"last_id": last_id, "limit": batch_files},
+        ).scalars().all()
+        if not file_ids:
+            break
+        for file_id in file_ids:
+            rows = db.execute(
+                text("SELECT id, content FROM chunks WHERE file_id = :file_id ORDER BY chunk_index"),
+                {"file_id": file_id},
+            ).fetchall()
+            full_text = rebuild_text([r.content for r in rows], overlap) if all(r.content for r in rows) else None
+            if full_text is None:
+                skipped += 1
+                continue
+            step = len(rows[0].content) - overlap
+            db.execute(
+                text("""
+                    UPDATE files SET content = :content, generation = nextval('files_generation_seq')
+                    WHERE id = :file_id
+                """),
+                {"content": full_text, "file_id": file_id},
+            )
+            db.execute(
+                text("""
+                    UPDATE chunks AS c
+                    SET start_offset = o.start_offset, end_offset = o.end_offset, content = NULL
+                    FROM unnest(CAST(:ids AS integer[]), CAST(:starts AS integer[]), CAST(:ends AS integer[]))
+                        AS o(id, start_offset, end_offset)
+                    WHERE c.id = o.id
+                """),
+                {
+                    "ids": [r.id for r in rows],
+                    "starts": [idx * step for idx in range(len(rows))],
+                    "ends": [idx * step + len(r.content) for idx, r in enumerate(rows)],
+                },
+            )
+            converted += 1
+        db.commit()
+        last_id = file_ids[-1]
+        print(f"[MIGRATE] chunk offsets: {converted} files converted, {skipped} left inline")
+
+    after = chunk_text_storage(db)
+    saved = before["inline_bytes"] + before["file_text_bytes"] - after["inline_bytes"] - after["file_text_bytes"]
+    return {
+        "files_converted": converted,
+        "files_left_inline": skipped,
+        "seconds": round(time.time() - start, 1),
+        "text_bytes_before": before["inline_bytes"] + before["file_text_bytes"],
+        "text_bytes_after": after["inline_bytes"] + after["file_text_bytes"],
+        "text_bytes_saved": saved,
+    }
@@ -0,0 +1,168 @@
+"""
+Single-flight coalescing of identical search/RAG requests.
+
+Concurrent requests with the same normalized parameters share one
+computation. Within a process, followers wait on the leader's flight.
+Across uvicorn workers, the process that wins a Redis `SET NX` lock computes
+the result and publishes it. Other processes subscribe, and also check a
+short-lived result key, which closes the race between the publish and their
+subscribe. If Redis is unavailable, or the leader fails or times out, the
+request computes on its own. A follower with a latency budget waits at
+most for what is left of it, then computes on its own (degrading as its
+deadline requires).
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional, Type, TypeVar
+
+import redis
+from pydantic import BaseModel
+
+from ..config import load_ingestion_config, settings
+from .metrics_service import COALESCED_REQUESTS
+
+T = TypeVar("T", bound=BaseModel)
+
+_cfg = (load_ingestion_config().get("search", {}) or {}).get("coalescing", {}) or {}
+ENABLED = bool(_cfg.get("enabled", True))
+# Upper bound on how long followers wait (a RAG completion can take a while).
+WAIT_TIMEOUT_SECONDS = float(_cfg.get("wait_timeout_seconds", 60.0))
+# How long a finished result stays readable for followers that subscribed late.
+RESULT_TTL_MS = int(_cfg.get("result_ttl_ms", 1000))
+
+_ERROR = "__error__"
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.payload: Optional[str] = None
+
+
+_flights: Dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+_redis: Optional[redis.Redis] = None
+
+
+def _client() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.redis_url, socket_timeout=5, socket_connect_timeout=1)
+    return _redis
+
+
+def _best_effort(fn: Callable, *args, **kwargs) -> None:
+    # After the leader has computed, Redis trouble must not cost a recompute;
+    # followers then fall back on their own once the lock expires.
+    try:
+        fn(*args, **kwargs)
+    except redis.RedisError as e:
+        print(f"[COALESCE] Redis error after compute: {e}")
+
+
+def _normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+
+def coalesce_key(endpoint: str, query: str, **params) -> str:
+    raw = json.dumps({"endpoint": endpoint, "query": _normalize_query(query), **params}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _remote(endpoint: str, key: str, compute: Callable[[], str], wait_seconds: float) -> str:
+    """Leader election and result sharing across processes through Redis."""
+    client = _client()
+    lock_key, result_key, channel = f"sf:lock:{key}", f"sf:result:{key}", f"sf:chan:{key}"
+    token = uuid.uuid4().hex
+
+    if client.set(lock_key, token, nx=True, px=int(WAIT_TIMEOUT_SECONDS * 1000)):
+        COALESCED_REQUESTS.labels(endpoint=endpoint, role="leader").inc()
+        try:
+            payload = compute()
+        except BaseException:
+            _best_effort(client.publish, channel, _ERROR)
+            _best_effort(client.eval, _RELEASE_LOCK, 1, lock_key, token)
+            raise
+        # The lock goes last: a follower that finds it gone reads the result key.
+        _best_effort(client.set, result_key, payload, px=RESULT_TTL_MS)
+        _best_effort(client.publish, channel, payload)
+        _best_effort(client.eval, _RELEASE_LOCK, 1, lock_key, token)
+        return payload
+
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(channel)
+        payload = client.get(result_key)
+        deadline = time.monotonic() + wait_seconds
+        while payload is None and time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=max(min(1.0, deadline - time.monotonic()), 0.0))
+            if message is not None:
+                payload = message["data"]
+            elif not client.exists(lock_key):
+                # Leader finished or died between our checks.
+                payload = client.get(result_key) or _ERROR
+    finally:
+        pubsub.close()
+
+    if payload is None or payload in (_ERROR, _ERROR.encode()):
+        COALESCED_REQUESTS.labels(endpoint=endpoint, role="fallback").inc()
+        return compute()
+    COALESCED_REQUESTS.labels(endpoint=endpoint, role="remote_follower").inc()
+    return payload.decode("utf-8") if isinstance(payload, bytes) else payload
+
+
+def coalesce(
+    endpoint: str,
+    key: str,
+    compute: Callable[[], T],
+    model: Type[T],
+    wait_seconds: Optional[float] = None,
+) -> T:
+    """
+    Run `compute` once for all concurrent callers with the same key. A
+    follower waits at most `wait_seconds` (capped at WAIT_TIMEOUT_SECONDS)
+    for the leader before computing on its own.
+    """
+    if not ENABLED:
+        return compute()
+    wait = WAIT_TIMEOUT_SECONDS if wait_seconds is None else min(wait_seconds, WAIT_TIMEOUT_SECONDS)
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        flight.done.wait(wait)
+        if flight.payload is not None:
+            COALESCED_REQUESTS.labels(endpoint=endpoint, role="local_follower").inc()
+            return model.model_validate_json(flight.payload)
+        COALESCED_REQUESTS.labels(endpoint=endpoint, role="fallback").inc()
+        return compute()
+
+    def run() -> str:
+        return compute().model_dump_json()
+
+    try:
+        try:
+            flight.payload = _remote(endpoint, key, run, wait)
+        except redis.RedisError as e:
+            print(f"[COALESCE] Redis unavailable, computing locally: {e}")
+            COALESCED_REQUESTS.labels(endpoint=endpoint, role="leader").inc()
+            flight.payload = run()
+        return model.model_validate_json(flight.payload)
+    finally:
+        flight.done.set()
+        with _flights_lock:
+            _flights.pop(key, None)
@@ -0,0 +1,161 @@
+"""
+Near-duplicate files: MinHash signatures with an LSH band index in Postgres.
+
+Vendored libraries, generated clients and copied docs repeat across repos.
+Each ingested file's signature is split into bands (minhash_bands); a new
+file's candidates are the files sharing a band bucket, and the most similar
+one at or above `threshold` (estimated Jaccard over token shingles) is its
+match. Chunks whose text the match already has reuse its embeddings, so
+only the differing chunks are embedded. `files.duplicate_of` links every
+member of a group to its first-ingested file.
+"""
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import Text, text
+from sqlalchemy.orm import Session
+
+from ..config import load_ingestion_config
+from ..models import EMBED_DIM, EmbeddingVector, File, MinHashBand
+from ..utils.minhash import MinHasher, band_buckets, similarity
+from .vector_store import CHUNK_TEXT_SQL
+
+_cfg = (load_ingestion_config().get("ingestion", {}) or {}).get("near_duplicates", {}) or {}
+ENABLED = bool(_cfg.get("enabled", True))
+THRESHOLD = float(_cfg.get("threshold", 0.8))
+BANDS = int(_cfg.get("bands", 16))
+# Candidates (by shared bands) whose signatures are compared per file.
+MAX_CANDIDATES = int(_cfg.get("max_candidates", 20))
+
+HASHER = MinHasher(num_perm=int(_cfg.get("num_perm", 128)), shingle_tokens=int(_cfg.get("shingle_tokens", 5)))
+
+
+class NearDuplicate(NamedTuple):
+    file_id: int      # most similar indexed file
+    canonical_id: int  # first-ingested file of its group
+    similarity: float
+
+
+def signature(chunks: List[str]) -> np.ndarray:
+    return HASHER.signature(chunks)
+
+
+def find_near_duplicate(db: Session, sig: np.ndarray, exclude_file_id: Optional[int] = None) -> Optional[NearDuplicate]:
+    """The indexed file most similar to `sig`, if at or above THRESHOLD."""
+    buckets = band_buckets(sig, BANDS)
+    rows = db.execute(
+        text("""
+            SELECT f.id, f.minhash, f.duplicate_of
+            FROM (
+                SELECT b.file_id, count(*) AS shared
+                FROM minhash_bands b
+                JOIN unnest(CAST(:bands AS smallint[]), CAST(:buckets AS bigint[])) AS q(band, bucket)
+                  ON b.band = q.band AND b.bucket = q.bucket
+                WHERE b.file_id IS DISTINCT FROM :exclude
+                GROUP BY b.file_id
+                ORDER BY shared DESC
+                LIMIT :limit
+            ) c
+            JOIN files f ON f.id = c.file_id
+            WHERE f.minhash IS NOT NULL
+        """),
+        {
+            "bands": list(range(len(buckets))),
+            "buckets": buckets,
+            "exclude": exclude_file_id,
+            "limit": MAX_CANDIDATES,
+        },
+    ).fetchall()
+    best = None
+    for row in rows:
+        score = similarity(sig, np.frombuffer(row.minhash, dtype=np.uint32))
+        if score >= THRESHOLD and (best is None or score > best.similarity):
+            best = NearDuplicate(row.id, row.duplicate_of or row.id, score)
+    return best
+
+
+def index_signature(db: Session, db_file: File, sig: np.ndarray, replace: bool) -> None:
+    """Store a file's signature and its LSH bands."""
+    if replace:
+        db.query(MinHashBand).filter(MinHashBand.file_id == db_file.id).delete(synchronize_session=False)
+    db_file.minhash = sig.tobytes()
+    db.bulk_insert_mappings(MinHashBand, [
+        {"band": band, "bucket": bucket, "file_id": db_file.id, "repo_name": db_file.repo_name}
+        for band, bucket in enumerate(band_buckets(sig, BANDS))
+    ])
+
+
+def reusable_embeddings(db: Session, file_id: int, generation: int) -> Dict[str, List[float]]:
+    """
+    Chunk text -> embedding for a file's chunks embedded by the model of
+    `generation`. Empty when embeddings live outside Postgres (Milvus),
+    where they cannot be read back cheaply.
+    """
+    rows = db.execute(
+        text(f"""
+            SELECT {CHUNK_TEXT_SQL} AS content, c.embedding
+            FROM chunks c
+            JOIN files f ON f.id = c.file_id
+            WHERE c.file_id = :file_id AND c.embedding IS NOT NULL
+              AND (c.embedding_generation IS NULL OR c.embedding_generation = :generation)
+        """).columns(content=Text, embedding=EmbeddingVector(EMBED_DIM)),
+        {"file_id": file_id, "generation": generation},
+    ).fetchall()
+    return {row.content: row.embedding.tolist() for row in rows}
+
+
+def duplicate_stats(db: Session) -> Dict:
+    """Near-duplicate groups and the chunks embedded once for them."""
+    row = db.execute(text("""
+        SELECT
+            count(DISTINCT f.duplicate_of) AS groups,
+            count(*) AS duplicate_files,
+            (SELECT count(*) FROM chunks c JOIN files d ON d.id = c.file_id WHERE d.duplicate_of IS NOT NULL)
+                AS duplicate_chunks
+        FROM files f
+        WHERE f.duplicate_of IS NOT NULL
+    """)).first()
+    return dict(row._mapping)
+
+
+def backfill_signatures(db: Session, batch_files: int = 200) -> Dict:
+    """
+    Sign and band already-ingested files from their stored chunk text,
+    linking each to the group of its closest already-signed match (embeddings
+    are left as they are); safe to re-run.
+    """
+    start = time.time()
+    files = duplicates = 0
+    last_id = 0
+    while True:
+        ids = db.execute(
+            text("SELECT id FROM files WHERE id > :last_id AND minhash IS NULL ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": batch_files},
+        ).scalars().all()
+        if not ids:
+            break
+        for file_id in ids:
+            chunks = db.execute(
+                text(f"""
+                    SELECT {CHUNK_TEXT_SQL} AS content FROM chunks c
+                    JOIN files f ON c.file_id = f.id
+                    WHERE c.file_id = :file_id ORDER BY c.chunk_index
+                """),
+                {"file_id": file_id},
+            ).scalars().all()
+            if not chunks:
+                continue
+            db_file = db.query(File).filter(File.id == file_id).one()
+            sig = signature(chunks)
+            match = find_near_duplicate(db, sig, exclude_file_id=file_id)
+            if match is not None and match.canonical_id != file_id:
+                db_file.duplicate_of = match.canonical_id
+                duplicates += 1
+            index_signature(db, db_file, sig, replace=True)
+            files += 1
+        db.commit()
+        db.expunge_all()
+        last_id = ids[-1]
+        print(f"[MIGRATE] near-duplicates: {files} files signed, {duplicates} near-duplicates")
+    return {"files": files, "near_duplicates": duplicates, "seconds": round(time.time() - start, 1)}
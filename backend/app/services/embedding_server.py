@@ -0,0 +1,195 @@
+"""
+One embedding model per host, shared by every API and worker process.
+
+`python -m app.services.embedding_server` loads the SentenceTransformer once
+and serves it over a Unix socket (EMBEDDING_SOCKET). With
+EMBEDDING_BACKEND=server, `embed_texts` sends texts there instead of loading
+the weights in each process.
+
+Clients give up after EMBEDDING_TIMEOUT_SECONDS per request
+(EmbeddingServerTimeout), so a hung server fails ingestion jobs, which are
+retried, instead of blocking their workers.
+
+Wire format, both directions: a 4-byte big-endian length and a JSON header.
+Requests are {"texts": [...], "model": name} or {"op": "stats"}; an embed
+response header {"n", "dim"} is followed by n * dim little-endian float32s.
+"""
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import settings
+
+_HEADER = struct.Struct(">I")
+_FLOAT32 = np.dtype("<f4")
+
+
+def memory_usage() -> Dict[str, int]:
+    """RSS and PSS (shared pages split across their users) of this process, in bytes."""
+    usage = {}
+    for path, keys in (("/proc/self/status", ("VmRSS",)), ("/proc/self/smaps_rollup", ("Pss",))):
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key in keys:
+                        usage["rss_bytes" if key == "VmRSS" else "pss_bytes"] = int(value.split()[0]) * 1024
+        except OSError:
+            pass
+    return usage
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        part = sock.recv(n - len(buf))
+        if not part:
+            raise ConnectionError("embedding server connection closed")
+        buf += part
+    return bytes(buf)
+
+
+def _send_message(sock: socket.socket, header: Dict, payload: bytes = b"") -> None:
+    raw = json.dumps(header).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(raw)) + raw + payload)
+
+
+def _recv_header(sock: socket.socket) -> Dict:
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, length))
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        # A connection carries any number of requests (clients keep theirs open).
+        while True:
+            try:
+                request = _recv_header(self.request)
+            except ConnectionError:
+                return
+            try:
+                if request.get("op") == "stats":
+                    _send_message(self.request, {**memory_usage(), **self.server.stats})
+                    continue
+                vectors = self.server.encode(request["texts"], request.get("model"))
+                _send_message(self.request, {"n": vectors.shape[0], "dim": vectors.shape[1]}, vectors.tobytes())
+            except Exception as e:
+                _send_message(self.request, {"error": f"{type(e).__name__}: {e}"})
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, preload: Optional[str] = None) -> None:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o666)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "texts": 0}
+        if preload:
+            self.encode(["warmup"], preload)
+
+    def encode(self, texts: List[str], model_name: Optional[str]) -> np.ndarray:
+        from .embedding_service import configured_model_name, get_embedding_model
+
+        model = get_embedding_model(model_name or configured_model_name())
+        # One encode at a time: the model already uses every core for a batch.
+        with self._lock:
+            vectors = model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+            self.stats["requests"] += 1
+            self.stats["texts"] += len(texts)
+        return np.ascontiguousarray(vectors, dtype=_FLOAT32).reshape(len(texts), -1)
+
+
+def serve(socket_path: str = settings.embedding_socket) -> None:
+    from .embedding_service import configured_model_name
+
+    start = time.time()
+    server = EmbeddingServer(socket_path, preload=configured_model_name())
+    print(f"[EMBED] Serving {configured_model_name()} on {socket_path} "
+          f"(loaded in {time.time() - start:.1f}s, {memory_usage()})")
+    server.serve_forever()
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+_local = threading.local()
+
+
+class EmbeddingServerTimeout(RuntimeError):
+    """The embedding server did not answer within EMBEDDING_TIMEOUT_SECONDS."""
+
+
+def _connection(socket_path: str) -> socket.socket:
+    sock = getattr(_local, "sock", None)
+    if sock is None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(settings.embedding_timeout_seconds)
+        sock.connect(socket_path)
+        _local.sock = sock
+    return sock
+
+
+def _timed_out(socket_path: str) -> EmbeddingServerTimeout:
+    # A late response would desynchronize the stream; the next request reconnects.
+    sock = getattr(_local, "sock", None)
+    if sock is not None:
+        sock.close()
+        _local.sock = None
+    return EmbeddingServerTimeout(
+        f"Embedding server at {socket_path} did not answer within {settings.embedding_timeout_seconds:g}s"
+    )
+
+
+def _request(header: Dict, socket_path: str) -> Tuple[Dict, socket.socket]:
+    # One reconnect: the server may have restarted since this thread last used it.
+    for attempt in range(2):
+        sock = _connection(socket_path)
+        try:
+            _send_message(sock, header)
+            return _recv_header(sock), sock
+        except socket.timeout as e:
+            raise _timed_out(socket_path) from e
+        except (ConnectionError, OSError):
+            sock.close()
+            _local.sock = None
+            if attempt:
+                raise
+    raise AssertionError("unreachable")
+
+
+def remote_embed(texts: List[str], model_name: str, socket_path: str = settings.embedding_socket) -> List[List[float]]:
+    if not texts:
+        return []
+    response, sock = _request({"texts": texts, "model": model_name}, socket_path)
+    if "error" in response:
+        raise RuntimeError(f"Embedding server: {response['error']}")
+    n, dim = response["n"], response["dim"]
+    try:
+        vectors = np.frombuffer(_recv_exact(sock, n * dim * _FLOAT32.itemsize), dtype=_FLOAT32)
+    except socket.timeout as e:
+        raise _timed_out(socket_path) from e
+    return vectors.reshape(n, dim).tolist()
+
+
+def server_stats(socket_path: str = settings.embedding_socket) -> Dict:
+    return _request({"op": "stats"}, socket_path)[0]
+
+
+if __name__ == "__main__":
+    serve()
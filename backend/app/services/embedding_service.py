@@ -1,17 +1,206 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 from functools import lru_cache
-from typing import List
-from sentence_transformers import SentenceTransformer
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
 from ..config import settings, load_ingestion_config
 
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
-@lru_cache(maxsize=1)
-def get_embedding_model() -> SentenceTransformer:
+# How long a process keeps using its cached active model after a cutover.
+STATE_TTL_SECONDS = float(
+    (load_ingestion_config().get("ingestion", {}).get("embedding", {}) or {}).get("state_ttl_seconds", 2.0)
+)
+# Recent query embeddings kept per process (0 disables the cache).
+QUERY_CACHE_SIZE = int(
+    (load_ingestion_config().get("search", {}) or {}).get("query_embedding_cache_size", 1024)
+)
+QUERY_WORKERS = 4
+# Deadline-bound query embeddings queued behind the running ones before
+# further requests give up at once.
+MAX_QUEUED_QUERIES = int(
+    ((load_ingestion_config().get("search", {}) or {}).get("deadline", {}) or {}).get("max_queued_embeddings", 16)
+)
+
+
+def configured_model_name() -> str:
     cfg = load_ingestion_config()
-    model_name = cfg.get("ingestion", {}).get("embedding", {}).get("model", settings.embedding_model)
-    return SentenceTransformer(model_name)
+    return cfg.get("ingestion", {}).get("embedding", {}).get("model", settings.embedding_model)
+
+
+@lru_cache(maxsize=2)
+def get_embedding_model(model_name: Optional[str] = None) -> "SentenceTransformer":
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name or configured_model_name())
+
+
+_state_lock = threading.Lock()
+_state_cache: Dict[str, object] = {"expires": 0.0, "value": None}
+
+
+def _cached_state() -> Tuple[str, Optional[str], int]:
+    # (active model, target or None, active generation), refreshed at most
+    # every STATE_TTL_SECONDS.
+    now = time.monotonic()
+    if _state_cache["value"] is not None and now < _state_cache["expires"]:
+        return _state_cache["value"]  # type: ignore[return-value]
+    with _state_lock:
+        from ..database import engine
+
+        try:
+            with engine.connect() as conn:
+                row = conn.execute(
+                    text("SELECT model, target_model, generation FROM embedding_state WHERE id = 1")
+                ).first()
+        except SQLAlchemyError:
+            row = None  # table not created yet
+        value = (row.model, row.target_model, row.generation) if row else (configured_model_name(), None, 1)
+        _state_cache.update(value=value, expires=now + STATE_TTL_SECONDS)
+        return value
+
+
+def embedding_models() -> Tuple[str, Optional[str]]:
+    """
+    (active model, re-embedding target or None) from embedding_state,
+    refreshed at most every STATE_TTL_SECONDS. Before any re-embedding has
+    run the configured model is active.
+    """
+    model, target, _ = _cached_state()
+    return model, target
+
+
+def active_embedding() -> Tuple[str, int]:
+    """(active model, its generation), cached like `embedding_models`."""
+    model, _, generation = _cached_state()
+    return model, generation
+
+
+def refresh_embedding_models() -> None:
+    """Drop the cached state so the next call re-reads embedding_state."""
+    _state_cache.update(expires=0.0)
+
+
+def active_model_name() -> str:
+    return embedding_models()[0]
 
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    model = get_embedding_model()
+def _stub_embedding(text: str, dim: int) -> List[float]:
+    """Deterministic unit vector derived from the text hash."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dim)
+    return (vec / np.linalg.norm(vec)).tolist()
+
+
+def embed_texts(texts: List[str], model_name: Optional[str] = None) -> List[List[float]]:
+    """Embed with `model_name`, or the active model (see `embedding_models`)."""
+    if settings.embedding_backend == "stub":
+        return [_stub_embedding(t, settings.embedding_dim) for t in texts]
+    if settings.embedding_backend == "server":
+        from .embedding_server import remote_embed
+
+        return remote_embed(texts, model_name or active_model_name())
+
+    model = get_embedding_model(model_name or active_model_name())
     embeddings = model.encode(texts, convert_to_numpy=False, normalize_embeddings=True)
     return [emb.tolist() for emb in embeddings]
+
+
+# Reentrant: cancelling a future runs its done callback in the cancelling thread.
+_query_lock = threading.RLock()
+_query_cache: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+# Deadline-bound embeddings queued or running, and how many requests wait on each.
+_query_inflight: Dict[Tuple[str, str], Future] = {}
+_query_waiters: Dict[Tuple[str, str], int] = {}
+
+
+@lru_cache(maxsize=1)
+def _query_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="embed-query")
+
+
+def _embed_and_cache(key: Tuple[str, str]) -> List[float]:
+    model_name, query = key
+    [emb] = embed_texts([query], model_name=model_name)
+    if QUERY_CACHE_SIZE > 0:
+        with _query_lock:
+            _query_cache[key] = emb
+            _query_cache.move_to_end(key)
+            while len(_query_cache) > QUERY_CACHE_SIZE:
+                _query_cache.popitem(last=False)
+    return emb
+
+
+def _query_done(key: Tuple[str, str], future: Future) -> None:
+    with _query_lock:
+        if _query_inflight.get(key) is future:
+            del _query_inflight[key]
+            _query_waiters.pop(key, None)
+
+
+def _submit_query(key: Tuple[str, str]) -> Optional[Future]:
+    # Called with _query_lock held; None when the queue is full.
+    future = _query_inflight.get(key)
+    if future is None:
+        if len(_query_inflight) >= QUERY_WORKERS + MAX_QUEUED_QUERIES:
+            return None
+        future = _query_executor().submit(_embed_and_cache, key)
+        _query_inflight[key] = future
+        future.add_done_callback(lambda f: _query_done(key, f))
+    _query_waiters[key] = _query_waiters.get(key, 0) + 1
+    return future
+
+
+def _leave_query(key: Tuple[str, str], future: Future) -> None:
+    # The last request to give up on an embedding that has not started cancels it.
+    with _query_lock:
+        if _query_inflight.get(key) is not future:
+            return
+        _query_waiters[key] -= 1
+        if _query_waiters[key] == 0:
+            future.cancel()
+
+
+def embed_query(query: str, timeout_seconds: Optional[float] = None) -> Optional[List[float]]:
+    """
+    One search query's embedding with the active model, through an LRU
+    cache keyed by (model, text). With `timeout_seconds`, the embedding runs
+    on a small thread pool shared by identical concurrent queries, and None
+    is returned when it does not arrive in time or the pool's queue is
+    full. An embedding that started still finishes in the background and
+    lands in the cache for the next identical query; one nobody waits for
+    any more is cancelled before it starts.
+    """
+    key = (active_model_name(), query)
+    with _query_lock:
+        emb = _query_cache.get(key)
+        if emb is not None:
+            _query_cache.move_to_end(key)
+            return emb
+        if timeout_seconds is not None:
+            future = _submit_query(key)
+            if future is None:
+                return None
+    if timeout_seconds is None:
+        return _embed_and_cache(key)
+    try:
+        return future.result(timeout=max(timeout_seconds, 0.0))
+    except (FutureTimeout, CancelledError):
+        return None
+    finally:
+        _leave_query(key, future)
+
+
+def mean_embedding(embeddings: List[List[float]]) -> List[float]:
+    """Normalized mean of a set of embeddings (a file's summary vector)."""
+    mean = np.asarray(embeddings, dtype=np.float32).mean(axis=0)
+    norm = np.linalg.norm(mean)
+    return (mean / norm if norm > 0 else mean).tolist()
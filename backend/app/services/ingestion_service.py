@@ -1,39 +1,75 @@
 import os
 import hashlib
-from typing import List, Tuple, Dict, Optional
+from itertools import islice
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
 from sqlalchemy.orm import Session
-from ..models import File, Chunk
-from ..utils.chunking import simple_chunk_text
-from .embedding_service import embed_texts
-from ..config import load_ingestion_config
+from ..models import CHUNK_TEXT_OFFSETS, FILES_GENERATION_SEQ, File, Chunk, IngestJob, IngestCheckpoint
+from ..utils.chunking import stream_chunk_text
+from ..utils.file_content import file_bytes, iter_decoded, sniff_content
+from ..utils.file_discovery import DiscoveryStats, iter_files
+from ..utils.symbols import has_extractor
+from .embedding_service import active_embedding, embed_texts, mean_embedding
+from ..config import settings, load_ingestion_config
 from ..database import SessionLocal
+from .metrics_service import INGEST_EMBEDDINGS, INGEST_STAGE_SECONDS, ingest_stage, record
+from .chunk_text_service import chunk_offsets, rebuild_text
+from .duplicate_service import (
+    ENABLED as NEAR_DUPLICATES_ENABLED, find_near_duplicate, index_signature, reusable_embeddings, signature,
+)
+from .partition_service import ensure_repo_partition, reset_repo
+from .reembedding_service import lock_embedding_state, write_shadow_embeddings
+from .symbol_service import replace_symbols
+from .vector_store import get_vector_store
 # from .milvus_service import collection as milvus_collection
 
-WORKSPACE_ROOT = "/workspace"
+WORKSPACE_ROOT = settings.workspace_root
 
 cfg = load_ingestion_config()
 _ing = cfg.get("ingestion", {})
 ALLOWED_EXTENSIONS = set(_ing.get("allowed_extensions", [".py", ".md", ".txt"]))
 CHUNK_MAX_CHARS = _ing.get("chunk", {}).get("max_chars", 1200)
 CHUNK_OVERLAP = _ing.get("chunk", {}).get("overlap", 200)
+# Files per transaction: each batch becomes searchable (and checkpointed) as
+# soon as it commits.
+COMMIT_BATCH_FILES = int(_ing.get("commit_batch_files", 100))
 
+_discovery = _ing.get("discovery", {}) or {}
+IGNORE_GLOBS = list(_discovery.get("ignore_globs", [".git", "node_modules", "__pycache__"]))
+RESPECT_GITIGNORE = bool(_discovery.get("respect_gitignore", True))
+MAX_FILE_BYTES = int(_discovery.get("max_file_bytes", 0))
 
-def hash_file(path: str) -> str:
-    hasher = hashlib.sha256()
-    with open(path, "rb") as f:
-        for block in iter(lambda: f.read(8192), b""):
-            hasher.update(block)
-    return hasher.hexdigest()
+# Index definitions (Python/JS/TS/Markdown) for exact identifier lookups.
+EXTRACT_SYMBOLS = bool(_ing.get("extract_symbols", True))
 
+_limits = _ing.get("limits", {}) or {}
+MAX_CHUNKS_PER_FILE = int(_limits.get("max_chunks_per_file", 0))
+MMAP_THRESHOLD_BYTES = int(_limits.get("mmap_threshold_bytes", 1 << 20))
+SNIFF_BYTES = int(_limits.get("sniff_bytes", 8192))
+MINIFIED_AVG_LINE_CHARS = int(_limits.get("minified_avg_line_chars", 500))
+MINIFIED_MIN_BYTES = int(_limits.get("minified_min_bytes", 4096))
+# Only generated code is minified; long-lined prose is still worth indexing.
+MINIFIED_EXTENSIONS = {
+    ext.lower() for ext in _limits.get(
+        "minified_extensions", [".js", ".mjs", ".cjs", ".jsx", ".ts", ".tsx", ".css", ".json", ".map"]
+    )
+}
 
-def collect_files(root_path: str) -> List[str]:
-    files: List[str] = []
-    for dirpath, _, filenames in os.walk(root_path):
-        for fname in filenames:
-            ext = os.path.splitext(fname)[1].lower()
-            if ext in ALLOWED_EXTENSIONS:
-                files.append(os.path.join(dirpath, fname))
-    return files
+STAT_KEYS = (
+    "new_files", "updated_files", "skipped_files", "binary_files", "minified_files",
+    "truncated_files", "chunks_written", "near_duplicate_files", "embeddings_reused",
+)
+
+
+def collect_files(root_path: str, stats: Optional[DiscoveryStats] = None) -> Iterator[str]:
+    """Stream ingestible files under root_path using the configured ignore rules."""
+    return iter_files(
+        root_path,
+        ALLOWED_EXTENSIONS,
+        ignore_globs=IGNORE_GLOBS,
+        respect_gitignore=RESPECT_GITIGNORE,
+        max_file_bytes=MAX_FILE_BYTES,
+        stats=stats,
+    )
 
 
 def _ingest_single_file(
@@ -41,99 +77,298 @@ def _ingest_single_file(
     abs_path: str,
     repo_name: Optional[str] = None,
     last_commit: Optional[str] = None,
-) -> Tuple[bool, bool]:
-    file_hash = hash_file(abs_path)
+) -> Tuple[str, int, bool, bool, int]:
+    """
+    Ingest one file; returns (outcome, chunks_written, truncated,
+    near_duplicate, embeddings_reused).
+
+    outcome is "new", "updated", "skipped" (unchanged, unreadable or empty),
+    "binary" or "minified". The file is read once: the same buffer (mapped
+    for large files) is hashed, sniffed and decoded as a stream into chunks.
+    A near-duplicate of an indexed file reuses that file's embeddings for
+    the chunks they share and embeds only the rest.
+    """
     rel_path = os.path.relpath(abs_path, WORKSPACE_ROOT)
+    try:
+        with file_bytes(abs_path, MMAP_THRESHOLD_BYTES) as data:
+            with ingest_stage("hash"):
+                file_hash = hashlib.sha256(data).hexdigest()
 
-    db_file = db.query(File).filter(File.path == rel_path).first()
+            with ingest_stage("lookup"):
+                db_file = db.query(File).filter(File.path == rel_path).first()
 
-    if db_file and db_file.hash == file_hash:
-        return (False, False)
+            if db_file and db_file.hash == file_hash:
+                return ("skipped", 0, False, False, 0)
 
-    try:
-        with open(abs_path, "r", encoding="utf-8", errors="ignore") as f:
-            text = f.read()
-    except Exception as e:
+            may_be_minified = (
+                len(data) >= MINIFIED_MIN_BYTES and os.path.splitext(rel_path)[1].lower() in MINIFIED_EXTENSIONS
+            )
+            kind = sniff_content(data[:SNIFF_BYTES], MINIFIED_AVG_LINE_CHARS if may_be_minified else 0)
+            if kind is not None:
+                return (kind, 0, False, False, 0)
+
+            with ingest_stage("chunk"):
+                if CHUNK_TEXT_OFFSETS:
+                    # The file text is stored once, so it is decoded whole
+                    # (bounded by discovery.max_file_bytes).
+                    full_text = "".join(iter_decoded(data))
+                    stream = stream_chunk_text([full_text], max_chars=CHUNK_MAX_CHARS, overlap=CHUNK_OVERLAP)
+                else:
+                    full_text = None
+                    stream = stream_chunk_text(iter_decoded(data), max_chars=CHUNK_MAX_CHARS, overlap=CHUNK_OVERLAP)
+                chunks = list(islice(stream, MAX_CHUNKS_PER_FILE or None))
+                truncated = bool(MAX_CHUNKS_PER_FILE) and next(stream, None) is not None
+    except OSError as e:
         print(f"[WARN] Skipping unreadable file: {abs_path} ({e})")
-        return (False, False)
+        return ("skipped", 0, False, False, 0)
 
-    chunks = simple_chunk_text(text, max_chars=CHUNK_MAX_CHARS, overlap=CHUNK_OVERLAP)
     if not chunks:
-        return (False, False)
+        return ("skipped", 0, False, False, 0)
+    if truncated:
+        print(f"[WARN] {rel_path}: kept the first {MAX_CHUNKS_PER_FILE} chunks")
+
+    sig = match = None
+    if NEAR_DUPLICATES_ENABLED:
+        with ingest_stage("minhash"):
+            sig = signature(chunks)
+            match = find_near_duplicate(db, sig, exclude_file_id=db_file.id if db_file else None)
 
-    embeddings = embed_texts(chunks)
+    with ingest_stage("embed"):
+        model, generation = active_embedding()
+        reused = reusable_embeddings(db, match.file_id, generation) if match else {}
+        missing = list(dict.fromkeys(chunk for chunk in chunks if chunk not in reused))
+        computed = dict(zip(missing, embed_texts(missing, model_name=model))) if missing else {}
+        embeddings = [reused[chunk] if chunk in reused else computed[chunk] for chunk in chunks]
+        file_embedding = mean_embedding(embeddings)
+    n_reused = sum(chunk in reused for chunk in chunks)
+    INGEST_EMBEDDINGS.labels(source="reused").inc(n_reused)
+    INGEST_EMBEDDINGS.labels(source="computed").inc(len(missing))
 
-    is_new = False
-    is_updated = False
+    store = get_vector_store()
+    with ingest_stage("db_write"):
+        state = lock_embedding_state(db)
+        if state.generation != generation:
+            # A re-embedding cut over since the (cached) state was read.
+            embeddings = embed_texts(chunks, model_name=state.model)
+            file_embedding = mean_embedding(embeddings)
+        if db_file is None:
+            db_file = File(
+                path=rel_path,
+                hash=file_hash,
+                repo_name=repo_name,
+                last_commit=last_commit,
+                embedding=file_embedding,
+            )
+            db.add(db_file)
+            db.flush()
+            outcome = "new"
+        else:
+            store.delete_by_file(db, db_file.id)
+            db_file.hash = file_hash
+            db_file.repo_name = repo_name or db_file.repo_name
+            db_file.last_commit = last_commit or db_file.last_commit
+            db_file.embedding = file_embedding
+            db_file.generation = FILES_GENERATION_SEQ.next_value()
+            outcome = "updated"
 
-    if db_file is None:
-        db_file = File(
-            path=rel_path,
-            hash=file_hash,
+        if full_text is not None:
+            offsets = chunk_offsets(chunks, CHUNK_MAX_CHARS, CHUNK_OVERLAP)
+            db_file.content = full_text[:offsets[-1][1]]
+            rows = [
+                Chunk(
+                    file_id=db_file.id,
+                    repo_name=db_file.repo_name,
+                    chunk_index=idx,
+                    start_offset=start,
+                    end_offset=end,
+                    embedding_generation=state.generation,
+                )
+                for idx, (start, end) in enumerate(offsets)
+            ]
+        else:
+            db_file.content = None
+            rows = [
+                Chunk(
+                    file_id=db_file.id,
+                    repo_name=db_file.repo_name,
+                    chunk_index=idx,
+                    content=chunk,
+                    embedding_generation=state.generation,
+                )
+                for idx, chunk in enumerate(chunks)
+            ]
+        store.upsert(db, db_file, rows, embeddings)
+        write_shadow_embeddings(db, db_file, rows, chunks, state)
+        if sig is not None:
+            # A file matching its own group stays that group's canonical file.
+            db_file.duplicate_of = match.canonical_id if match and match.canonical_id != db_file.id else None
+            index_signature(db, db_file, sig, replace=outcome == "updated")
+
+    if EXTRACT_SYMBOLS or outcome == "updated":
+        with ingest_stage("symbols"):
+            if not EXTRACT_SYMBOLS or not has_extractor(rel_path):
+                file_text = ""
+            elif db_file.content is not None:
+                file_text = db_file.content
+            else:
+                file_text = rebuild_text(chunks, CHUNK_OVERLAP) or ""
+            replace_symbols(
+                db, db_file, file_text, len(chunks), CHUNK_MAX_CHARS - CHUNK_OVERLAP,
+                replace=outcome == "updated",
+            )
+
+    return (outcome, len(chunks), truncated, match is not None, n_reused)
+
+
+def _start_job(db: Session, job_id: str, relative_path: str, repo_name: str) -> Tuple[IngestJob, Set[str]]:
+    """Load or create the job row; returns it with the paths it already finished."""
+    job = db.get(IngestJob, job_id)
+    if job is None:
+        job = IngestJob(
+            job_id=job_id,
+            relative_path=relative_path,
             repo_name=repo_name,
-            last_commit=last_commit,
-        )
-        db.add(db_file)
-        db.flush()
-        is_new = True
-    else:
-        db.query(Chunk).filter(Chunk.file_id == db_file.id).delete()
-        db_file.hash = file_hash
-        db_file.repo_name = repo_name or db_file.repo_name
-        db_file.last_commit = last_commit or db_file.last_commit
-        is_updated = True
-
-    for idx, (chunk, emb) in enumerate(zip(chunks, embeddings)):
-        db_chunk = Chunk(
-            file_id=db_file.id,
-            chunk_index=idx,
-            content=chunk,
-            embedding=emb,
+            status="running",
+            stats={key: 0 for key in STAT_KEYS},
         )
-        db.add(db_chunk)
+        db.add(job)
+        db.commit()
+        return job, set()
+    rows = db.query(IngestCheckpoint.path).filter(IngestCheckpoint.job_id == job_id).all()
+    return job, {row.path for row in rows}
 
-        # # Milvus
-        # collection.insert([
-        #     [emb],
-        #     [rel_path],
-        #     [idx]
-        # ])
 
-    return (is_new, is_updated)
+def _update_job(db: Session, job_id: str, **values) -> None:
+    db.query(IngestJob).filter(IngestJob.job_id == job_id).update(values, synchronize_session=False)
 
 
 def ingest_directory_from_workspace(
     relative_path: str,
     repo_name: Optional[str] = None,
     last_commit: Optional[str] = None,
+    job_id: Optional[str] = None,
+    between_batches: Optional[Callable[[], None]] = None,
+    reindex: bool = False,
 ) -> Dict[str, int]:
+    """
+    Ingest every allowed file under a workspace directory.
+
+    Work is committed every COMMIT_BATCH_FILES files. With a `job_id` each
+    batch also records its finished paths in the same transaction, so a
+    retried job skips them and carries on from the last committed batch.
+    `between_batches` runs after each commit, outside any transaction (bulk
+    jobs use it to yield to interactive ones). `reindex` first removes
+    everything indexed for the repo (swapping in empty partitions when
+    partitioned) so every file is ingested afresh; a resumed job keeps what
+    it already committed.
+    """
     abs_root = os.path.join(WORKSPACE_ROOT, relative_path.lstrip("/"))
     if not os.path.isdir(abs_root):
         raise ValueError(f"Path does not exist or is not a directory: {abs_root}")
 
-    file_paths = collect_files(abs_root)
+    # Every file belongs to a repo (the partition key when partitioning is
+    # on); plain workspace directories are named after their folder.
+    repo_name = repo_name or os.path.basename(relative_path.strip("/"))
 
-    stats = {
-        "new_files": 0,
-        "updated_files": 0,
-        "skipped_files": 0,
-        "total_files": len(file_paths),
-    }
+    discovery = DiscoveryStats()
+    stats = {key: 0 for key in STAT_KEYS}
 
+    store = get_vector_store()
     db = SessionLocal()
     try:
-        for path in file_paths:
-            is_new, is_updated = _ingest_single_file(db, path, repo_name, last_commit)
-            if is_new:
-                stats["new_files"] += 1
-            elif is_updated:
-                stats["updated_files"] += 1
-            else:
-                stats["skipped_files"] += 1
+        ensure_repo_partition(db, repo_name)
 
-        db.commit()
+        done: Set[str] = set()
+        if job_id is not None:
+            job, done = _start_job(db, job_id, relative_path, repo_name)
+            if job.status == "completed":
+                print(f"[INGEST] Job {job_id} already completed")
+                return dict(job.stats)
+            for key in STAT_KEYS:
+                stats[key] = job.stats.get(key, 0)
+            if done:
+                print(f"[INGEST] Resuming job {job_id}: {len(done)} files already done")
+
+        if reindex and not done:
+            reset_repo(db, repo_name)
+            store.delete_by_repo(db, repo_name)
+            print(f"[INGEST] Reindexing {repo_name}: previous index removed")
+
+        # Paths are discovered lazily, so ingestion starts with the first batch
+        # rather than after the whole tree has been walked.
+        pending = (
+            path for path in collect_files(abs_root, discovery)
+            if os.path.relpath(path, WORKSPACE_ROOT) not in done
+        )
+        committed = 0
+        while True:
+            batch = list(islice(pending, COMMIT_BATCH_FILES))
+            if not batch:
+                break
+            for path in batch:
+                outcome, n_chunks, truncated, near_duplicate, n_reused = _ingest_single_file(
+                    db, path, repo_name, last_commit
+                )
+                stats["chunks_written"] += n_chunks
+                stats[f"{outcome}_files"] += 1
+                stats["truncated_files"] += int(truncated)
+                stats["near_duplicate_files"] += int(near_duplicate)
+                stats["embeddings_reused"] += n_reused
+
+            with ingest_stage("commit"):
+                store.flush(db)
+                if job_id is not None:
+                    db.add_all(
+                        IngestCheckpoint(job_id=job_id, path=os.path.relpath(path, WORKSPACE_ROOT))
+                        for path in batch
+                    )
+                    _update_job(db, job_id, stats={key: stats[key] for key in STAT_KEYS})
+                db.commit()
+            # Committed objects are not needed again; keep the identity map small.
+            db.expunge_all()
+            committed += len(batch)
+            print(f"[INGEST] {relative_path}: {committed} files committed")
+            if between_batches is not None:
+                between_batches()
+
+        record(INGEST_STAGE_SECONDS, discovery.seconds, "discover")
+        stats.update(
+            total_files=discovery.files_found,
+            ignored_files=discovery.ignored_files,
+            oversized_files=discovery.oversized_files,
+            pruned_dirs=discovery.pruned_dirs,
+            discovery_ms=round(discovery.seconds * 1000.0),
+        )
+
+        if job_id is not None:
+            # Checkpoints only matter while the job can still be retried.
+            db.query(IngestCheckpoint).filter(IngestCheckpoint.job_id == job_id).delete()
+            _update_job(db, job_id, status="completed")
+            db.commit()
+    except Exception:
+        db.rollback()
+        store.discard()
+        raise
     finally:
         db.close()
 
     print(f"[INGEST] {relative_path} -> {stats}")
     return stats
+
+
+def get_ingest_job(db: Session, job_id: str) -> Optional[Dict]:
+    """Status and running totals of an ingestion job, or None if unknown."""
+    job = db.get(IngestJob, job_id)
+    if job is None:
+        return None
+    files_done = db.query(IngestCheckpoint).filter(IngestCheckpoint.job_id == job_id).count()
+    return {
+        "job_id": job.job_id,
+        "relative_path": job.relative_path,
+        "repo_name": job.repo_name,
+        "status": job.status,
+        "files_checkpointed": files_done,
+        "stats": job.stats,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
@@ -1,9 +1,14 @@
 import os
 import time
-from typing import Literal
-from openai import OpenAI
+from functools import lru_cache
+from typing import Literal, Optional
+from openai import APITimeoutError, OpenAI
 
-Provider = Literal["openai", "groq", "deepseek"]
+from ..config import settings, load_ingestion_config
+from ..utils.deadline import Deadline
+from .metrics_service import LLM_SECONDS, record
+
+Provider = Literal["openai", "groq", "deepseek", "mock"]
 
 # Client configurations for each provider
 PROVIDERS = {
@@ -22,13 +27,30 @@ PROVIDERS = {
         "base_url": "https://api.deepseek.com/v1",
         "model": "deepseek-chat",
     },
+    # Local OpenAI-compatible stand-in (benchmarks/mock_llm_server.py) for load tests.
+    "mock": {
+        "api_key_env": "MOCK_LLM_API_KEY",
+        "api_key_default": "mock",
+        "base_url": settings.mock_llm_base_url,
+        "model": "mock-llm",
+    },
 }
 
+# Per-provider overrides from ingestion_config.yaml, e.g. to point "openai"
+# at the mock server during a load test:
+#   llm:
+#     providers:
+#       openai: {base_url: "http://localhost:8100/v1", api_key_default: "mock"}
+for _name, _overrides in (load_ingestion_config().get("llm", {}).get("providers") or {}).items():
+    if _name in PROVIDERS:
+        PROVIDERS[_name] = {**PROVIDERS[_name], **_overrides}
+
 
+@lru_cache(maxsize=None)
 def get_client(provider: Provider) -> OpenAI:
-    """Get OpenAI-compatible client for the specified provider."""
+    """Get OpenAI-compatible client for the specified provider (reused across requests)."""
     config = PROVIDERS[provider]
-    api_key = os.environ.get(config["api_key_env"])
+    api_key = os.environ.get(config["api_key_env"]) or config.get("api_key_default")
     
     if not api_key:
         raise ValueError(f"Missing API key: {config['api_key_env']}")
@@ -38,12 +60,68 @@ def get_client(provider: Provider) -> OpenAI:
     return OpenAI(api_key=api_key)
 
 
+class LLMTimeout(Exception):
+    """The completion was cancelled because the request's deadline passed."""
+
+
+def _complete(provider: Provider, messages: list[dict], endpoint: str, deadline: Optional[Deadline] = None) -> str:
+    """
+    Stream a chat completion and return the full text.
+
+    Streaming lets us observe time-to-first-token separately from the
+    total completion time; both are recorded per provider/endpoint.
+    With a `deadline`, the request is sent once (no client retries) with
+    the time left as its timeout, and the time left is checked again
+    between streamed chunks; the stream is closed (raising LLMTimeout)
+    once the deadline has passed.
+    """
+    start = time.perf_counter()
+    client = get_client(provider)
+    model = PROVIDERS[provider]["model"]
+    if deadline is not None:
+        client = client.with_options(max_retries=0, timeout=deadline.remaining_seconds())
+
+    try:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0.2,
+            stream=True,
+        )
+
+        parts: list[str] = []
+        first_token_at = None
+        for chunk in stream:
+            if deadline is not None and deadline.expired:
+                stream.close()
+                raise LLMTimeout(f"{provider} completion cancelled at the deadline")
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                record(LLM_SECONDS, first_token_at - start, "ttft", provider=provider, endpoint=endpoint)
+            parts.append(delta)
+    except APITimeoutError as e:
+        record(LLM_SECONDS, time.perf_counter() - start, "cancelled", provider=provider, endpoint=endpoint)
+        raise LLMTimeout(f"{provider} completion timed out") from e
+    except LLMTimeout:
+        record(LLM_SECONDS, time.perf_counter() - start, "cancelled", provider=provider, endpoint=endpoint)
+        raise
+
+    record(LLM_SECONDS, time.perf_counter() - start, "total", provider=provider, endpoint=endpoint)
+    return "".join(parts)
+
+
 def generate_rag_answer(
     query: str,
     context_chunks: list[str],
-    provider: Provider = "openai"
+    provider: Provider = "openai",
+    deadline: Optional[Deadline] = None,
 ) -> tuple[str, float]:
-    """Generate answer using retrieved context."""
+    """Generate answer using retrieved context (LLMTimeout if `deadline` passes first)."""
     start = time.time()
     
     context_text = "\n\n---\n\n".join(context_chunks)
@@ -101,16 +179,7 @@ Organize your answer into three numbered sections exactly like this:
 
 # Answer:"""
 
-    client = get_client(provider)
-    model = PROVIDERS[provider]["model"]
-    
-    completion = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.2,
-    )
-    
-    answer = completion.choices[0].message.content
+    answer = _complete(provider, [{"role": "user", "content": prompt}], endpoint="rag", deadline=deadline)
     latency_ms = (time.time() - start) * 1000.0
     return answer, latency_ms
 
@@ -119,16 +188,7 @@ def generate_raw_answer(query: str, provider: Provider = "openai") -> tuple[str,
     """Generate answer without any context (raw LLM)."""
     start = time.time()
     
-    client = get_client(provider)
-    model = PROVIDERS[provider]["model"]
-    
-    completion = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": query}],
-        temperature=0.2,
-    )
-    
-    answer = completion.choices[0].message.content
+    answer = _complete(provider, [{"role": "user", "content": query}], endpoint="raw")
     latency_ms = (time.time() - start) * 1000.0
     return answer, latency_ms
     
\ No newline at end of file
@@ -0,0 +1,163 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Buckets span sub-millisecond SQL up to long LLM completions / large files.
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+SEARCH_STAGE_SECONDS = Histogram(
+    "search_stage_seconds",
+    "Time spent in each retrieval stage (embed, sql, postprocess)",
+    ["endpoint", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+LLM_SECONDS = Histogram(
+    "llm_request_seconds",
+    "LLM latency: time-to-first-token (ttft), full completion (total) and "
+    "time until a completion was cancelled at its deadline (cancelled)",
+    ["provider", "endpoint", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+INGEST_STAGE_SECONDS = Histogram(
+    "ingest_stage_seconds",
+    "Time spent in each per-file ingestion stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# Queue waits range from milliseconds to hours behind bulk jobs.
+QUEUE_WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0, 4 * 3600.0)
+
+INGEST_QUEUE_WAIT_SECONDS = Histogram(
+    "ingest_queue_wait_seconds",
+    "Time from enqueue (or the end of a retry delay) until a worker starts the job, per queue",
+    ["queue"],
+    buckets=QUEUE_WAIT_BUCKETS,
+)
+
+INGEST_EMBEDDINGS = Counter(
+    "ingest_embeddings_total",
+    "Chunk embeddings written at ingestion by source: computed by the model, "
+    "or reused from a near-duplicate file's identical chunk",
+    ["source"],
+)
+
+COALESCED_REQUESTS = Counter(
+    "coalesced_requests_total",
+    "Search/RAG requests by single-flight role: leader computed, "
+    "local/remote follower reused an in-flight result, fallback computed after a failed wait",
+    ["endpoint", "role"],
+)
+
+REPO_SYNC_CHECKS = Counter(
+    "repo_sync_checks_total",
+    "Scheduled repo checks by result: skipped (remote unchanged), synced (ingest queued), "
+    "deferred (concurrency cap reached), failed (ref lookup failed)",
+    ["result"],
+)
+
+SEARCH_DEGRADATIONS = Counter(
+    "search_degradations_total",
+    "Searches that cut corners to meet their deadline_ms, by degradation applied",
+    ["endpoint", "degradation"],
+)
+
+PROFILE_HEADER = "X-Profile"
+
+# Set by the HTTP middleware for the duration of a request.
+_endpoint: ContextVar[str] = ContextVar("metrics_endpoint", default="internal")
+_profile: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("metrics_profile", default=None)
+
+
+def set_endpoint(endpoint: str):
+    return _endpoint.set(endpoint)
+
+
+def reset_endpoint(token) -> None:
+    _endpoint.reset(token)
+
+
+def current_endpoint() -> str:
+    return _endpoint.get()
+
+
+def start_profile():
+    """Enable stage sampling for the current request; returns (token, samples)."""
+    samples: List[Tuple[str, float]] = []
+    return _profile.set(samples), samples
+
+
+def stop_profile(token) -> None:
+    _profile.reset(token)
+
+
+def record(histogram: Histogram, seconds: float, stage: str, **labels) -> None:
+    """Observe a duration and, if profiling is on, add it to the request breakdown."""
+    histogram.labels(stage=stage, **labels).observe(seconds)
+    samples = _profile.get()
+    if samples is not None:
+        samples.append((stage, seconds * 1000.0))
+
+
+@contextmanager
+def timed(histogram: Histogram, stage: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(histogram, time.perf_counter() - start, stage, **labels)
+
+
+def search_stage(stage: str):
+    """Time a retrieval stage, labelled with the current endpoint."""
+    return timed(SEARCH_STAGE_SECONDS, stage, endpoint=current_endpoint())
+
+
+def ingest_stage(stage: str):
+    return timed(INGEST_STAGE_SECONDS, stage)
+
+
+def format_server_timing(samples: List[Tuple[str, float]]) -> str:
+    """Render samples as a Server-Timing header (shown by browser devtools)."""
+    return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in samples)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Prometheus text exposition.
+
+    When PROMETHEUS_MULTIPROC_DIR is set (shared by uvicorn and Dramatiq
+    workers), samples from every process are aggregated.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: Optional[int] = None) -> None:
+    """
+    Drop an exiting process's live-gauge files from PROMETHEUS_MULTIPROC_DIR
+    (its counters and histograms stay, as totals must not go backwards).
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid or os.getpid())
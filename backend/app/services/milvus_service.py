@@ -1,23 +1,218 @@
-from pymilvus import connections, Collection, FieldSchema, CollectionSchema, DataType
-
-connections.connect(
-    alias="default",
-    host="rag_milvus",
-    port="19530"
-)
-
-# Only create schema if not exists
-fields = [
-    FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-    FieldSchema(name="file_path", dtype=DataType.VARCHAR, max_length=512),
-    FieldSchema(name="chunk_index", dtype=DataType.INT64),
-    FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=768)
-]
-schema = CollectionSchema(fields)
-
-try:
-    collection = Collection("chunks")
-except:
-    collection = Collection("chunks", schema)
-
-collection.load()
\ No newline at end of file
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..models import EMBED_DIM, Chunk, File
+from .vector_store import LOW_EFFORT, SearchTimeout, VectorHit, VectorStore, hydrate_hits, top_file_ids
+
+
+def _repo_expr(repo_name: str) -> str:
+    escaped = repo_name.replace("\\", "\\\\").replace('"', '\\"')
+    return f'repo_name == "{escaped}"'
+
+
+class MilvusVectorStore(VectorStore):
+    """
+    Embeddings in a Milvus collection; chunk content stays in Postgres.
+
+    `uri` is either a local file path (Milvus Lite, runs in-process and
+    needs no server, suitable for offline tests) or a server URL such as
+    http://rag_milvus:19530. Nothing connects until first use, and the
+    collection and its index are created lazily with EMBED_DIM.
+
+    Inserts are buffered per thread and written in batches of
+    `insert_batch_size`. Milvus writes are not part of the Postgres
+    transaction; ids of rolled-back chunks are dropped when hits are hydrated.
+    Vectors of replaced chunks are deleted only once the session commits,
+    so a rollback never leaves surviving chunk rows without vectors.
+    """
+
+    name = "milvus"
+
+    def __init__(self, cfg: Dict):
+        self.uri = cfg.get("uri", "/workspace/.milvus/milvus_lite.db")
+        self.token = cfg.get("token", "")
+        self.collection = cfg.get("collection", "chunks")
+        self.index_type = cfg.get("index_type", "AUTOINDEX")
+        self.index_params = cfg.get("index_params", {}) or {}
+        self.batch_size = int(cfg.get("insert_batch_size", 1000))
+        self._client = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # -- connection / collection --------------------------------------------
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._connect()
+        return self._client
+
+    def _connect(self):
+        from pymilvus import MilvusClient
+
+        if "://" not in self.uri:
+            os.makedirs(os.path.dirname(os.path.abspath(self.uri)), exist_ok=True)
+        client = MilvusClient(uri=self.uri, token=self.token)
+        if not client.has_collection(self.collection):
+            self._create_collection(client)
+        client.load_collection(self.collection)
+        return client
+
+    def _create_collection(self, client) -> None:
+        from pymilvus import DataType, MilvusClient
+
+        schema = MilvusClient.create_schema(auto_id=False, enable_dynamic_field=False)
+        schema.add_field("id", DataType.INT64, is_primary=True)  # chunks.id
+        schema.add_field("file_id", DataType.INT64)
+        schema.add_field("repo_name", DataType.VARCHAR, max_length=512)
+        schema.add_field("chunk_index", DataType.INT64)
+        schema.add_field("embedding", DataType.FLOAT_VECTOR, dim=EMBED_DIM)
+
+        index_params = client.prepare_index_params()
+        index_params.add_index(
+            field_name="embedding",
+            index_type=self.index_type,
+            metric_type="L2",
+            params=self.index_params,
+        )
+        client.create_collection(self.collection, schema=schema, index_params=index_params)
+        print(f"[MILVUS] Created collection {self.collection} (dim={EMBED_DIM}, index={self.index_type})")
+
+    # -- writes ---------------------------------------------------------------
+
+    def _pending(self) -> List[Dict]:
+        if not hasattr(self._local, "pending"):
+            self._local.pending = []
+        return self._local.pending
+
+    def upsert(self, db: Session, db_file: File, rows: List[Chunk], embeddings: List[List[float]]) -> None:
+        db.add_all(rows)
+        db.flush()  # assigns chunk ids, used as Milvus primary keys
+        pending = self._pending()
+        for row, emb in zip(rows, embeddings):
+            pending.append({
+                "id": row.id,
+                "file_id": db_file.id,
+                "repo_name": db_file.repo_name or "",
+                "chunk_index": row.chunk_index,
+                "embedding": emb,
+            })
+        if len(pending) >= self.batch_size:
+            self.flush(db)
+
+    def flush(self, db: Session) -> None:
+        pending = self._pending()
+        while pending:
+            batch, pending[:] = pending[:self.batch_size], pending[self.batch_size:]
+            self.client.insert(self.collection, data=batch)
+
+    def discard(self) -> None:
+        self._pending().clear()
+
+    def delete_by_file(self, db: Session, file_id: int) -> None:
+        # By chunk id: the file's replacement chunks share its file_id.
+        ids = [row.id for row in db.query(Chunk.id).filter(Chunk.file_id == file_id)]
+        db.query(Chunk).filter(Chunk.file_id == file_id).delete()
+        if ids:
+            self._deletes_after_commit(db).extend(ids)
+
+    def _deletes_after_commit(self, db: Session) -> List[int]:
+        if "milvus_deletes" not in db.info:
+            db.info["milvus_deletes"] = []
+            event.listen(db, "after_commit", self._apply_deletes)
+            event.listen(db, "after_rollback", lambda session: session.info["milvus_deletes"].clear())
+        return db.info["milvus_deletes"]
+
+    def _apply_deletes(self, db: Session) -> None:
+        ids, db.info["milvus_deletes"] = db.info["milvus_deletes"], []
+        for start in range(0, len(ids), self.batch_size):
+            try:
+                self.client.delete(self.collection, ids=ids[start:start + self.batch_size])
+            except Exception as e:
+                # Leftover vectors are dropped when hits are hydrated.
+                print(f"[MILVUS] Deleting {len(ids)} replaced vectors failed: {e}")
+                return
+
+    def delete_by_repo(self, db: Session, repo_name: str) -> None:
+        self.flush(db)
+        self.client.delete(self.collection, filter=_repo_expr(repo_name))
+
+    # -- reads ----------------------------------------------------------------
+
+    def search(
+        self,
+        db: Session,
+        query_embs: List[List[float]],
+        limit: int,
+        repo_name: Optional[str] = None,
+        top_files: Optional[int] = None,
+        low_effort: bool = False,
+        timeout_ms: Optional[float] = None,
+    ) -> List[List[VectorHit]]:
+        from pymilvus import MilvusException
+
+        start = time.monotonic()
+        try:
+            results = self._search(db, query_embs, limit, repo_name, top_files, low_effort, timeout_ms)
+        except MilvusException as e:
+            if timeout_ms is None or (time.monotonic() - start) * 1000.0 < timeout_ms:
+                raise
+            raise SearchTimeout(f"vector search exceeded {timeout_ms:.0f} ms") from e
+        # Milvus reports squared L2; convert to match pgvector's `<->`.
+        ids_and_distances = [
+            [(int(hit["id"]), math.sqrt(max(float(hit["distance"]), 0.0))) for hit in hits]
+            for hits in results
+        ]
+        return hydrate_hits(db, ids_and_distances)
+
+    def _search(self, db, query_embs, limit, repo_name, top_files, low_effort, timeout_ms):
+        expr = _repo_expr(repo_name) if repo_name is not None else ""
+        search_params = {"metric_type": "L2"}
+        if low_effort and self.index_type.upper() == "HNSW":
+            search_params["params"] = {"ef": max(int(LOW_EFFORT.get("ef_search", 20)), limit)}
+        timeout = timeout_ms / 1000.0 if timeout_ms is not None else None
+        if top_files:
+            # File summaries live in Postgres; Milvus ranks only their chunks.
+            # A filter applies to the whole request, so this is one call per query.
+            results = []
+            for emb, file_ids in zip(query_embs, top_file_ids(db, query_embs, top_files, repo_name)):
+                if not file_ids:
+                    results.append([])
+                    continue
+                [hits] = self.client.search(
+                    self.collection,
+                    data=[emb],
+                    limit=limit,
+                    filter=f"file_id in {[int(i) for i in file_ids]}",
+                    search_params=search_params,
+                    timeout=timeout,
+                )
+                results.append(hits)
+            return results
+        return self.client.search(
+            self.collection,
+            data=query_embs,
+            limit=limit,
+            filter=expr,
+            search_params=search_params,
+            timeout=timeout,
+        )
+
+    def stats(self, db: Session) -> Dict:
+        info = self.client.get_collection_stats(self.collection)
+        return {
+            "backend": self.name,
+            "uri": self.uri,
+            "collection": self.collection,
+            "dim": EMBED_DIM,
+            "index_type": self.index_type,
+            "rows": int(info.get("row_count", 0)),
+        }
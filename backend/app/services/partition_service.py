@@ -0,0 +1,107 @@
+import hashlib
+import re
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..models import PARTITION_BY_REPO
+
+# Children of the partitioned parents; chunks is listed first because it
+# references files and must be detached/dropped before it.
+PARTITIONED_TABLES = ("chunks", "files")
+
+
+def partition_name(table: str, repo_name: str) -> str:
+    """Stable, identifier-safe partition name, e.g. chunks_r_vscode_1a2b3c4d."""
+    slug = re.sub(r"[^a-z0-9]+", "_", repo_name.lower()).strip("_")[:40]
+    digest = hashlib.sha1(repo_name.encode("utf-8")).hexdigest()[:8]
+    return f"{table}_r_{slug}_{digest}"
+
+
+def _literal(value: str) -> str:
+    # Partition bounds are DDL and cannot be bind parameters.
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _lock_repo(db: Session, repo_name: str) -> None:
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"partition:{repo_name}"})
+
+
+def partition_ddl(repo_name: str) -> List[str]:
+    """CREATE statements for a repo's partitions (files first, it is referenced)."""
+    return [
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(table, repo_name)}" '
+        f"PARTITION OF {table} FOR VALUES IN ({_literal(repo_name)})"
+        for table in reversed(PARTITIONED_TABLES)
+    ]
+
+
+def ensure_repo_partition(db: Session, repo_name: str) -> None:
+    """
+    Create the files/chunks partitions for a repo if missing.
+
+    Indexes defined on the parents (including the vector index) are created
+    on the new partitions automatically. No-op when partitioning is off.
+    """
+    if not PARTITION_BY_REPO:
+        return
+    _lock_repo(db, repo_name)
+    for statement in partition_ddl(repo_name):
+        db.execute(text(statement))
+    db.commit()
+
+
+def drop_repo(db: Session, repo_name: str) -> Dict[str, int]:
+    """
+    Remove everything indexed for a repo.
+
+    Partitioned: detach and drop the repo's partitions (a catalog operation,
+    independent of row count). Otherwise: cascading DELETE from files.
+    """
+    if PARTITION_BY_REPO:
+        _lock_repo(db, repo_name)
+        dropped = 0
+        for table in PARTITIONED_TABLES:
+            name = partition_name(table, repo_name)
+            exists = db.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+            if not exists:
+                continue
+            db.execute(text(f'ALTER TABLE {table} DETACH PARTITION "{name}"'))
+            db.execute(text(f'DROP TABLE "{name}"'))
+            dropped += 1
+        # symbols and minhash_bands cannot reference the partitioned files table.
+        db.execute(text("DELETE FROM symbols WHERE repo_name = :repo"), {"repo": repo_name})
+        db.execute(text("DELETE FROM minhash_bands WHERE repo_name = :repo"), {"repo": repo_name})
+        db.commit()
+        return {"partitions_dropped": dropped}
+
+    deleted = db.execute(text("DELETE FROM files WHERE repo_name = :repo"), {"repo": repo_name}).rowcount
+    db.commit()
+    return {"files_deleted": deleted}
+
+
+def reset_repo(db: Session, repo_name: str) -> None:
+    """Swap a repo's partitions for empty ones ahead of a full reindex."""
+    drop_repo(db, repo_name)
+    ensure_repo_partition(db, repo_name)
+
+
+def list_repo_partitions(db: Session) -> List[Dict]:
+    """Per-repo partitions with row estimates and on-disk size."""
+    if not PARTITION_BY_REPO:
+        return []
+    rows = db.execute(text("""
+        SELECT
+            parent.relname AS parent,
+            child.relname AS partition,
+            pg_get_expr(child.relpartbound, child.oid) AS bound,
+            child.reltuples::bigint AS row_estimate,
+            pg_total_relation_size(child.oid) AS total_bytes
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname IN ('files', 'chunks')
+        ORDER BY parent.relname, child.relname
+    """)).fetchall()
+    return [dict(row._mapping) for row in rows]
@@ -0,0 +1,334 @@
+"""
+Online switch to a different embedding model.
+
+While a re-embedding runs, search keeps using chunks.embedding (old model)
+and the new model's vectors are written to chunks.embedding_next /
+files.embedding_next:
+
+1. backfill  - existing chunks are re-embedded in batches, throttled;
+               ingestion writes both columns for files it touches meanwhile
+2. indexing  - the ANN indexes are built on the shadow columns
+3. cutover   - one short transaction renames embedding -> embedding_prev and
+               embedding_next -> embedding (indexes likewise) and makes the
+               target the active model in embedding_state
+4. sweep     - chunks whose vectors are from an older generation than the
+               active one are re-embedded (a re-run after a crash between
+               cutover and sweep resumes here)
+
+Every chunk vector carries the generation of the model that produced it
+(chunks.embedding_generation, and embedding_next_generation for the
+shadow; renamed along with the vectors). Ingestion reads the state inside
+its write transaction after locking chunks (`lock_embedding_state`), so a
+batch that embedded with a model retired meanwhile re-embeds before
+writing. Search processes notice the new active model within
+STATE_TTL_SECONDS. The old vectors stay in embedding_prev until
+`drop_previous_embeddings`.
+"""
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from ..config import load_ingestion_config, settings
+from ..database import engine as default_engine
+from ..migrations import FILE_VECTOR_INDEX_NAME, VECTOR_INDEX_NAME, _is_partitioned, _vector_index_sql
+from ..models import Chunk, EmbeddingState, File
+from .embedding_service import configured_model_name, embed_texts
+from .vector_store import CHUNK_TEXT_SQL, vector_literal, vector_store_config
+
+SHADOW_COLUMN = "embedding_next"
+PREVIOUS_COLUMN = "embedding_prev"
+# chunks only: the generation of the model behind each vector column.
+GENERATION_COLUMNS = {
+    "embedding": "embedding_generation",
+    SHADOW_COLUMN: "embedding_next_generation",
+    PREVIOUS_COLUMN: "embedding_generation_prev",
+}
+SHADOW_INDEXES = {"chunks": f"{VECTOR_INDEX_NAME}_next", "files": f"{FILE_VECTOR_INDEX_NAME}_next"}
+LIVE_INDEXES = {"chunks": VECTOR_INDEX_NAME, "files": FILE_VECTOR_INDEX_NAME}
+
+_cfg = (load_ingestion_config().get("ingestion", {}).get("embedding", {}) or {}).get("reembed", {}) or {}
+BATCH_SIZE = int(_cfg.get("batch_size", 512))
+# Pause between batches so the backfill leaves CPU/IO for serving traffic.
+THROTTLE_SECONDS = float(_cfg.get("throttle_seconds", 0.0))
+
+
+def _state(db: Session) -> EmbeddingState:
+    state = db.get(EmbeddingState, 1)
+    if state is None:
+        state = EmbeddingState(id=1, model=configured_model_name(), dim=settings.embedding_dim, generation=1)
+        db.add(state)
+        db.flush()
+    return state
+
+
+def reembedding_progress(db: Session) -> Dict:
+    """Active model, target and backfill progress."""
+    state = _state(db)
+    db.commit()
+    return {
+        "model": state.model,
+        "dim": state.dim,
+        "generation": state.generation,
+        "target_model": state.target_model,
+        "target_dim": state.target_dim,
+        "status": state.status,
+        "processed": state.processed,
+        "total": state.total,
+        "percent": round(100.0 * state.processed / state.total, 1) if state.total else None,
+        "chunks_per_sec": state.chunks_per_sec,
+        "updated_at": state.updated_at,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Writes
+# ---------------------------------------------------------------------------
+
+def _write_chunk_vectors(conn, ids: List[int], vectors: List[List[float]], column: str, generation: int) -> None:
+    conn.execute(
+        text(f"""
+            UPDATE chunks AS c SET {column} = v.emb, {GENERATION_COLUMNS[column]} = :generation
+            FROM unnest(CAST(:ids AS integer[]), CAST(:embs AS vector[])) AS v(id, emb)
+            WHERE c.id = v.id
+        """),
+        {"ids": ids, "embs": [vector_literal(v) for v in vectors], "generation": generation},
+    )
+
+
+def _write_file_summaries(conn, column: str, file_ids: Optional[List[int]] = None) -> None:
+    scope = "AND file_id = ANY(:file_ids)" if file_ids is not None else ""
+    conn.execute(
+        text(f"""
+            UPDATE files f SET {column} = l2_normalize(s.mean)
+            FROM (
+                SELECT file_id, avg({column}) AS mean FROM chunks
+                WHERE {column} IS NOT NULL {scope}
+                GROUP BY file_id
+            ) s
+            WHERE f.id = s.file_id
+        """),
+        {"file_ids": file_ids},
+    )
+
+
+class LiveEmbeddingState(NamedTuple):
+    model: str
+    generation: int
+    target_model: Optional[str]
+
+
+def lock_embedding_state(db: Session) -> LiveEmbeddingState:
+    """
+    The embedding state as of this write transaction. The ROW EXCLUSIVE lock
+    on chunks conflicts with `cutover`'s, so the state cannot change (nor
+    the columns be renamed) until the caller commits.
+    """
+    db.execute(text("LOCK TABLE chunks IN ROW EXCLUSIVE MODE"))
+    row = db.execute(text("SELECT model, generation, target_model FROM embedding_state WHERE id = 1")).first()
+    if row is None:
+        return LiveEmbeddingState(configured_model_name(), 1, None)
+    return LiveEmbeddingState(row.model, row.generation, row.target_model)
+
+
+def write_shadow_embeddings(
+    db: Session, db_file: File, rows: List[Chunk], chunks: List[str], state: LiveEmbeddingState,
+) -> None:
+    """Ingestion hook: also embed a file's new chunks with the re-embedding target, if any."""
+    if state.target_model is None:
+        return
+    vectors = embed_texts(chunks, model_name=state.target_model)
+    _write_chunk_vectors(db, [row.id for row in rows], vectors, SHADOW_COLUMN, state.generation + 1)
+    _write_file_summaries(db, SHADOW_COLUMN, [db_file.id])
+
+
+def _reembed_batch(conn, column: str, model: str, generation: int, stale: str, min_id: int = 0) -> List[int]:
+    """
+    Embed one batch of chunks matching the `stale` condition into `column`;
+    returns their ids (ascending, empty when none are left).
+    """
+    rows = conn.execute(
+        text(f"""
+            SELECT c.id, c.file_id, {CHUNK_TEXT_SQL} AS content
+            FROM chunks c
+            JOIN files f ON c.file_id = f.id
+            WHERE {stale} AND c.id > :min_id
+            ORDER BY c.id
+            LIMIT :limit
+        """),
+        {"min_id": min_id, "limit": BATCH_SIZE, "generation": generation},
+    ).fetchall()
+    if not rows:
+        return []
+    vectors = embed_texts([row.content for row in rows], model_name=model)
+    _write_chunk_vectors(conn, [row.id for row in rows], vectors, column, generation)
+    _write_file_summaries(conn, column, sorted({row.file_id for row in rows}))
+    return [row.id for row in rows]
+
+
+# The shadow only ever holds the target's vectors, so a missing one is all
+# there is to fill; live vectors are stale when an older model wrote them.
+_MISSING_SHADOW = f"c.{SHADOW_COLUMN} IS NULL"
+_STALE_LIVE = f"c.{GENERATION_COLUMNS['embedding']} < :generation"
+
+
+def _set_state(conn, **values) -> None:
+    assignments = ", ".join(f"{key} = :{key}" for key in values)
+    conn.execute(text(f"UPDATE embedding_state SET {assignments}, updated_at = now() WHERE id = 1"), values)
+
+
+# ---------------------------------------------------------------------------
+# Phases
+# ---------------------------------------------------------------------------
+
+def start_reembedding(engine: Engine, target_model: str) -> int:
+    """Record the target and (re)create the shadow columns for its dimension; returns its generation."""
+    target_dim = len(embed_texts(["dimension probe"], model_name=target_model)[0])
+    with Session(engine) as db:
+        state = _state(db)
+        if state.model == target_model:
+            raise ValueError(f"{target_model} is already the active embedding model")
+        resume = state.target_model == target_model and state.target_dim == target_dim
+        target_generation = state.generation + 1
+        db.commit()
+
+    with engine.begin() as conn:
+        for table in ("chunks", "files"):
+            if not resume:
+                conn.execute(text(f"ALTER TABLE {table} DROP COLUMN IF EXISTS {SHADOW_COLUMN}"))
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {SHADOW_COLUMN} vector({target_dim})"))
+        if not resume:
+            conn.execute(text(f"ALTER TABLE chunks DROP COLUMN IF EXISTS {GENERATION_COLUMNS[SHADOW_COLUMN]}"))
+        conn.execute(text(f"ALTER TABLE chunks ADD COLUMN IF NOT EXISTS {GENERATION_COLUMNS[SHADOW_COLUMN]} INTEGER"))
+        total = conn.execute(text("SELECT COUNT(*) FROM chunks")).scalar()
+        _set_state(conn, target_model=target_model, target_dim=target_dim, status="backfilling", total=total)
+    print(f"[REEMBED] {'Resuming' if resume else 'Starting'} re-embedding with {target_model} (dim={target_dim})")
+    return target_generation
+
+
+def backfill(engine: Engine, target_model: str, target_generation: int) -> None:
+    """Fill the shadow column in throttled batches until no chunk is missing."""
+    start = time.time()
+    done = 0
+    with engine.connect() as conn:
+        remaining = conn.execute(text(f"SELECT COUNT(*) FROM chunks WHERE {SHADOW_COLUMN} IS NULL")).scalar()
+        total = conn.execute(text("SELECT COUNT(*) FROM chunks")).scalar()
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            ids = _reembed_batch(conn, SHADOW_COLUMN, target_model, target_generation, _MISSING_SHADOW, last_id)
+            done += len(ids)
+            rate = done / (time.time() - start) if done else 0.0
+            _set_state(conn, processed=total - remaining + done, total=total, chunks_per_sec=round(rate, 1))
+        if not ids:
+            break
+        last_id = ids[-1]
+        print(f"[REEMBED] {total - remaining + done}/{total} chunks ({rate:.0f}/s)")
+        if THROTTLE_SECONDS:
+            time.sleep(THROTTLE_SECONDS)
+
+
+def build_shadow_indexes(engine: Engine) -> None:
+    with engine.begin() as conn:
+        _set_state(conn, status="indexing")
+    for table, name in SHADOW_INDEXES.items():
+        with engine.connect() as conn:
+            partitioned = _is_partitioned(conn, table)
+        print(f"[REEMBED] Building {name} ...")
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("SET maintenance_work_mem = '1GB'"))
+            conn.execute(text(_vector_index_sql(
+                concurrently=not partitioned, table=table, name=name, column=SHADOW_COLUMN
+            )))
+
+
+def _rename_index(conn: Connection, old: str, new: str) -> None:
+    conn.execute(text(f'ALTER INDEX IF EXISTS "{old}" RENAME TO "{new}"'))
+
+
+def _rename_column(conn: Connection, table: str, old: str, new: str) -> None:
+    conn.execute(text(f"ALTER TABLE {table} DROP COLUMN IF EXISTS {new}"))
+    conn.execute(text(f"ALTER TABLE {table} RENAME COLUMN {old} TO {new}"))
+
+
+def cutover(engine: Engine, target_model: str, target_generation: int) -> None:
+    """Swap the shadow columns (and their generations) in atomically."""
+    with engine.begin() as conn:
+        # Writers wait for the swap; readers only for the instant of the renames.
+        conn.execute(text("LOCK TABLE files, chunks IN SHARE ROW EXCLUSIVE MODE"))
+        last_id = 0
+        while True:
+            ids = _reembed_batch(conn, SHADOW_COLUMN, target_model, target_generation, _MISSING_SHADOW, last_id)
+            if not ids:
+                break
+            last_id = ids[-1]
+        state = conn.execute(text("SELECT target_dim FROM embedding_state WHERE id = 1")).first()
+        for table in ("chunks", "files"):
+            _rename_column(conn, table, "embedding", PREVIOUS_COLUMN)
+            _rename_column(conn, table, SHADOW_COLUMN, "embedding")
+            _rename_index(conn, LIVE_INDEXES[table], f"{LIVE_INDEXES[table]}_prev")
+            _rename_index(conn, SHADOW_INDEXES[table], LIVE_INDEXES[table])
+        _rename_column(conn, "chunks", GENERATION_COLUMNS["embedding"], GENERATION_COLUMNS[PREVIOUS_COLUMN])
+        _rename_column(conn, "chunks", GENERATION_COLUMNS[SHADOW_COLUMN], GENERATION_COLUMNS["embedding"])
+        _set_state(
+            conn,
+            model=target_model,
+            dim=state.target_dim,
+            generation=target_generation,
+            target_model=None,
+            target_dim=None,
+            status="cutover",
+        )
+    print(f"[REEMBED] Cut over to {target_model} (generation {target_generation})")
+
+
+def sweep(engine: Engine, model: str, generation: int) -> None:
+    """
+    Re-embed live vectors written by an older model than `generation`.
+    Writers check the generation under their chunks lock, so this only
+    catches writes that bypassed `lock_embedding_state`.
+    """
+    swept = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            ids = _reembed_batch(conn, "embedding", model, generation, _STALE_LIVE, last_id)
+        if not ids:
+            break
+        swept += len(ids)
+        last_id = ids[-1]
+    with engine.begin() as conn:
+        _set_state(conn, status="idle")
+    print(f"[REEMBED] Swept {swept} chunks embedded by an older model")
+
+
+def run_reembedding(target_model: str, engine: Engine = default_engine) -> None:
+    """All phases; safe to re-run after a crash (the backfill or the sweep resumes)."""
+    if vector_store_config().get("backend", "pgvector") != "pgvector":
+        raise RuntimeError("Online re-embedding is only supported for the pgvector store")
+    start = time.time()
+    with Session(engine) as db:
+        state = _state(db)
+        cut_over = state.status == "cutover" and state.model == target_model
+        generation = state.generation
+        db.commit()
+    if cut_over:
+        print(f"[REEMBED] Already cut over to {target_model}; resuming the sweep")
+    else:
+        generation = start_reembedding(engine, target_model)
+        backfill(engine, target_model, generation)
+        build_shadow_indexes(engine)
+        cutover(engine, target_model, generation)
+    sweep(engine, target_model, generation)
+    print(f"[REEMBED] Done in {time.time() - start:.1f}s; drop old vectors with "
+          f"`python -m app.migrations reembed-cleanup`")
+
+
+def drop_previous_embeddings(engine: Engine = default_engine) -> None:
+    with engine.begin() as conn:
+        for table in ("chunks", "files"):
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN IF EXISTS {PREVIOUS_COLUMN}"))
+        conn.execute(text(f"ALTER TABLE chunks DROP COLUMN IF EXISTS {GENERATION_COLUMNS[PREVIOUS_COLUMN]}"))
+    print("[REEMBED] Dropped previous-model embeddings")
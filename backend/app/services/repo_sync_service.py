@@ -0,0 +1,175 @@
+"""
+Periodic sync of the git repos in `ingestion.repos` marked `auto_update`.
+
+Each check is a single `git ls-remote` of the repo's branch, compared with
+the commit of the last completed ingest; only a changed head queues a git
+ingestion (fetch + walk). Checks are spread out by a random jitter added to
+each repo's interval, and at most `max_concurrent` syncs are in flight.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..config import load_ingestion_config, settings
+from ..ingestion.git_ingest import remote_head, safe_repo_name_from_url
+from ..models import RepoSync
+from .metrics_service import REPO_SYNC_CHECKS
+
+_cfg = load_ingestion_config().get("ingestion", {}).get("sync", {}) or {}
+INTERVAL_SECONDS = int(_cfg.get("interval_seconds", 900))
+JITTER_SECONDS = int(_cfg.get("jitter_seconds", 60))
+MAX_CONCURRENT = int(_cfg.get("max_concurrent", 2))
+# A sync still marked "syncing" after this long is assumed dead (worker killed).
+TIMEOUT_SECONDS = int(_cfg.get("timeout_seconds", 7200))
+POLL_SECONDS = int(_cfg.get("poll_seconds", 30))
+# Checks run inside the scheduler's locked transaction; an unreachable
+# remote fails the check instead of holding it.
+LS_REMOTE_TIMEOUT_SECONDS = float(_cfg.get("ls_remote_timeout_seconds", 30))
+
+# pg_try_advisory_xact_lock key: one scheduler tick at a time across processes.
+_SCHEDULER_LOCK = 0x7265706F
+
+Enqueue = Callable[[str, str, str], None]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _relative_path(path: str, repo_name: str) -> str:
+    # Configured paths are absolute (/workspace/...); ingestion wants them relative.
+    if not path:
+        return f"repos/{repo_name}"
+    root = settings.workspace_root.rstrip("/") + "/"
+    return path[len(root):] if path.startswith(root) else path
+
+
+def configured_repos() -> List[Dict]:
+    """Repos with `auto_update: true`, with their sync interval and workspace path."""
+    repos = []
+    for repo in load_ingestion_config().get("ingestion", {}).get("repos", []) or []:
+        if not repo.get("auto_update", False):
+            continue
+        name = safe_repo_name_from_url(repo["url"])
+        repos.append({
+            "repo_name": name,
+            "url": repo["url"],
+            "branch": repo.get("branch", "main"),
+            "relative_path": _relative_path(repo.get("path", ""), name),
+            "interval_seconds": int(repo.get("sync_interval_seconds", INTERVAL_SECONDS)),
+        })
+    return repos
+
+
+def _get_state(db: Session, repo_name: str, url: str, branch: str) -> RepoSync:
+    state = db.get(RepoSync, repo_name)
+    if state is None:
+        state = RepoSync(repo_name=repo_name, url=url, branch=branch, status="idle", checks=0, skipped=0, syncs=0)
+        db.add(state)
+    state.url, state.branch = url, branch
+    return state
+
+
+def _in_flight(db: Session) -> int:
+    cutoff = _now() - timedelta(seconds=TIMEOUT_SECONDS)
+    return db.query(RepoSync).filter(RepoSync.status == "syncing", RepoSync.sync_started_at > cutoff).count()
+
+
+def check_repos(db: Session, enqueue: Enqueue, force: bool = False) -> Dict[str, int]:
+    """
+    One scheduler tick: look up the remote head of every due repo and queue
+    an ingest for those that changed. `force` ignores the intervals.
+    Returns counts per result.
+    """
+    counts = {"skipped": 0, "synced": 0, "deferred": 0, "failed": 0, "not_due": 0}
+    if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _SCHEDULER_LOCK}).scalar():
+        return counts
+    in_flight = _in_flight(db)
+
+    for repo in configured_repos():
+        state = _get_state(db, repo["repo_name"], repo["url"], repo["branch"])
+        now = _now()
+        due = force or state.next_check_at is None or state.next_check_at <= now
+        running = (
+            state.status == "syncing"
+            and state.sync_started_at is not None
+            and state.sync_started_at > now - timedelta(seconds=TIMEOUT_SECONDS)
+        )
+        if not due or running:
+            counts["not_due"] += 1
+            continue
+
+        state.checks += 1
+        state.last_checked_at = now
+        state.next_check_at = now + timedelta(seconds=repo["interval_seconds"] + random.uniform(0, JITTER_SECONDS))
+        try:
+            head = remote_head(repo["url"], repo["branch"], timeout=LS_REMOTE_TIMEOUT_SECONDS)
+        except RuntimeError as e:
+            head, state.error = None, str(e)
+        if head is None:
+            result = "failed"
+            state.error = state.error or f"Branch {repo['branch']} not found"
+        elif head == state.last_commit:
+            result = "skipped"
+            state.skipped += 1
+        elif in_flight >= MAX_CONCURRENT:
+            # Check again on the next tick rather than after a full interval.
+            result = "deferred"
+            state.next_check_at = now
+        else:
+            result = "synced"
+            in_flight += 1
+            state.syncs += 1
+            state.status, state.sync_started_at, state.error = "syncing", now, None
+            enqueue(repo["url"], repo["relative_path"], repo["branch"])
+        counts[result] += 1
+        REPO_SYNC_CHECKS.labels(result=result).inc()
+        print(f"[SYNC] {repo['repo_name']}: {result} (remote={head}, ingested={state.last_commit})")
+
+    db.commit()
+    return counts
+
+
+def mark_sync_started(db: Session, repo_url: str, branch: str) -> None:
+    state = _get_state(db, safe_repo_name_from_url(repo_url), repo_url, branch)
+    state.status, state.sync_started_at = "syncing", _now()
+    db.commit()
+
+
+def mark_sync_finished(db: Session, repo_url: str, branch: str, commit: Optional[str], error: Optional[str] = None) -> None:
+    """Record the ingested commit (what the next ref lookup is compared with) or the failure."""
+    state = _get_state(db, safe_repo_name_from_url(repo_url), repo_url, branch)
+    if error is None:
+        state.status, state.last_commit, state.last_synced_at, state.error = "idle", commit, _now(), None
+    else:
+        state.status, state.error = "failed", error
+    db.commit()
+
+
+def forget_repo_sync(db: Session, repo_name: str) -> None:
+    """Drop a repo's sync state, so its next check re-ingests it."""
+    db.query(RepoSync).filter(RepoSync.repo_name == repo_name).delete()
+    db.commit()
+
+
+def repo_sync_status(db: Session) -> List[Dict]:
+    return [
+        {
+            "repo_name": s.repo_name,
+            "url": s.url,
+            "branch": s.branch,
+            "status": s.status,
+            "last_commit": s.last_commit,
+            "checks": s.checks,
+            "skipped": s.skipped,
+            "syncs": s.syncs,
+            "error": s.error,
+            "last_checked_at": s.last_checked_at,
+            "next_check_at": s.next_check_at,
+            "last_synced_at": s.last_synced_at,
+        }
+        for s in db.query(RepoSync).order_by(RepoSync.repo_name)
+    ]
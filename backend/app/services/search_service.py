@@ -1,61 +1,51 @@
 import time
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 
-from .embedding_service import embed_texts
-from .llm_service import generate_rag_answer
+from .embedding_service import embed_query, embed_texts, refresh_embedding_models
+from .llm_service import LLMTimeout, generate_rag_answer
+from .metrics_service import SEARCH_DEGRADATIONS, current_endpoint, search_stage
+from .symbol_service import ENABLED as SYMBOLS_ENABLED, answers_alone, exact_hits
+from .vector_store import SearchTimeout, StaleQueryEmbedding, get_vector_store
+from ..config import load_ingestion_config
 from ..schemas import (
     SearchResult, SearchResponse, RetrievalMetrics,
-    RagSearchResponse, GenerationMetrics
+    RagSearchResponse, GenerationMetrics, BatchMetrics
 )
+from ..utils.deadline import Deadline
 
+_deadline_cfg = (load_ingestion_config().get("search", {}) or {}).get("deadline", {}) or {}
+# With less than this left when the vector search starts, fetch only top_k
+# candidates and search the ANN index with search.deadline.low_effort.
+LOW_BUDGET_MS = float(_deadline_cfg.get("low_budget_ms", 150))
+# Budget held back from the query embedding for the vector search.
+SQL_RESERVE_MS = float(_deadline_cfg.get("sql_reserve_ms", 50))
+# With less than this left after retrieval, skip generation.
+MIN_LLM_MS = float(_deadline_cfg.get("min_llm_ms", 500))
+# Keep one result per distinct chunk text; copies in near-duplicate files
+# are listed on it as duplicate_paths.
+COLLAPSE_DUPLICATES = bool((load_ingestion_config().get("search", {}) or {}).get("collapse_duplicates", True))
 
-def semantic_search(
-    db: Session,
-    query: str,
-    top_k: int = 5,
-    min_similarity: float = 0.0
-) -> Tuple[List[SearchResult], RetrievalMetrics]:
-    """
-    Perform semantic search with similarity scoring and filtering.
-    
-    Returns:
-        Tuple of (filtered results, retrieval metrics)
-    """
-    start_time = time.time()
-    
-    # 1. Embed the query
-    [query_emb] = embed_texts([query])
-    
-    # Convert embedding array to pgvector literal
-    vect_literal = f"[{','.join(str(x) for x in query_emb)}]"
-    
-    # 2. Search in Postgres using pgvector L2 distance
+
+def _fetch_limit(top_k: int) -> int:
     # Fetch more than top_k to allow for filtering
-    fetch_limit = min(top_k * 2, 50)
-    
-    rows = db.execute(
-        text("""
-            SELECT
-                f.path AS file_path,
-                c.chunk_index AS chunk_index,
-                c.content AS content,
-                c.embedding <-> (:query_emb)::vector AS distance
-            FROM chunks c
-            JOIN files f ON c.file_id = f.id
-            ORDER BY distance ASC
-            LIMIT :fetch_limit
-        """),
-        {
-            "query_emb": vect_literal,
-            "fetch_limit": fetch_limit,
-        }
-    ).fetchall()
-    
-    # 3. Convert to results and apply min_similarity filter
+    return min(top_k * 2, 50)
+
+
+def _degrade(deadline: Deadline, degradation: str) -> None:
+    deadline.degrade(degradation)
+    SEARCH_DEGRADATIONS.labels(endpoint=current_endpoint(), degradation=degradation).inc()
+
+
+def _build_results(rows, top_k: int, min_similarity: float) -> Tuple[List[SearchResult], int]:
+    """Convert rows to results, collapse copies, apply min_similarity and cut to top_k."""
     all_results: List[SearchResult] = []
+    by_content = {}
     for row in rows:
+        if COLLAPSE_DUPLICATES and row.content in by_content:
+            # Rows arrive closest first, so the kept copy ranks highest.
+            by_content[row.content].duplicate_paths.append(row.file_path)
+            continue
         distance = float(row.distance)
         # Convert L2 distance to similarity score (0-1 range)
         # Using formula: similarity = 1 / (1 + distance)
@@ -63,53 +53,244 @@ def semantic_search(
         similarity = 1.0 / (1.0 + distance)
         
         snippet = row.content[:500].replace("\n", " ")
-        all_results.append(
-            SearchResult(
-                file_path=row.file_path,
-                chunk_index=row.chunk_index,
-                content_snippet=snippet,
-                similarity=round(similarity, 3),
-            )
+        result = SearchResult(
+            file_path=row.file_path,
+            chunk_index=row.chunk_index,
+            content_snippet=snippet,
+            similarity=round(similarity, 3),
         )
+        by_content[row.content] = result
+        all_results.append(result)
     
-    # 4. Filter by min_similarity and limit to top_k
     filtered_results = [r for r in all_results if r.similarity >= min_similarity]
     results_filtered = len(all_results) - len(filtered_results)
-    final_results = filtered_results[:top_k]
-    
-    # 5. Calculate metrics
-    latency_ms = (time.time() - start_time) * 1000
-    
+    return filtered_results[:top_k], results_filtered
+
+
+def _symbol_results(rows) -> List[SearchResult]:
+    return [
+        SearchResult(
+            file_path=row.file_path,
+            chunk_index=row.chunk_index,
+            content_snippet=row.content[:500].replace("\n", " "),
+            similarity=1.0,
+            symbol=row.symbol,
+        )
+        for row in rows
+    ]
+
+
+def _merge_boosted(boosted: List[SearchResult], results: List[SearchResult], top_k: int) -> List[SearchResult]:
+    """Exact symbol hits first, then vector results not already among them."""
+    seen = {(r.file_path, r.chunk_index) for r in boosted}
+    return (boosted + [r for r in results if (r.file_path, r.chunk_index) not in seen])[:top_k]
+
+
+def _build_metrics(
+    final_results: List[SearchResult],
+    results_filtered: int,
+    latency_ms: float,
+) -> RetrievalMetrics:
     top_similarity = final_results[0].similarity if final_results else 0.0
     avg_similarity = (
         sum(r.similarity for r in final_results) / len(final_results)
         if final_results else 0.0
     )
     
-    metrics = RetrievalMetrics(
+    return RetrievalMetrics(
         latency_ms=round(latency_ms, 1),
         top_similarity=round(top_similarity, 3),
         avg_similarity=round(avg_similarity, 3),
         results_returned=len(final_results),
         results_filtered=results_filtered,
     )
+
+
+def semantic_search(
+    db: Session,
+    query: str,
+    top_k: int = 5,
+    min_similarity: float = 0.0,
+    query_embedding: Optional[List[float]] = None,
+    repo_name: Optional[str] = None,
+    top_files: Optional[int] = None,
+    deadline: Optional[Deadline] = None,
+) -> Tuple[List[SearchResult], RetrievalMetrics]:
+    """
+    Perform semantic search with similarity scoring and filtering.
+    
+    `repo_name` restricts the search to one repository. `top_files` switches
+    to coarse-to-fine search: only chunks of the N files whose summary
+    embeddings are nearest the query are ranked. `query_embedding`
+    skips the embedding step (used by benchmarks that drive the search with
+    synthetic vectors).
+    
+    A query that is a bare identifier or file path is first looked up in
+    the symbol index; its definitions rank first (similarity 1.0), and with
+    `search.symbols.short_circuit` exact, case-sensitive matches of classes,
+    functions and methods are the whole answer.
+    
+    With a `deadline`, stages degrade rather than overrun it, recording what
+    they did in `deadline.degradations`: an embedding that doesn't arrive in
+    time returns the symbol hits alone ("embedding_timeout"), a short budget
+    searches fewer candidates with less ANN effort ("reduced_candidates",
+    "reduced_ann_effort"), and a vector search past the deadline is
+    cancelled ("retrieval_timeout").
+    
+    A query embedded with a model retired by a re-embedding cutover (of a
+    different dimension) returns the symbol hits alone and refreshes the
+    cached model for the next query ("embedding_model_changed").
+    
+    Returns:
+        Tuple of (filtered results, retrieval metrics)
+    """
+    start_time = time.time()
+    
+    # 0. Exact symbol / path hits from the symbol index
+    boosted: List[SearchResult] = []
+    if SYMBOLS_ENABLED and query_embedding is None:
+        with search_stage("symbols"):
+            hits = exact_hits(db, query, repo_name=repo_name, limit=top_k)
+            boosted = _symbol_results(hits)
+        if answers_alone(query, hits):
+            latency_ms = (time.time() - start_time) * 1000
+            return boosted, _build_metrics(boosted, 0, latency_ms)
+    
+    # 1. Embed the query (repeated queries come from the embedding cache)
+    if query_embedding is not None:
+        query_emb = query_embedding
+    elif deadline is None:
+        with search_stage("embed"):
+            query_emb = embed_query(query)
+    else:
+        with search_stage("embed"):
+            query_emb = embed_query(query, timeout_seconds=(deadline.remaining_ms() - SQL_RESERVE_MS) / 1000.0)
+        if query_emb is None:
+            _degrade(deadline, "embedding_timeout")
+            latency_ms = (time.time() - start_time) * 1000
+            return boosted, _build_metrics(boosted, 0, latency_ms)
+    
+    # 2. Nearest chunks by L2 distance from the configured vector store
+    limit, low_effort, timeout_ms = _fetch_limit(top_k), False, None
+    if deadline is not None:
+        timeout_ms = deadline.remaining_ms()
+        if timeout_ms < LOW_BUDGET_MS:
+            limit, low_effort = top_k, True
+            _degrade(deadline, "reduced_candidates")
+            _degrade(deadline, "reduced_ann_effort")
+    with search_stage("sql"):
+        try:
+            [rows] = get_vector_store().search(
+                db, [query_emb], limit=limit, repo_name=repo_name, top_files=top_files,
+                low_effort=low_effort, timeout_ms=timeout_ms,
+            )
+        except SearchTimeout:
+            _degrade(deadline, "retrieval_timeout")
+            rows = []
+        except StaleQueryEmbedding:
+            refresh_embedding_models()
+            if deadline is not None:
+                _degrade(deadline, "embedding_model_changed")
+            rows = []
+    
+    # 3. Convert to results, filter by min_similarity and limit to top_k
+    with search_stage("postprocess"):
+        final_results, results_filtered = _build_results(rows, top_k, min_similarity)
+        if boosted:
+            final_results = _merge_boosted(boosted, final_results, top_k)
+    
+    # 4. Calculate metrics
+    latency_ms = (time.time() - start_time) * 1000
+    metrics = _build_metrics(final_results, results_filtered, latency_ms)
     
     return final_results, metrics
 
 
+def batch_semantic_search(
+    db: Session,
+    queries: List[str],
+    top_k: int = 5,
+    min_similarity: float = 0.0,
+    repo_name: Optional[str] = None,
+    top_files: Optional[int] = None,
+) -> Tuple[List[Tuple[List[SearchResult], RetrievalMetrics]], BatchMetrics]:
+    """
+    Semantic search for many queries with one embedding pass and one
+    vector-store round trip (for pgvector, a LATERAL top-k per query vector).
+    
+    Each result set's `latency_ms` is its own post-processing time plus an
+    equal share of the batch's embedding and SQL time. Queries embedded with
+    a model retired by a re-embedding cutover get empty result sets.
+    
+    Returns:
+        Tuple of (per-query (results, metrics), aggregate batch metrics)
+    """
+    start_time = time.time()
+    
+    # 1. Embed all queries in a single model call
+    embed_start = time.time()
+    with search_stage("embed"):
+        query_embs = embed_texts(queries)
+    embed_ms = (time.time() - embed_start) * 1000
+    
+    # 2. Resolve every top-k list in one round trip
+    sql_start = time.time()
+    with search_stage("sql"):
+        try:
+            rows_by_query = get_vector_store().search(
+                db, query_embs, limit=_fetch_limit(top_k), repo_name=repo_name, top_files=top_files
+            )
+        except StaleQueryEmbedding:
+            refresh_embedding_models()
+            rows_by_query = [[] for _ in queries]
+    sql_ms = (time.time() - sql_start) * 1000
+    
+    # 3. Build each query's result set
+    post_start = time.time()
+    shared_ms = (embed_ms + sql_ms) / len(queries)
+    result_sets: List[Tuple[List[SearchResult], RetrievalMetrics]] = []
+    with search_stage("postprocess"):
+        for query_rows in rows_by_query:
+            set_start = time.time()
+            final_results, results_filtered = _build_results(query_rows, top_k, min_similarity)
+            own_ms = (time.time() - set_start) * 1000
+            result_sets.append(
+                (final_results, _build_metrics(final_results, results_filtered, shared_ms + own_ms))
+            )
+    post_ms = (time.time() - post_start) * 1000
+    
+    batch_metrics = BatchMetrics(
+        queries=len(queries),
+        latency_ms=round((time.time() - start_time) * 1000, 1),
+        embed_ms=round(embed_ms, 1),
+        sql_ms=round(sql_ms, 1),
+        postprocess_ms=round(post_ms, 1),
+    )
+    return result_sets, batch_metrics
+
+
 def rag_search(
     db: Session,
     query: str,
     top_k: int = 5,
     min_similarity: float = 0.0,
-    provider: str = "openai"
+    provider: str = "openai",
+    repo_name: Optional[str] = None,
+    top_files: Optional[int] = None,
+    deadline: Optional[Deadline] = None,
 ) -> RagSearchResponse:
     """
     Full RAG search: retrieval + LLM generation.
+    
+    With a `deadline`, retrieval degrades as in `semantic_search`, and
+    generation is skipped when less than MIN_LLM_MS is left ("llm_skipped")
+    or cancelled when the deadline passes mid-answer ("llm_timeout"); either
+    way the response carries the retrieved results with an empty answer.
     """
     # 1. Retrieve relevant chunks
     results, retrieval_metrics = semantic_search(
-        db, query=query, top_k=top_k, min_similarity=min_similarity
+        db, query=query, top_k=top_k, min_similarity=min_similarity,
+        repo_name=repo_name, top_files=top_files, deadline=deadline,
     )
     
     # 2. Build context for LLM
@@ -120,7 +301,16 @@ def rag_search(
     context_tokens = len(context_text) // 4
     
     # 3. Generate answer with LLM using selected provider
-    answer, llm_latency = generate_rag_answer(query, context_chunks, provider=provider)
+    if deadline is not None and deadline.remaining_ms() < MIN_LLM_MS:
+        _degrade(deadline, "llm_skipped")
+        answer, llm_latency = "", 0.0
+    else:
+        llm_start = time.time()
+        try:
+            answer, llm_latency = generate_rag_answer(query, context_chunks, provider=provider, deadline=deadline)
+        except LLMTimeout:
+            _degrade(deadline, "llm_timeout")
+            answer, llm_latency = "", (time.time() - llm_start) * 1000.0
     
     # 4. Count unique source files
     unique_sources = len(set(r.file_path for r in results))
@@ -137,6 +327,7 @@ def rag_search(
         results=results,
         retrieval_metrics=retrieval_metrics,
         generation_metrics=generation_metrics,
+        degradations=deadline.degradations if deadline is not None else [],
     )
     
 # from typing import List
@@ -0,0 +1,345 @@
+"""
+Index snapshots: export files/chunks/symbols with their embeddings, and
+bulk-load them into another database, so a new node does not have to clone
+and re-embed every repo.
+
+A snapshot is a directory with a manifest.json and, per table, parts of at
+most ROWS_PER_PART rows. Each part stores one NumPy file per column:
+
+    <col>.npy                    integers (int64)
+    <col>.offsets.npy + .bytes.npy  UTF-8 text, Arrow-style (n + 1 offsets)
+    <col>.npy (n x dim float32)  vectors
+    <col>.null.npy               bool mask, only for columns with NULLs
+
+An incremental snapshot (`since`) holds only files whose generation (see
+files_generation_seq) is above `since`, their chunks and symbols, plus every
+live (repo_name, path) so the import can drop files deleted at the source.
+Pass the previous snapshot's manifest "generation" as `since`. Export while
+no ingestion is committing: a write still in flight when the export starts
+can commit with a generation below the one recorded.
+"""
+import io
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import engine as default_engine
+from .partition_service import ensure_repo_partition
+from .vector_store import vector_store_config
+
+FORMAT_VERSION = 1
+ROWS_PER_PART = 100_000
+
+# (column, kind); kind is "int", "str" or "vector". Order is the COPY order.
+TABLE_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    "files": [
+        ("id", "int"), ("path", "str"), ("hash", "str"), ("repo_name", "str"), ("last_commit", "str"),
+        ("content", "str"), ("embedding", "vector"), ("generation", "int"),
+    ],
+    "chunks": [
+        ("id", "int"), ("file_id", "int"), ("repo_name", "str"), ("chunk_index", "int"),
+        ("content", "str"), ("start_offset", "int"), ("end_offset", "int"), ("embedding", "vector"),
+    ],
+    "symbols": [
+        ("id", "int"), ("name", "str"), ("kind", "str"), ("file_id", "int"), ("repo_name", "str"),
+        ("chunk_index", "int"), ("line", "int"),
+    ],
+    "live_files": [("repo_name", "str"), ("path", "str")],
+}
+
+
+# ---------------------------------------------------------------------------
+# Column files
+# ---------------------------------------------------------------------------
+
+def _save_column(part_dir: str, name: str, kind: str, values: List, dim: int) -> None:
+    nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+    if nulls.any():
+        np.save(os.path.join(part_dir, f"{name}.null.npy"), nulls)
+    if kind == "int":
+        np.save(os.path.join(part_dir, f"{name}.npy"), np.array([v or 0 for v in values], dtype=np.int64))
+    elif kind == "vector":
+        matrix = np.zeros((len(values), dim), dtype=np.float32)
+        for idx, vec in enumerate(values):
+            if vec is not None:
+                matrix[idx] = vec
+        np.save(os.path.join(part_dir, f"{name}.npy"), matrix)
+    else:
+        encoded = [(v or "").encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        np.save(os.path.join(part_dir, f"{name}.offsets.npy"), offsets)
+        np.save(os.path.join(part_dir, f"{name}.bytes.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+
+def _load_column(part_dir: str, name: str, kind: str) -> List:
+    null_path = os.path.join(part_dir, f"{name}.null.npy")
+    if kind == "str":
+        offsets = np.load(os.path.join(part_dir, f"{name}.offsets.npy"))
+        data = np.load(os.path.join(part_dir, f"{name}.bytes.npy")).tobytes()
+        values = [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+    else:
+        values = list(np.load(os.path.join(part_dir, f"{name}.npy")))
+        if kind == "int":
+            values = [int(v) for v in values]
+    if os.path.exists(null_path):
+        for idx in np.flatnonzero(np.load(null_path)):
+            values[idx] = None
+    return values
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def _select_sql(table: str, since: Optional[int]) -> str:
+    if table == "live_files":
+        return "SELECT t.repo_name, t.path FROM files t ORDER BY t.id"
+    cols = ", ".join(
+        f"t.{col}::real[] AS {col}" if kind == "vector" else f"t.{col}"
+        for col, kind in TABLE_COLUMNS[table]
+    )
+    if since is None:
+        return f"SELECT {cols} FROM {table} t ORDER BY t.id"
+    if table == "files":
+        return f"SELECT {cols} FROM files t WHERE COALESCE(t.generation, 0) > :since ORDER BY t.id"
+    return f"""
+        SELECT {cols} FROM {table} t
+        JOIN files f ON f.id = t.file_id
+        WHERE COALESCE(f.generation, 0) > :since
+        ORDER BY t.id
+    """
+
+
+def _export_table(conn: Connection, out_dir: str, table: str, since: Optional[int], dim: int) -> Dict:
+    columns = TABLE_COLUMNS[table]
+    result = conn.execution_options(stream_results=True, yield_per=ROWS_PER_PART).execute(
+        text(_select_sql(table, since)), {"since": since}
+    )
+    parts = []
+    for batch in result.partitions(ROWS_PER_PART):
+        part_dir = os.path.join(out_dir, table, f"part-{len(parts):05d}")
+        os.makedirs(part_dir, exist_ok=True)
+        for idx, (col, kind) in enumerate(columns):
+            _save_column(part_dir, col, kind, [row[idx] for row in batch], dim)
+        parts.append({"dir": os.path.relpath(part_dir, out_dir), "rows": len(batch)})
+    rows = sum(p["rows"] for p in parts)
+    print(f"[SNAPSHOT] {table}: {rows} rows in {len(parts)} parts")
+    return {"columns": [{"name": col, "kind": kind} for col, kind in columns], "parts": parts, "rows": rows}
+
+
+def _require_pgvector() -> None:
+    if vector_store_config().get("backend", "pgvector") != "pgvector":
+        raise RuntimeError("Snapshots need embeddings in Postgres (storage.vector_store.backend: pgvector)")
+
+
+def _embedding_state(conn: Connection) -> Dict:
+    row = conn.execute(text("SELECT model, dim, generation FROM embedding_state WHERE id = 1")).first()
+    if row is None:
+        from .embedding_service import configured_model_name
+
+        return {"model": configured_model_name(), "dim": settings.embedding_dim, "generation": 1}
+    return {"model": row.model, "dim": row.dim, "generation": row.generation}
+
+
+def export_snapshot(out_dir: str, since: Optional[int] = None, engine: Engine = default_engine) -> Dict:
+    """
+    Write a snapshot of the index to `out_dir` (must not exist or be empty)
+    from one consistent view of the database; returns the manifest.
+    """
+    _require_pgvector()
+    if os.path.isdir(out_dir) and os.listdir(out_dir):
+        raise ValueError(f"Snapshot directory is not empty: {out_dir}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    start = time.time()
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+        state = _embedding_state(conn)
+        generation = conn.execute(text("SELECT COALESCE(MAX(generation), 0) FROM files")).scalar()
+        tables = ["files", "chunks", "symbols"] + (["live_files"] if since is not None else [])
+        manifest = {
+            "format": FORMAT_VERSION,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "model": state["model"],
+            "dim": state["dim"],
+            "embedding_generation": state["generation"],
+            "generation": generation,
+            "since": since,
+            "tables": {table: _export_table(conn, out_dir, table, since, state["dim"]) for table in tables},
+        }
+    manifest["seconds"] = round(time.time() - start, 1)
+    manifest["bytes"] = sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(out_dir) for name in names
+    )
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"[SNAPSHOT] Exported generation {generation} (since {since}) to {out_dir}: "
+          f"{manifest['bytes'] / 1e6:.1f} MB in {manifest['seconds']}s")
+    return manifest
+
+
+# ---------------------------------------------------------------------------
+# Import
+# ---------------------------------------------------------------------------
+
+def _copy_value(value, kind: str) -> str:
+    if value is None:
+        return "\\N"
+    if kind == "vector":
+        return "[" + ",".join("%.9g" % x for x in value) + "]"
+    if kind == "int":
+        return str(value)
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _iter_part_rows(snapshot_dir: str, table_manifest: Dict) -> Iterator[Tuple[List[Tuple[str, str]], List[tuple]]]:
+    columns = [(c["name"], c["kind"]) for c in table_manifest["columns"]]
+    for part in table_manifest["parts"]:
+        part_dir = os.path.join(snapshot_dir, part["dir"])
+        values = [_load_column(part_dir, col, kind) for col, kind in columns]
+        yield columns, list(zip(*values))
+
+
+def _copy_rows(cursor, table: str, columns: List[Tuple[str, str]], rows: Iterable[tuple]) -> None:
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(_copy_value(v, kind) for v, (_, kind) in zip(row, columns)))
+        buf.write("\n")
+    buf.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(c for c, _ in columns)}) FROM STDIN", buf)
+
+
+def _check_compatible(conn: Connection, manifest: Dict) -> None:
+    _require_pgvector()
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format')}")
+    column_dim = conn.execute(text("""
+        SELECT atttypmod FROM pg_attribute
+        WHERE attrelid = 'chunks'::regclass AND attname = 'embedding'
+    """)).scalar()
+    if column_dim and column_dim > 0 and column_dim != manifest["dim"]:
+        raise ValueError(
+            f"Snapshot embeddings have dim {manifest['dim']}, chunks.embedding is vector({column_dim})"
+        )
+    if manifest["since"] is not None:
+        state = _embedding_state(conn)
+        if state["model"] != manifest["model"]:
+            raise ValueError(
+                f"Incremental snapshot was embedded with {manifest['model']}, this index uses "
+                f"{state['model']}; import a full snapshot"
+            )
+
+
+def import_snapshot(snapshot_dir: str, engine: Engine = default_engine) -> Dict:
+    """
+    Bulk-load a snapshot with COPY. A full snapshot replaces the index; an
+    incremental one replaces the files it contains and drops files that no
+    longer exist at the source. Vector indexes are (re)built afterwards.
+    """
+    from ..migrations import (
+        FILE_VECTOR_INDEX_NAME, VECTOR_INDEX_NAME, ensure_file_vector_index, ensure_vector_index, run_migrations,
+    )
+
+    with open(os.path.join(snapshot_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    tables = manifest["tables"]
+    incremental = manifest["since"] is not None
+    start = time.time()
+
+    run_migrations(engine)
+    with engine.begin() as conn:
+        _check_compatible(conn, manifest)
+
+    repos = set()
+    for columns, rows in _iter_part_rows(snapshot_dir, tables["files"]):
+        repo_idx = [c for c, _ in columns].index("repo_name")
+        repos.update(row[repo_idx] for row in rows if row[repo_idx])
+    with Session(engine) as db:
+        for repo in sorted(repos):
+            ensure_repo_partition(db, repo)
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if incremental:
+            # Files re-exported (by id or by repo and path) are replaced; symbols have
+            # no foreign key when files is partitioned, so delete them too.
+            cursor.execute("CREATE TEMP TABLE snapshot_files (id integer, repo_name varchar, path varchar) ON COMMIT DROP")
+            for columns, rows in _iter_part_rows(snapshot_dir, tables["files"]):
+                names = [c for c, _ in columns]
+                picked = [(r[names.index("id")], r[names.index("repo_name")], r[names.index("path")]) for r in rows]
+                _copy_rows(cursor, "snapshot_files", [("id", "int"), ("repo_name", "str"), ("path", "str")], picked)
+            cursor.execute("CREATE TEMP TABLE snapshot_live (repo_name varchar, path varchar) ON COMMIT DROP")
+            for columns, rows in _iter_part_rows(snapshot_dir, tables["live_files"]):
+                _copy_rows(cursor, "snapshot_live", columns, rows)
+            cursor.execute("""
+                CREATE TEMP TABLE snapshot_stale ON COMMIT DROP AS
+                SELECT f.id FROM files f
+                WHERE f.id IN (SELECT id FROM snapshot_files)
+                   OR EXISTS (
+                       SELECT 1 FROM snapshot_files s
+                       WHERE s.path = f.path AND s.repo_name IS NOT DISTINCT FROM f.repo_name
+                   )
+                   OR NOT EXISTS (
+                       SELECT 1 FROM snapshot_live l
+                       WHERE l.path = f.path AND l.repo_name IS NOT DISTINCT FROM f.repo_name
+                   )
+            """)
+            cursor.execute("DELETE FROM symbols WHERE file_id IN (SELECT id FROM snapshot_stale)")
+            cursor.execute("DELETE FROM chunks WHERE file_id IN (SELECT id FROM snapshot_stale)")
+            cursor.execute("DELETE FROM files WHERE id IN (SELECT id FROM snapshot_stale)")
+        else:
+            # Loading into unindexed tables and indexing once is much faster
+            # than maintaining HNSW graphs row by row.
+            cursor.execute(f"DROP INDEX IF EXISTS {VECTOR_INDEX_NAME}")
+            cursor.execute(f"DROP INDEX IF EXISTS {FILE_VECTOR_INDEX_NAME}")
+            cursor.execute("TRUNCATE symbols, chunks, files RESTART IDENTITY CASCADE")
+
+        counts = {}
+        for table in ("files", "chunks", "symbols"):
+            counts[table] = 0
+            for columns, rows in _iter_part_rows(snapshot_dir, tables[table]):
+                _copy_rows(cursor, table, columns, rows)
+                counts[table] += len(rows)
+            print(f"[SNAPSHOT] Loaded {counts[table]} {table}")
+
+        for table in ("files", "chunks", "symbols"):
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+            )
+        cursor.execute(
+            "SELECT setval('files_generation_seq', GREATEST(%s, (SELECT COALESCE(MAX(generation), 0) FROM files)) + 1, false)",
+            (manifest["generation"],),
+        )
+        if not incremental:
+            cursor.execute("DELETE FROM embedding_state")
+            cursor.execute(
+                "INSERT INTO embedding_state (id, model, dim, generation, status, processed, total) "
+                "VALUES (1, %s, %s, %s, 'idle', 0, 0)",
+                (manifest["model"], manifest["dim"], manifest["embedding_generation"]),
+            )
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE files"))
+        conn.execute(text("ANALYZE chunks"))
+    ensure_vector_index(engine, build_if_populated=True)
+    ensure_file_vector_index(engine)
+
+    report = {**counts, "generation": manifest["generation"], "seconds": round(time.time() - start, 1)}
+    print(f"[SNAPSHOT] Imported {snapshot_dir}: {report}")
+    return report
@@ -0,0 +1,253 @@
+"""
+Symbol index: definitions extracted at ingestion, for exact identifier and
+path lookups without embedding the query.
+
+Names are matched case-insensitively through a btree on lower(name)
+(exact and prefix) and a trigram index (substring/fuzzy); paths through a
+trigram index on files.path (suffix matches such as "utils/chunking.py").
+"""
+import re
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..config import load_ingestion_config
+from ..models import File, Symbol
+from ..utils.symbols import extract_symbols, has_extractor
+from .chunk_text_service import rebuild_text
+from .vector_store import CHUNK_TEXT_SQL
+
+_cfg = (load_ingestion_config().get("search", {}) or {}).get("symbols", {}) or {}
+ENABLED = bool(_cfg.get("enabled", True))
+# Return only the exact hits, skipping the embedding and vector search, when
+# they are all code definitions named exactly (case included) as queried.
+SHORT_CIRCUIT = bool(_cfg.get("short_circuit", False))
+
+LOOKUP_MODES = ("exact", "prefix", "fuzzy")
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_$][\w$]*(?:(?:\.|::)[A-Za-z_$][\w$]*)*$")
+_PATH = re.compile(r"^[\w.-]+(?:/[\w.-]+)*/?$")
+# "main.py" is a file, "os.path" an identifier.
+_FILE_EXTENSIONS = {
+    ext.lstrip(".").lower()
+    for ext in load_ingestion_config().get("ingestion", {}).get("allowed_extensions", [])
+} | {"py", "md", "txt", "js", "jsx", "ts", "tsx", "json", "yaml", "yml", "toml", "cfg", "ini", "sh"}
+
+# Definitions first, headings and variables after.
+_KIND_RANK = "CASE s.kind WHEN 'class' THEN 0 WHEN 'function' THEN 1 WHEN 'method' THEN 2 ELSE 3 END"
+_DEFINITION_KINDS = {"class", "function", "method"}
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def query_kind(query: str) -> Optional[str]:
+    """"symbol" or "path" if the query is a bare identifier or file path, else None."""
+    query = query.strip()
+    if not _PATH.match(query):
+        return "symbol" if _IDENTIFIER.match(query) else None
+    if "/" in query or query.rsplit(".", 1)[-1].lower() in _FILE_EXTENSIONS:
+        return "path"
+    return "symbol" if _IDENTIFIER.match(query) else None
+
+
+# ---------------------------------------------------------------------------
+# Writes
+# ---------------------------------------------------------------------------
+
+def replace_symbols(db: Session, db_file: File, file_text: str, n_chunks: int, step: int, replace: bool) -> int:
+    """
+    Index the definitions in a file's text; `step` is the chunk stride
+    (max_chars - overlap), so offset // step is the chunk a line starts in.
+    Returns the number of symbols written.
+    """
+    if replace:
+        db.query(Symbol).filter(Symbol.file_id == db_file.id).delete(synchronize_session=False)
+    if not has_extractor(db_file.path):
+        return 0
+    symbols = [s for s in extract_symbols(db_file.path, file_text) if s.offset < len(file_text)]
+    db.bulk_insert_mappings(Symbol, [
+        {
+            "name": s.name,
+            "kind": s.kind,
+            "file_id": db_file.id,
+            "repo_name": db_file.repo_name,
+            "chunk_index": min(s.offset // step, n_chunks - 1),
+            "line": s.line,
+        }
+        for s in symbols
+    ])
+    return len(symbols)
+
+
+def backfill_symbols(db: Session, max_chars: int, overlap: int, batch_files: int = 200) -> Dict:
+    """Extract symbols for already-ingested files from their stored text; safe to re-run."""
+    start = time.time()
+    files = symbols = 0
+    last_id = 0
+    while True:
+        batch = db.execute(
+            text("""
+                SELECT f.id, f.path FROM files f
+                WHERE f.id > :last_id
+                  AND NOT EXISTS (SELECT 1 FROM symbols s WHERE s.file_id = f.id)
+                ORDER BY f.id
+                LIMIT :limit
+            """),
+            {"last_id": last_id, "limit": batch_files},
+        ).fetchall()
+        if not batch:
+            break
+        for row in batch:
+            if not has_extractor(row.path):
+                continue
+            chunks = db.execute(
+                text(f"""
+                    SELECT {CHUNK_TEXT_SQL} AS content FROM chunks c
+                    JOIN files f ON c.file_id = f.id
+                    WHERE c.file_id = :file_id ORDER BY c.chunk_index
+                """),
+                {"file_id": row.id},
+            ).scalars().all()
+            file_text = rebuild_text(chunks, overlap)
+            if file_text is None:
+                continue
+            db_file = db.query(File).filter(File.id == row.id).one()
+            symbols += replace_symbols(db, db_file, file_text, len(chunks), max_chars - overlap, replace=False)
+            files += 1
+        db.commit()
+        db.expunge_all()
+        last_id = batch[-1].id
+        print(f"[MIGRATE] symbols: {files} files, {symbols} symbols")
+    return {"files": files, "symbols": symbols, "seconds": round(time.time() - start, 1)}
+
+
+# ---------------------------------------------------------------------------
+# Lookups
+# ---------------------------------------------------------------------------
+
+def lookup_symbols(
+    db: Session,
+    query: str,
+    mode: str = "exact",
+    kind: Optional[str] = None,
+    repo_name: Optional[str] = None,
+    limit: int = 20,
+) -> List[Dict]:
+    """Symbols by name (case-insensitive) with their file, chunk and line."""
+    name = query.strip()
+    if mode == "exact":
+        # "Class.method" / "mod::fn" resolve on their last segment.
+        name = re.split(r"\.|::", name)[-1]
+        match, order = "lower(s.name) = lower(:name)", _KIND_RANK
+    elif mode == "prefix":
+        match, order = "lower(s.name) LIKE lower(:pattern) || '%'", f"length(s.name), {_KIND_RANK}"
+    elif mode == "fuzzy":
+        match, order = "lower(s.name) % lower(:name)", f"similarity(lower(s.name), lower(:name)) DESC, {_KIND_RANK}"
+    else:
+        raise ValueError(f"Unknown lookup mode: {mode}")
+    filters = [match]
+    if kind:
+        filters.append("s.kind = :kind")
+    if repo_name:
+        filters.append("s.repo_name = :repo_name")
+    rows = db.execute(
+        text(f"""
+            SELECT s.name, s.kind, s.line, s.chunk_index, f.path AS file_path, s.repo_name
+            FROM symbols s
+            JOIN files f ON f.id = s.file_id
+            WHERE {' AND '.join(filters)}
+            ORDER BY {order}, f.path, s.line
+            LIMIT :limit
+        """),
+        {
+            "name": name,
+            "pattern": _like_escape(name),
+            "kind": kind,
+            "repo_name": repo_name,
+            "limit": limit,
+        },
+    ).fetchall()
+    return [dict(row._mapping) for row in rows]
+
+
+def lookup_paths(db: Session, query: str, repo_name: Optional[str] = None, limit: int = 20) -> List[Dict]:
+    """Files whose path is `query` or ends with "/<query>"."""
+    path = query.strip().strip("/")
+    repo_filter = "AND f.repo_name = :repo_name" if repo_name else ""
+    rows = db.execute(
+        text(f"""
+            SELECT f.id, f.path, f.repo_name FROM files f
+            WHERE (f.path = :path OR f.path LIKE '%/' || :pattern) {repo_filter}
+            ORDER BY length(f.path), f.path
+            LIMIT :limit
+        """),
+        {
+            "path": path,
+            "pattern": _like_escape(path),
+            "repo_name": repo_name,
+            "limit": limit,
+        },
+    ).fetchall()
+    return [dict(row._mapping) for row in rows]
+
+
+def _symbol_name(query: str) -> str:
+    return re.split(r"\.|::", query.strip())[-1]
+
+
+def exact_hits(db: Session, query: str, repo_name: Optional[str] = None, limit: int = 5):
+    """
+    Chunk rows (file_path, chunk_index, content, symbol, kind) for an identifier
+    query's definitions or a path query's first chunks, in one indexed
+    lookup; empty for other queries.
+    """
+    kind = query_kind(query)
+    if kind is None:
+        return []
+    repo_filter = "AND {alias}.repo_name = :repo_name" if repo_name else ""
+    if kind == "symbol":
+        sql = f"""
+            SELECT f.path AS file_path, c.chunk_index, {CHUNK_TEXT_SQL} AS content, s.name AS symbol, s.kind
+            FROM symbols s
+            JOIN files f ON f.id = s.file_id
+            JOIN chunks c ON c.file_id = s.file_id AND c.chunk_index = s.chunk_index
+            WHERE lower(s.name) = lower(:name) {repo_filter.format(alias="s")}
+            ORDER BY {_KIND_RANK}, f.path, s.line
+            LIMIT :limit
+        """
+        name = _symbol_name(query)
+    else:
+        sql = f"""
+            SELECT f.path AS file_path, c.chunk_index, {CHUNK_TEXT_SQL} AS content, NULL AS symbol, NULL AS kind
+            FROM files f
+            JOIN chunks c ON c.file_id = f.id AND c.chunk_index = 0
+            WHERE (f.path = :name OR f.path LIKE '%/' || :pattern) {repo_filter.format(alias="f")}
+            ORDER BY length(f.path), f.path
+            LIMIT :limit
+        """
+        name = query.strip().strip("/")
+    return db.execute(
+        text(sql),
+        {
+            "name": name,
+            "pattern": _like_escape(name),
+            "repo_name": repo_name,
+            "limit": limit,
+        },
+    ).fetchall()
+
+
+def answers_alone(query: str, rows) -> bool:
+    """
+    Whether `exact_hits` rows may replace the vector search
+    (search.symbols.short_circuit): code definitions whose name matches the
+    query case-sensitively. Headings, variables and paths only rank first.
+    """
+    name = _symbol_name(query)
+    return SHORT_CIRCUIT and bool(rows) and all(
+        row.kind in _DEFINITION_KINDS and row.symbol == name for row in rows
+    )
@@ -0,0 +1,383 @@
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DataError, OperationalError
+from sqlalchemy.orm import Session
+
+from ..config import load_ingestion_config
+from ..models import Chunk, File
+
+
+class VectorHit(NamedTuple):
+    chunk_id: int
+    file_path: str
+    chunk_index: int
+    content: str
+    distance: float  # L2 distance (not squared), smaller is closer
+
+
+# Reduced ANN effort for searches short on time (search.deadline.low_effort).
+LOW_EFFORT = (
+    (load_ingestion_config().get("search", {}) or {}).get("deadline", {}) or {}
+).get("low_effort", {}) or {}
+
+
+class SearchTimeout(Exception):
+    """A vector search ran past its `timeout_ms` and was cancelled."""
+
+
+class StaleQueryEmbedding(Exception):
+    """The query vector's dimension no longer matches the stored vectors (a re-embedding cut over)."""
+
+
+class VectorStore(ABC):
+    """
+    Where chunk embeddings live and how they are searched.
+
+    Chunk rows (content, file, index) always live in Postgres; a store
+    decides where the embeddings go. Ingestion replaces a file's chunks with
+    `delete_by_file` + `upsert`, then calls `flush` before each commit
+    (or `discard` after a rollback).
+    """
+
+    name: str
+
+    @abstractmethod
+    def upsert(self, db: Session, db_file: File, rows: List[Chunk], embeddings: List[List[float]]) -> None:
+        """Persist new chunk rows for a file along with their embeddings."""
+
+    @abstractmethod
+    def delete_by_file(self, db: Session, file_id: int) -> None:
+        """Remove a file's chunk rows and embeddings."""
+
+    def delete_by_repo(self, db: Session, repo_name: str) -> None:
+        """Remove embeddings held outside Postgres for a repo (chunk rows are dropped separately)."""
+
+    def flush(self, db: Session) -> None:
+        """Push any buffered writes; called before each ingestion commit."""
+
+    def discard(self) -> None:
+        """Drop buffered writes after the Postgres transaction rolled back."""
+
+    @abstractmethod
+    def search(
+        self,
+        db: Session,
+        query_embs: List[List[float]],
+        limit: int,
+        repo_name: Optional[str] = None,
+        top_files: Optional[int] = None,
+        low_effort: bool = False,
+        timeout_ms: Optional[float] = None,
+    ) -> List[List[VectorHit]]:
+        """
+        Nearest chunks for each query vector, closest first. With `top_files`,
+        only chunks of the query's `top_files` nearest files (by
+        files.embedding) are ranked. `low_effort` searches the ANN index with
+        the smaller LOW_EFFORT parameters (faster, lower recall); past
+        `timeout_ms` the search is cancelled with SearchTimeout.
+        """
+
+    @abstractmethod
+    def stats(self, db: Session) -> Dict:
+        """Row counts and storage details for monitoring."""
+
+
+# A chunk's text in either storage mode; substr on a compressed TOAST value
+# only decompresses up to the end of the slice.
+CHUNK_TEXT_SQL = "COALESCE(c.content, substr(f.content, c.start_offset + 1, c.end_offset - c.start_offset))"
+
+
+def vector_literal(embedding: List[float]) -> str:
+    """Convert an embedding to a pgvector literal."""
+    return f"[{','.join(str(x) for x in embedding)}]"
+
+
+def _repo_filter(repo_name: Optional[str]) -> str:
+    # Filtering both tables on the partition key lets Postgres prune to the
+    # repo's partitions when per-repo partitioning is enabled.
+    if repo_name is None:
+        return ""
+    return "WHERE c.repo_name = :repo_name AND f.repo_name = :repo_name"
+
+
+class PgVectorStore(VectorStore):
+    """Embeddings in chunks.embedding, searched with pgvector's `<->`."""
+
+    name = "pgvector"
+
+    def upsert(self, db: Session, db_file: File, rows: List[Chunk], embeddings: List[List[float]]) -> None:
+        for row, emb in zip(rows, embeddings):
+            row.embedding = emb
+        db.add_all(rows)
+        db.flush()
+
+    def delete_by_file(self, db: Session, file_id: int) -> None:
+        db.query(Chunk).filter(Chunk.file_id == file_id).delete()
+
+    def search(
+        self,
+        db: Session,
+        query_embs: List[List[float]],
+        limit: int,
+        repo_name: Optional[str] = None,
+        top_files: Optional[int] = None,
+        low_effort: bool = False,
+        timeout_ms: Optional[float] = None,
+    ) -> List[List[VectorHit]]:
+        # SET LOCAL lasts until the end of the request's transaction.
+        if low_effort:
+            # An HNSW scan returns at most ef_search rows.
+            ef_search = max(int(LOW_EFFORT.get("ef_search", 20)), limit)
+            db.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+            db.execute(text(f"SET LOCAL ivfflat.probes = {int(LOW_EFFORT.get('probes', 1))}"))
+        if timeout_ms is not None:
+            db.execute(text(f"SET LOCAL statement_timeout = {max(int(timeout_ms), 1)}"))
+        try:
+            rows = self._search_rows(db, query_embs, limit, repo_name, top_files)
+        except OperationalError as e:
+            if timeout_ms is None or getattr(e.orig, "pgcode", None) != "57014":  # query_canceled
+                raise
+            db.rollback()
+            raise SearchTimeout(f"vector search exceeded {timeout_ms:.0f} ms") from e
+        except DataError as e:
+            if "different vector dimensions" not in str(e.orig):
+                raise
+            db.rollback()
+            raise StaleQueryEmbedding(str(e.orig)) from e
+        if timeout_ms is not None:
+            db.execute(text("SET LOCAL statement_timeout = DEFAULT"))
+        return _group_hits(rows, len(query_embs))
+
+    def _search_rows(
+        self,
+        db: Session,
+        query_embs: List[List[float]],
+        limit: int,
+        repo_name: Optional[str],
+        top_files: Optional[int],
+    ):
+        if top_files:
+            rows = self._search_files_first(db, query_embs, limit, repo_name, top_files)
+        elif len(query_embs) == 1:
+            rows = db.execute(
+                text(f"""
+                    SELECT
+                        1 AS query_index,
+                        c.id AS chunk_id,
+                        f.path AS file_path,
+                        c.chunk_index AS chunk_index,
+                        {CHUNK_TEXT_SQL} AS content,
+                        c.embedding <-> (:query_emb)::vector AS distance
+                    FROM chunks c
+                    JOIN files f ON c.file_id = f.id
+                    {_repo_filter(repo_name)}
+                    ORDER BY distance ASC
+                    LIMIT :limit
+                """),
+                {"query_emb": vector_literal(query_embs[0]), "limit": limit, "repo_name": repo_name},
+            ).fetchall()
+        else:
+            # One round trip for many queries: a LATERAL top-k per query vector.
+            rows = db.execute(
+                text(f"""
+                    SELECT
+                        q.ord AS query_index,
+                        r.chunk_id,
+                        r.file_path,
+                        r.chunk_index,
+                        r.content,
+                        r.distance
+                    FROM unnest(CAST(:query_embs AS vector[])) WITH ORDINALITY AS q(emb, ord)
+                    CROSS JOIN LATERAL (
+                        SELECT
+                            c.id AS chunk_id,
+                            f.path AS file_path,
+                            c.chunk_index AS chunk_index,
+                            {CHUNK_TEXT_SQL} AS content,
+                            c.embedding <-> q.emb AS distance
+                        FROM chunks c
+                        JOIN files f ON c.file_id = f.id
+                        {_repo_filter(repo_name)}
+                        ORDER BY distance ASC
+                        LIMIT :limit
+                    ) r
+                    ORDER BY q.ord, r.distance
+                """),
+                {
+                    "query_embs": [vector_literal(emb) for emb in query_embs],
+                    "limit": limit,
+                    "repo_name": repo_name,
+                },
+            ).fetchall()
+        return rows
+
+    def _search_files_first(
+        self,
+        db: Session,
+        query_embs: List[List[float]],
+        limit: int,
+        repo_name: Optional[str],
+        top_files: int,
+    ):
+        # Stage 1 uses the files index; stage 2 ranks the candidate files'
+        # chunks exactly. The MATERIALIZED CTE keeps the planner from
+        # answering stage 2 with the chunks ANN index plus a filter.
+        file_filter = "WHERE f.embedding IS NOT NULL" + (" AND f.repo_name = :repo_name" if repo_name else "")
+        return db.execute(
+            text(f"""
+                SELECT
+                    q.ord AS query_index,
+                    r.chunk_id,
+                    r.file_path,
+                    r.chunk_index,
+                    r.content,
+                    r.distance
+                FROM unnest(CAST(:query_embs AS vector[])) WITH ORDINALITY AS q(emb, ord)
+                CROSS JOIN LATERAL (
+                    WITH top_files AS (
+                        SELECT f.id, f.path
+                        FROM files f
+                        {file_filter}
+                        ORDER BY f.embedding <-> q.emb
+                        LIMIT :top_files
+                    ),
+                    candidates AS MATERIALIZED (
+                        SELECT
+                            c.id AS chunk_id,
+                            tf.path AS file_path,
+                            c.chunk_index AS chunk_index,
+                            c.file_id,
+                            c.embedding <-> q.emb AS distance
+                        FROM chunks c
+                        JOIN top_files tf ON c.file_id = tf.id
+                    )
+                    SELECT
+                        cand.chunk_id,
+                        cand.file_path,
+                        cand.chunk_index,
+                        {CHUNK_TEXT_SQL} AS content,
+                        cand.distance
+                    FROM (SELECT * FROM candidates ORDER BY distance LIMIT :limit) cand
+                    JOIN chunks c ON c.id = cand.chunk_id
+                    JOIN files f ON f.id = cand.file_id
+                ) r
+                ORDER BY q.ord, r.distance
+            """),
+            {
+                "query_embs": [vector_literal(emb) for emb in query_embs],
+                "limit": limit,
+                "repo_name": repo_name,
+                "top_files": top_files,
+            },
+        ).fetchall()
+
+    def stats(self, db: Session) -> Dict:
+        row = db.execute(text("""
+            SELECT
+                COUNT(*) AS chunks,
+                COUNT(embedding) AS embedded_chunks,
+                pg_total_relation_size('chunks') AS total_bytes
+            FROM chunks
+        """)).first()
+        indexes = db.execute(text("""
+            SELECT indexname, indexdef FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = 'chunks'
+              AND (indexdef ILIKE '%USING hnsw%' OR indexdef ILIKE '%USING ivfflat%')
+        """)).fetchall()
+        return {
+            "backend": self.name,
+            "chunks": row.chunks,
+            "embedded_chunks": row.embedded_chunks,
+            "total_bytes": row.total_bytes,
+            "vector_indexes": [dict(r._mapping) for r in indexes],
+        }
+
+
+def _group_hits(rows, n_queries: int) -> List[List[VectorHit]]:
+    hits: List[List[VectorHit]] = [[] for _ in range(n_queries)]
+    for row in rows:
+        hits[row.query_index - 1].append(
+            VectorHit(row.chunk_id, row.file_path, row.chunk_index, row.content, float(row.distance))
+        )
+    return hits
+
+
+def top_file_ids(
+    db: Session,
+    query_embs: List[List[float]],
+    top_files: int,
+    repo_name: Optional[str] = None,
+) -> List[List[int]]:
+    """Ids of the `top_files` nearest files (by files.embedding) for each query."""
+    repo_clause = "AND f.repo_name = :repo_name" if repo_name else ""
+    rows = db.execute(
+        text(f"""
+            SELECT q.ord AS query_index, t.id
+            FROM unnest(CAST(:query_embs AS vector[])) WITH ORDINALITY AS q(emb, ord)
+            CROSS JOIN LATERAL (
+                SELECT f.id FROM files f
+                WHERE f.embedding IS NOT NULL {repo_clause}
+                ORDER BY f.embedding <-> q.emb
+                LIMIT :top_files
+            ) t
+        """),
+        {
+            "query_embs": [vector_literal(emb) for emb in query_embs],
+            "top_files": top_files,
+            "repo_name": repo_name,
+        },
+    ).fetchall()
+    ids: List[List[int]] = [[] for _ in query_embs]
+    for row in rows:
+        ids[row.query_index - 1].append(row.id)
+    return ids
+
+
+def hydrate_hits(db: Session, ids_and_distances: List[List[tuple]]) -> List[List[VectorHit]]:
+    """
+    Attach file path and content to (chunk_id, distance) pairs from an
+    external store with one query. Ids no longer in Postgres are dropped.
+    """
+    all_ids = sorted({chunk_id for hits in ids_and_distances for chunk_id, _ in hits})
+    if not all_ids:
+        return [[] for _ in ids_and_distances]
+    rows = db.execute(
+        text(f"""
+            SELECT c.id, f.path AS file_path, c.chunk_index, {CHUNK_TEXT_SQL} AS content
+            FROM chunks c
+            JOIN files f ON c.file_id = f.id
+            WHERE c.id = ANY(:ids)
+        """),
+        {"ids": all_ids},
+    ).fetchall()
+    by_id = {row.id: row for row in rows}
+    return [
+        [
+            VectorHit(chunk_id, by_id[chunk_id].file_path, by_id[chunk_id].chunk_index,
+                      by_id[chunk_id].content, distance)
+            for chunk_id, distance in hits
+            if chunk_id in by_id
+        ]
+        for hits in ids_and_distances
+    ]
+
+
+def vector_store_config() -> Dict:
+    return (load_ingestion_config().get("storage", {}) or {}).get("vector_store", {}) or {}
+
+
+@lru_cache(maxsize=1)
+def get_vector_store() -> VectorStore:
+    """The configured store (storage.vector_store.backend), one per process."""
+    cfg = vector_store_config()
+    backend = cfg.get("backend", "pgvector")
+    if backend == "pgvector":
+        return PgVectorStore()
+    if backend == "milvus":
+        from .milvus_service import MilvusVectorStore
+
+        return MilvusVectorStore(cfg.get("milvus", {}) or {})
+    raise ValueError(f"Unknown vector store backend: {backend}")
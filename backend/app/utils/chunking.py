@@ -1,4 +1,4 @@
-from typing import List
+from typing import Iterable, Iterator, List
 
 
 def simple_chunk_text(text: str, max_chars: int = 1000, overlap: int = 200) -> List[str]:
@@ -16,3 +16,23 @@ def simple_chunk_text(text: str, max_chars: int = 1000, overlap: int = 200) -> L
         start = end - overlap
 
     return chunks
+
+
+def stream_chunk_text(pieces: Iterable[str], max_chars: int = 1000, overlap: int = 200) -> Iterator[str]:
+    """
+    `simple_chunk_text` over text that arrives in pieces; yields the same
+    chunks while holding at most one chunk plus one piece in memory.
+    """
+    buf = ""
+    start = 0
+    for piece in pieces:
+        # Drop the consumed prefix once per piece rather than per chunk.
+        buf = buf[start:] + piece
+        start = 0
+        # Only emit once more text follows the window, so the final chunk
+        # is still produced by the tail case below, as in simple_chunk_text.
+        while len(buf) - start > max_chars:
+            yield buf[start:start + max_chars]
+            start += max_chars - overlap
+    if len(buf) > start:
+        yield buf[start:]
@@ -0,0 +1,32 @@
+import time
+from typing import List, Optional
+
+
+class Deadline:
+    """
+    A request's latency budget. Stages ask how much time is left and record
+    the degradations they applied to stay within it (reported in the response).
+    """
+
+    def __init__(self, budget_ms: float) -> None:
+        self.budget_ms = float(budget_ms)
+        self._expires = time.monotonic() + self.budget_ms / 1000.0
+        self.degradations: List[str] = []
+
+    def remaining_ms(self) -> float:
+        return max((self._expires - time.monotonic()) * 1000.0, 0.0)
+
+    def remaining_seconds(self) -> float:
+        return self.remaining_ms() / 1000.0
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self._expires
+
+    def degrade(self, name: str) -> None:
+        if name not in self.degradations:
+            self.degradations.append(name)
+
+
+def start_deadline(deadline_ms: Optional[int]) -> Optional[Deadline]:
+    return Deadline(deadline_ms) if deadline_ms else None
@@ -0,0 +1,55 @@
+import codecs
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional, Union
+
+Buffer = Union[bytes, mmap.mmap]
+
+# Bytes 0x00-0x1f other than tab, newline, form feed and carriage return.
+_CONTROL_BYTES = bytes(b for b in range(32) if b not in (9, 10, 12, 13))
+
+
+@contextmanager
+def file_bytes(path: str, mmap_threshold: int) -> Iterator[Buffer]:
+    """
+    A file's contents as one buffer, read once.
+
+    Files of at least `mmap_threshold` bytes are memory-mapped: their pages
+    are file-backed and evictable, so hashing and decoding them does not
+    grow the process heap the way a full read() would.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0 or size < mmap_threshold:
+            yield f.read()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def sniff_content(prefix: bytes, minified_avg_line_chars: int) -> Optional[str]:
+    """
+    Classify a file from its first bytes: "binary", "minified" or None for
+    text. `minified_avg_line_chars` of 0 skips the minified check (for
+    files whose type or size rules it out).
+    """
+    if not prefix:
+        return None
+    if b"\x00" in prefix:
+        return "binary"
+    if len(prefix.translate(None, _CONTROL_BYTES)) < len(prefix) * 0.9:
+        return "binary"
+    if minified_avg_line_chars and len(prefix) / (prefix.count(b"\n") + 1) > minified_avg_line_chars:
+        return "minified"
+    return None
+
+
+def iter_decoded(data: Buffer, block_size: int = 1 << 20) -> Iterator[str]:
+    """Decode UTF-8 (dropping invalid bytes) block by block."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    for start in range(0, len(data), block_size):
+        yield decoder.decode(data[start:start + block_size])
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
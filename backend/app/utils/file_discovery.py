@@ -0,0 +1,106 @@
+import os
+import time
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from pathspec import GitIgnoreSpec
+
+
+@dataclass
+class DiscoveryStats:
+    files_found: int = 0
+    ignored_files: int = 0
+    oversized_files: int = 0
+    pruned_dirs: int = 0
+    seconds: float = 0.0  # time spent walking, excluding the consumer's work
+
+
+def _load_gitignore(dir_path: str) -> Optional[GitIgnoreSpec]:
+    try:
+        with open(os.path.join(dir_path, ".gitignore"), "r", encoding="utf-8", errors="ignore") as f:
+            return GitIgnoreSpec.from_lines(f)
+    except OSError:
+        return None
+
+
+def _gitignored(specs: List[Tuple[str, GitIgnoreSpec]], path: str, is_dir: bool) -> bool:
+    # The deepest .gitignore with a matching pattern decides, as in git.
+    for base, spec in reversed(specs):
+        rel = os.path.relpath(path, base).replace(os.sep, "/")
+        result = spec.check_file(rel + "/" if is_dir else rel)
+        if result.include is not None:
+            return result.include
+    return False
+
+
+def _matches_any(name: str, rel_path: str, globs: Iterable[str]) -> bool:
+    return any(fnmatch(name, g) or fnmatch(rel_path, g) for g in globs)
+
+
+def iter_files(
+    root_path: str,
+    allowed_extensions: Iterable[str],
+    ignore_globs: Iterable[str] = (),
+    respect_gitignore: bool = True,
+    max_file_bytes: int = 0,
+    stats: Optional[DiscoveryStats] = None,
+) -> Iterator[str]:
+    """
+    Yield ingestible files under `root_path` as they are found.
+
+    Walks with os.scandir and never descends into directories matched by
+    `ignore_globs` (against the name or the root-relative path) or by any
+    .gitignore from the root down. Symlinks are not followed. Files larger
+    than `max_file_bytes` (0 = no limit) are skipped and counted in `stats`.
+    """
+    allowed = {ext.lower() for ext in allowed_extensions}
+    globs = list(ignore_globs)
+    stats = stats if stats is not None else DiscoveryStats()
+
+    started = time.perf_counter()
+    # (directory, .gitignore specs that apply to it)
+    stack: List[Tuple[str, List[Tuple[str, GitIgnoreSpec]]]] = [(root_path, [])]
+    while stack:
+        dir_path, specs = stack.pop()
+        if respect_gitignore:
+            spec = _load_gitignore(dir_path)
+            if spec is not None:
+                specs = specs + [(dir_path, spec)]
+
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            print(f"[WARN] Cannot list directory: {dir_path} ({e})")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            rel = os.path.relpath(entry.path, root_path).replace(os.sep, "/")
+            if entry.is_dir(follow_symlinks=False):
+                if _matches_any(entry.name, rel, globs) or (specs and _gitignored(specs, entry.path, True)):
+                    stats.pruned_dirs += 1
+                else:
+                    subdirs.append(entry.path)
+                continue
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            if os.path.splitext(entry.name)[1].lower() not in allowed:
+                continue
+            if _matches_any(entry.name, rel, globs) or (specs and _gitignored(specs, entry.path, False)):
+                stats.ignored_files += 1
+                continue
+            if max_file_bytes and entry.stat(follow_symlinks=False).st_size > max_file_bytes:
+                stats.oversized_files += 1
+                continue
+
+            stats.files_found += 1
+            stats.seconds += time.perf_counter() - started
+            yield entry.path
+            started = time.perf_counter()
+
+        # Reversed so directories are visited in name order.
+        stack.extend((path, specs) for path in reversed(subdirs))
+
+    stats.seconds += time.perf_counter() - started
@@ -0,0 +1,64 @@
+import hashlib
+import re
+import zlib
+from typing import Iterable, List
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+# Permutations are (a*x + b) mod p over 32-bit shingle hashes; with
+# a, b, x < 2**32 the products fit in uint64 without wrapping.
+_PRIME = np.uint64((1 << 32) - 5)
+_BLOCK = 4096
+
+
+def shingle_hashes(texts: Iterable[str], size: int) -> np.ndarray:
+    """Distinct crc32 hashes of every `size`-token window in the texts."""
+    hashes = set()
+    for text in texts:
+        tokens = _TOKEN.findall(text)
+        for i in range(max(len(tokens) - size + 1, 1)):
+            hashes.add(zlib.crc32(" ".join(tokens[i:i + size]).encode("utf-8")))
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+class MinHasher:
+    """
+    MinHash signatures whose agreement estimates the Jaccard similarity of
+    two texts' shingle sets. The fixed seed keeps signatures comparable
+    across processes and runs.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_tokens: int = 5, seed: int = 1) -> None:
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_tokens = shingle_tokens
+        self._a = rng.integers(1, int(_PRIME), num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), num_perm, dtype=np.uint64)
+
+    def signature(self, texts: Iterable[str]) -> np.ndarray:
+        hashes = shingle_hashes(texts, self.shingle_tokens)
+        sig = np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint64)
+        for start in range(0, len(hashes), _BLOCK):
+            block = hashes[start:start + _BLOCK, None]
+            np.minimum(sig, ((block * self._a + self._b) % _PRIME).min(axis=0), out=sig)
+        return sig.astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures (0.0 if their sizes differ)."""
+    if a.shape != b.shape:
+        return 0.0
+    return float(np.mean(a == b))
+
+
+def band_buckets(sig: np.ndarray, bands: int) -> List[int]:
+    """
+    One signed 64-bit bucket per band of rows. Texts sharing any bucket are
+    LSH candidates; with r = len(sig) / bands rows per band, pairs above a
+    similarity of about (1 / bands) ** (1 / r) are likely to share one.
+    """
+    return [
+        int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), "big", signed=True)
+        for band in np.array_split(sig, bands)
+    ]
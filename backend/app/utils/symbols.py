@@ -0,0 +1,129 @@
+import ast
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List
+
+
+@dataclass
+class Symbol:
+    name: str
+    kind: str    # function | class | method | variable | interface | type | enum | heading
+    line: int    # 1-based
+    offset: int  # character offset of the line's first character
+
+
+# ---------------------------------------------------------------------------
+# Python
+# ---------------------------------------------------------------------------
+
+def _assigned_names(node: ast.stmt) -> Iterator[str]:
+    targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+    for target in targets:
+        if isinstance(target, ast.Name):
+            yield target.id
+
+
+def _python(text: str) -> Iterator[tuple]:
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return
+
+    def visit(body: List[ast.stmt], in_class: bool) -> Iterator[tuple]:
+        for node in body:
+            if isinstance(node, ast.ClassDef):
+                yield node.name, "class", node.lineno
+                yield from visit(node.body, in_class=True)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                yield node.name, "method" if in_class else "function", node.lineno
+                yield from visit(node.body, in_class=False)
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                for name in _assigned_names(node):
+                    yield name, "variable", node.lineno
+
+    yield from visit(tree.body, in_class=False)
+
+
+# ---------------------------------------------------------------------------
+# JavaScript / TypeScript (line-based; no parser dependency)
+# ---------------------------------------------------------------------------
+
+_IDENT = r"([A-Za-z_$][\w$]*)"
+_JS_PATTERNS = [
+    ("function", re.compile(rf"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*{_IDENT}")),
+    ("class", re.compile(rf"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+{_IDENT}")),
+    ("interface", re.compile(rf"^\s*(?:export\s+)?(?:declare\s+)?interface\s+{_IDENT}")),
+    ("type", re.compile(rf"^\s*(?:export\s+)?(?:declare\s+)?type\s+{_IDENT}\s*[=<]")),
+    ("enum", re.compile(rf"^\s*(?:export\s+)?(?:declare\s+)?(?:const\s+)?enum\s+{_IDENT}")),
+    ("variable", re.compile(rf"^\s*(?:export\s+)?(?:const|let|var)\s+{_IDENT}\s*(?::[^=]+)?=(.*)")),
+    ("method", re.compile(
+        rf"^\s+(?:(?:public|private|protected|static|async|readonly|override|get|set)\s+)*{_IDENT}"
+        r"\s*(?:<[^>]*>)?\s*\([^;]*\)\s*(?::\s*[^={;]+)?\{\s*$"
+    )),
+]
+_JS_ARROW = re.compile(r"^\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|[\w$]+\s*=>)")
+_JS_KEYWORDS = {"if", "for", "while", "switch", "catch", "return", "function", "constructor", "else", "do", "with"}
+
+
+def _javascript(text: str) -> Iterator[tuple]:
+    for lineno, line in enumerate(text.split("\n"), start=1):
+        for kind, pattern in _JS_PATTERNS:
+            match = pattern.match(line)
+            if match is None:
+                continue
+            name = match.group(1)
+            if name in _JS_KEYWORDS:
+                break
+            if kind == "variable" and _JS_ARROW.match(match.group(2)):
+                kind = "function"
+            yield name, kind, lineno
+            break
+
+
+# ---------------------------------------------------------------------------
+# Markdown
+# ---------------------------------------------------------------------------
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+
+
+def _markdown(text: str) -> Iterator[tuple]:
+    in_fence = False
+    for lineno, line in enumerate(text.split("\n"), start=1):
+        if line.lstrip().startswith(("```", "~~~")):
+            in_fence = not in_fence
+            continue
+        if not in_fence:
+            match = _HEADING.match(line)
+            if match:
+                yield match.group(2), "heading", lineno
+
+
+EXTRACTORS: Dict[str, Callable[[str], Iterator[tuple]]] = {
+    ".py": _python,
+    ".js": _javascript,
+    ".jsx": _javascript,
+    ".mjs": _javascript,
+    ".cjs": _javascript,
+    ".ts": _javascript,
+    ".tsx": _javascript,
+    ".md": _markdown,
+    ".markdown": _markdown,
+}
+
+
+def has_extractor(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in EXTRACTORS
+
+
+def extract_symbols(path: str, text: str) -> List[Symbol]:
+    """Definitions in a file (by extension), with line numbers and offsets."""
+    extractor = EXTRACTORS.get(os.path.splitext(path)[1].lower())
+    if extractor is None or not text:
+        return []
+    line_starts = [0] + [m.end() for m in re.finditer("\n", text)]
+    return [
+        Symbol(name=name[:255], kind=kind, line=line, offset=line_starts[min(line, len(line_starts)) - 1])
+        for name, kind, line in extractor(text)
+    ]
@@ -0,0 +1,65 @@
+import json
+import platform
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean/max of a list of millisecond samples (nearest-rank)."""
+    if not samples_ms:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    ordered = sorted(samples_ms)
+    n = len(ordered)
+
+    def rank(p: float) -> float:
+        idx = max(0, min(n - 1, int(round(p / 100.0 * n + 0.5)) - 1))
+        return round(ordered[idx], 2)
+
+    return {
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "mean": round(sum(ordered) / n, 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        )
+        return result.stdout.strip()
+    except Exception:
+        return None
+
+
+def write_report(path: str, benchmark: str, payload: Dict) -> None:
+    """Write a machine-readable report with enough context to compare runs."""
+    report = {
+        "benchmark": benchmark,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        **payload,
+    }
+    Path(path).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"[BENCH] Wrote {path}")
+
+
+def load_report(path: str) -> Dict:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def print_delta(label: str, current: float, baseline: Optional[float], lower_is_better: bool = True) -> None:
+    if baseline in (None, 0):
+        print(f"  {label}: {current}")
+        return
+    change = (current - baseline) / baseline * 100.0
+    worse = change > 0 if lower_is_better else change < 0
+    flag = "  <-- regression" if worse and abs(change) >= 5.0 else ""
+    print(f"  {label}: {current} (baseline {baseline}, {change:+.1f}%){flag}")
@@ -0,0 +1,179 @@
+"""
+End-to-end load generator for the search API.
+
+Drives `/search`, `/search/rag` and `/search/raw` with a weighted mix at a
+series of concurrency levels and reports throughput, latency percentiles
+and error rates per endpoint. The saturation point is the last level that
+still added meaningful throughput before latency took off.
+
+Pair it with the mock provider so no API quota is spent:
+
+    python -m benchmarks.mock_llm_server --port 8100 &
+    python -m benchmarks.load_test --base-url http://localhost:8000 \\
+        --mix search=2,rag=1,raw=1 --provider mock \\
+        --concurrency 1,4,16,64 --duration 30 --out load_test.json
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+from .common import percentiles, write_report
+
+ENDPOINTS = {"search": "/search", "rag": "/search/rag", "raw": "/search/raw"}
+
+DEFAULT_QUERIES = [
+    "How does authentication work?",
+    "Where is the cache invalidated?",
+    "How do I deploy to Kubernetes?",
+    "What does the OAuth callback do?",
+    "How are chunks embedded during ingestion?",
+    "Which settings control the Redis connection?",
+    "How is retry handled for failed jobs?",
+    "What is the default similarity threshold?",
+]
+
+# A level saturates when it adds < this much throughput over the previous one ...
+SATURATION_GAIN = 0.10
+# ... while p95 latency grows by at least this factor.
+SATURATION_P95_GROWTH = 1.5
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _payload(name: str, query: str, args) -> Dict:
+    if name == "raw":
+        return {"query": query, "provider": args.provider}
+    payload = {"query": query, "top_k": args.top_k, "min_similarity": args.min_similarity}
+    if name == "rag":
+        payload["provider"] = args.provider
+    return payload
+
+
+async def _worker(client: httpx.AsyncClient, mix: Dict[str, float], queries: List[str], deadline: float, args, samples):
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    rng = random.Random()
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        query = rng.choice(queries)
+        start = time.perf_counter()
+        try:
+            res = await client.post(ENDPOINTS[name], json=_payload(name, query, args))
+            outcome = str(res.status_code)
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        samples[name].append((outcome, (time.perf_counter() - start) * 1000.0))
+
+
+async def run_level(concurrency: int, mix: Dict[str, float], queries: List[str], args) -> Dict:
+    samples = defaultdict(list)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(
+            _worker(client, mix, queries, deadline, args, samples) for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    endpoints = {}
+    total = ok_total = 0
+    ok_latencies: List[float] = []
+    for name, rows in samples.items():
+        ok = [ms for outcome, ms in rows if outcome == "200"]
+        outcomes: Dict[str, int] = defaultdict(int)
+        for outcome, _ in rows:
+            outcomes[outcome] += 1
+        endpoints[name] = {
+            "requests": len(rows),
+            "throughput_rps": round(len(ok) / elapsed, 2),
+            "error_rate": round(1 - len(ok) / len(rows), 4) if rows else 0.0,
+            "outcomes": dict(outcomes),
+            "latency_ms": percentiles(ok),
+        }
+        total += len(rows)
+        ok_total += len(ok)
+        ok_latencies.extend(ok)
+
+    level = {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(ok_total / elapsed, 2),
+        "error_rate": round(1 - ok_total / total, 4) if total else 0.0,
+        "latency_ms": percentiles(ok_latencies),
+        "endpoints": endpoints,
+    }
+    print(
+        f"[LOAD] c={concurrency}: {level['throughput_rps']} rps, "
+        f"p95={level['latency_ms']['p95']}ms, errors={level['error_rate']:.2%}"
+    )
+    return level
+
+
+def find_saturation(levels: List[Dict]):
+    for prev, cur in zip(levels, levels[1:]):
+        prev_rps, cur_rps = prev["throughput_rps"], cur["throughput_rps"]
+        gain = (cur_rps - prev_rps) / prev_rps if prev_rps else 0.0
+        prev_p95 = prev["latency_ms"]["p95"] or 1e-9
+        if gain < SATURATION_GAIN and cur["latency_ms"]["p95"] / prev_p95 >= SATURATION_P95_GROWTH:
+            return prev["concurrency"]
+    return None
+
+
+async def _main(args) -> None:
+    mix = parse_mix(args.mix)
+    queries = DEFAULT_QUERIES
+    if args.queries_file:
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    levels = []
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        levels.append(await run_level(concurrency, mix, queries, args))
+        if args.cooldown:
+            await asyncio.sleep(args.cooldown)
+
+    saturation = find_saturation(levels)
+    print(f"[LOAD] Saturation concurrency: {saturation if saturation is not None else 'not reached'}")
+    write_report(args.out, "load", {
+        "base_url": args.base_url,
+        "mix": mix,
+        "provider": args.provider,
+        "duration_s": args.duration,
+        "levels": levels,
+        "saturation_concurrency": saturation,
+    })
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--mix", default="search=2,rag=1,raw=1", help="Endpoint weights")
+    parser.add_argument("--provider", default="mock")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated levels")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per level")
+    parser.add_argument("--cooldown", type=float, default=2.0, help="Pause between levels")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--min-similarity", type=float, default=0.0)
+    parser.add_argument("--queries-file", help="One query per line")
+    parser.add_argument("--out", default="load_test.json")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Local OpenAI-compatible stand-in for load testing `/search/rag` and
+`/search/raw` without spending provider quota.
+
+Implements `POST /v1/chat/completions` (streaming and non-streaming) and
+`GET /v1/models` with configurable time-to-first-token, token rate,
+response length and error injection.
+
+Usage (from backend/):
+
+    python -m benchmarks.mock_llm_server --port 8100 --ttft-ms 300 \\
+        --tokens-per-sec 80 --tokens 250 --error-rate 0.01
+
+Then select it with `"provider": "mock"` (base URL from MOCK_LLM_BASE_URL,
+default http://localhost:8100/v1), or route an existing provider to it via
+`llm.providers` in ingestion_config.yaml. Settings can also be changed at
+runtime with `POST /control` and the same field names as the CLI flags.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SETTINGS = {
+    "ttft_ms": 300.0,
+    "jitter_ms": 50.0,
+    "tokens_per_sec": 80.0,
+    "tokens": 250,
+    "error_rate": 0.0,
+    "error_status": 500,
+}
+
+STATS = {"requests": 0, "errors_injected": 0, "streams": 0}
+
+FILLER = (
+    "The retrieved context shows the handler validates the token, looks up the "
+    "session in the cache and falls back to the database on a miss. "
+).split()
+
+app = FastAPI(title="Mock LLM")
+
+
+def _tokens(n: int):
+    for i in range(n):
+        yield FILLER[i % len(FILLER)] + " "
+
+
+def _ttft_seconds() -> float:
+    jitter = random.uniform(-SETTINGS["jitter_ms"], SETTINGS["jitter_ms"])
+    return max(0.0, SETTINGS["ttft_ms"] + jitter) / 1000.0
+
+
+def _error_response():
+    STATS["errors_injected"] += 1
+    status = int(SETTINGS["error_status"])
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"message": "Injected mock failure", "type": "server_error", "code": status}},
+    )
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+async def _stream(completion_id: str, model: str, n_tokens: int):
+    interval = 1.0 / SETTINGS["tokens_per_sec"] if SETTINGS["tokens_per_sec"] > 0 else 0.0
+    await asyncio.sleep(_ttft_seconds())
+    yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+    for token in _tokens(n_tokens):
+        yield _chunk(completion_id, model, {"content": token})
+        if interval:
+            await asyncio.sleep(interval)
+    yield _chunk(completion_id, model, {}, finish_reason="stop")
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    STATS["requests"] += 1
+    if random.random() < SETTINGS["error_rate"]:
+        return _error_response()
+
+    model = body.get("model", "mock-llm")
+    n_tokens = int(body.get("max_tokens") or SETTINGS["tokens"])
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+    if body.get("stream"):
+        STATS["streams"] += 1
+        return StreamingResponse(_stream(completion_id, model, n_tokens), media_type="text/event-stream")
+
+    generation = n_tokens / SETTINGS["tokens_per_sec"] if SETTINGS["tokens_per_sec"] > 0 else 0.0
+    await asyncio.sleep(_ttft_seconds() + generation)
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "".join(_tokens(n_tokens)).strip()},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": n_tokens,
+            "total_tokens": prompt_tokens + n_tokens,
+        },
+    }
+
+
+@app.get("/v1/models")
+def list_models():
+    return {"object": "list", "data": [{"id": "mock-llm", "object": "model", "owned_by": "local"}]}
+
+
+@app.get("/control")
+def get_control():
+    return {"settings": SETTINGS, "stats": STATS}
+
+
+@app.post("/control")
+async def set_control(request: Request):
+    updates = await request.json()
+    for key, value in updates.items():
+        if key in SETTINGS:
+            SETTINGS[key] = type(SETTINGS[key])(value)
+    return {"settings": SETTINGS}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ttft-ms", type=float, default=SETTINGS["ttft_ms"])
+    parser.add_argument("--jitter-ms", type=float, default=SETTINGS["jitter_ms"])
+    parser.add_argument("--tokens-per-sec", type=float, default=SETTINGS["tokens_per_sec"])
+    parser.add_argument("--tokens", type=int, default=SETTINGS["tokens"])
+    parser.add_argument("--error-rate", type=float, default=SETTINGS["error_rate"])
+    parser.add_argument("--error-status", type=int, default=SETTINGS["error_status"])
+    args = parser.parse_args()
+
+    for key in SETTINGS:
+        SETTINGS[key] = getattr(args, key)
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()